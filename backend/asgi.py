@@ -0,0 +1,489 @@
+"""
+ASGI entry point for the backend.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 8080
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:application
+
+The Flask app from main.py still handles every route, but requests are split into two lanes:
+
+- LLM routes (the Genkit flow endpoints) are admitted through a global and a per-flow
+  asyncio semaphore. Admitted requests run on their own thread pool, so model calls
+  proceed concurrently. Each request has a timeout, and a request is cancelled when the
+  client disconnects.
+- The live feed (/stream/<domain>) is served on the event loop itself. An idle Server-Sent
+  Events connection is a suspended coroutine, not a parked thread, so a worker can hold
+  thousands of them. A client that does not accept writes for LIVE_FEED_SEND_TIMEOUT
+  seconds is disconnected.
+- A2A long polls (GET /a2a/receive) also wait on the event loop, so an agent waiting for
+  messages does not hold a thread either.
+- Everything else, /ingest included, runs on a separate thread pool and never waits
+  behind model calls. Request bodies are streamed through to Flask, so NDJSON/CSV
+  ingestion keeps its constant memory use.
+
+genkit.generate is a blocking call, so a model call that is already running cannot be
+interrupted. On timeout or disconnect the client gets its answer (504, or nothing)
+immediately. The call finishes in the background, where its result still fills the LLM
+response cache, and it keeps its concurrency slot until then.
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from main import app as flask_app
+from services.live_feed import subscribe, FeedFullError
+from services.a2a_broker import get_broker
+from protocols.a2a import parse_receive_args
+from services.metrics import Counter, Gauge
+
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 32))
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 16))
+LLM_FLOW_CONCURRENCY = int(os.environ.get('LLM_FLOW_CONCURRENCY', 8))
+# Per-flow overrides, e.g. "summarizeRecordsFlow=2,defineDataDomainFlow=4"
+LLM_FLOW_LIMITS = os.environ.get('LLM_FLOW_LIMITS', '')
+LLM_REQUEST_TIMEOUT = float(os.environ.get('LLM_REQUEST_TIMEOUT', 120))
+LLM_QUEUE_TIMEOUT = float(os.environ.get('LLM_QUEUE_TIMEOUT', 10))
+REQUEST_BODY_BUFFER_BYTES = int(os.environ.get('REQUEST_BODY_BUFFER_BYTES', 1024 * 1024))
+LIVE_FEED_SEND_TIMEOUT = float(os.environ.get('LIVE_FEED_SEND_TIMEOUT', 30))
+
+# Routes whose handlers wait on the model, and the flow each one runs
+LLM_ROUTES = {
+    '/define-data-domain': 'defineDataDomainFlow',
+    '/extract-api-metadata': 'extractApiMetadataFlow',
+    '/generate-transformation-script': 'generateTransformationScriptFlow',
+    '/summarize-record': 'summarizeRecordFlow',
+    '/summarize-records': 'summarizeRecordsFlow',
+}
+
+LLM_REQUESTS_REJECTED = Counter(
+    'citypulse_llm_requests_rejected_total', 'LLM route requests that were not answered by the flow.', ('flow', 'reason')
+)
+LIVE_FEED_DISCONNECTS = Counter(
+    'citypulse_live_feed_disconnects_total', 'Live feed connections closed, by who closed them.', ('reason',)
+)
+
+
+def parse_flow_limits(spec: str) -> Dict[str, int]:
+    limits = {}
+    for part in spec.split(','):
+        name, _, value = part.partition('=')
+        if name.strip() and value.strip():
+            limits[name.strip()] = int(value)
+    return limits
+
+
+class LLMGate:
+    """
+    Admission control for LLM routes: a request needs a slot in its flow's semaphore and
+    in the global one. Slots are released when the flow's thread finishes, not when the
+    client stops waiting, so the limits hold even for timed-out calls.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, flow_concurrency: int = LLM_FLOW_CONCURRENCY,
+                 flow_limits: Optional[Dict[str, int]] = None):
+        self.max_concurrency = max_concurrency
+        self.flow_concurrency = flow_concurrency
+        self.flow_limits = flow_limits or {}
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._flows: Dict[str, asyncio.Semaphore] = {}
+        self.in_flight: Dict[str, int] = {}
+        self.waiting: Dict[str, int] = {}
+
+    def _flow_semaphore(self, flow: str) -> asyncio.Semaphore:
+        semaphore = self._flows.get(flow)
+        if semaphore is None:
+            semaphore = self._flows[flow] = asyncio.Semaphore(self.flow_limits.get(flow, self.flow_concurrency))
+        return semaphore
+
+    async def acquire(self, flow: str) -> None:
+        flow_semaphore = self._flow_semaphore(flow)
+        self.waiting[flow] = self.waiting.get(flow, 0) + 1
+        try:
+            await flow_semaphore.acquire()
+            try:
+                await self._global.acquire()
+            except BaseException:
+                flow_semaphore.release()
+                raise
+        finally:
+            self.waiting[flow] -= 1
+        self.in_flight[flow] = self.in_flight.get(flow, 0) + 1
+
+    def release(self, flow: str) -> None:
+        self.in_flight[flow] -= 1
+        self._global.release()
+        self._flows[flow].release()
+
+    def gauge_values(self) -> Dict[Tuple[str, ...], float]:
+        values = {}
+        for flow in self._flows:
+            values[(flow, 'in_flight')] = self.in_flight.get(flow, 0)
+            values[(flow, 'waiting')] = self.waiting.get(flow, 0)
+        return values
+
+
+class _RequestBody(io.RawIOBase):
+    """
+    wsgi.input fed from ASGI receive(). The event loop appends chunks; the WSGI thread reads
+    them. Feeding pauses once REQUEST_BODY_BUFFER_BYTES are unread, so a slow handler applies
+    backpressure to the client instead of buffering the whole upload.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_buffered: int = REQUEST_BODY_BUFFER_BYTES):
+        self._loop = loop
+        self._max_buffered = max_buffered
+        self._chunks: Deque[memoryview] = deque()
+        self._buffered = 0
+        self._eof = False
+        self._cond = threading.Condition()
+        self._space = asyncio.Event()
+        self._space.set()
+
+    # Event loop side
+
+    async def feed(self, chunk: bytes) -> None:
+        await self._space.wait()
+        with self._cond:
+            self._chunks.append(memoryview(chunk))
+            self._buffered += len(chunk)
+            if self._buffered >= self._max_buffered:
+                self._space.clear()
+            self._cond.notify()
+
+    def finish(self) -> None:
+        with self._cond:
+            self._eof = True
+            self._cond.notify_all()
+
+    # WSGI thread side
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        with self._cond:
+            while not self._chunks and not self._eof:
+                self._cond.wait()
+            if not self._chunks:
+                return 0
+            chunk = self._chunks[0]
+            size = min(len(buffer), len(chunk))
+            buffer[:size] = chunk[:size]
+            if size == len(chunk):
+                self._chunks.popleft()
+            else:
+                self._chunks[0] = chunk[size:]
+            self._buffered -= size
+            if self._buffered < self._max_buffered:
+                self._loop.call_soon_threadsafe(self._space.set)
+            return size
+
+
+def build_environ(scope: Dict[str, Any], body: io.BufferedReader) -> Dict[str, Any]:
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        # Lets Werkzeug read bodies sent without Content-Length (chunked uploads)
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+SendFromThread = Callable[[Dict[str, Any]], None]
+
+def run_wsgi(environ: Dict[str, Any], emit: SendFromThread) -> None:
+    """
+    Runs the Flask app for one request on the calling (worker) thread, passing the
+    ASGI response messages to `emit` as the body is produced.
+    """
+    state = {'started': False}
+
+    def start_response(status: str, headers: List[Tuple[str, str]], exc_info=None):
+        if exc_info and state['started']:
+            raise exc_info[1].with_traceback(exc_info[2])
+        state['status'] = int(status.split(' ', 1)[0])
+        state['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        return lambda data: send_body(data)
+
+    def send_body(data: bytes) -> None:
+        if not state['started']:
+            emit({'type': 'http.response.start', 'status': state['status'], 'headers': state['headers']})
+            state['started'] = True
+        if data:
+            emit({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+    result = flask_app.wsgi_app(environ, start_response)
+    try:
+        for data in result:
+            send_body(data)
+        send_body(b'')
+        emit({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+
+def json_body(status: int, payload: Dict[str, Any], headers: Optional[List[Tuple[bytes, bytes]]] = None) -> List[Dict[str, Any]]:
+    body = json.dumps(payload).encode('utf-8')
+    return [
+        {'type': 'http.response.start', 'status': status,
+         'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())] + (headers or [])},
+        {'type': 'http.response.body', 'body': body, 'more_body': False},
+    ]
+
+
+def json_response(status: int, message: str, headers: Optional[List[Tuple[bytes, bytes]]] = None) -> List[Dict[str, Any]]:
+    return json_body(status, {"status": "error", "message": message}, headers)
+
+
+def live_feed_domain(scope: Dict[str, Any]) -> Optional[str]:
+    """
+    The domain of a GET /stream/<domain> request, or None for any other request.
+    """
+    path = scope['path']
+    if scope['method'] != 'GET' or not path.startswith('/stream/'):
+        return None
+    domain = path[len('/stream/'):]
+    return domain if domain and '/' not in domain else None
+
+
+def is_a2a_receive(scope: Dict[str, Any]) -> bool:
+    return scope['method'] == 'GET' and scope['path'] == '/a2a/receive'
+
+
+class Application:
+    """
+    The ASGI callable. One instance per process; executors and the gate are created on
+    the first request so they belong to the serving event loop.
+    """
+
+    def __init__(self):
+        self.gate: Optional[LLMGate] = None
+        self.wsgi_executor: Optional[ThreadPoolExecutor] = None
+        self.llm_executor: Optional[ThreadPoolExecutor] = None
+        Gauge('citypulse_llm_gate', 'LLM route requests running and waiting for a slot.', ('flow', 'state'),
+              callback=lambda: self.gate.gauge_values() if self.gate else {})
+
+    def _ensure_started(self) -> None:
+        if self.gate is None:
+            self.gate = LLMGate(flow_limits=parse_flow_limits(LLM_FLOW_LIMITS))
+            self.wsgi_executor = ThreadPoolExecutor(max_workers=ASGI_WSGI_THREADS, thread_name_prefix='asgi-wsgi')
+            self.llm_executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix='asgi-llm')
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable[[], Awaitable[Dict[str, Any]]],
+                       send: Callable[[Dict[str, Any]], Awaitable[None]]) -> None:
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        self._ensure_started()
+        flow = LLM_ROUTES.get(scope['path'])
+        feed_domain = live_feed_domain(scope)
+        if flow and scope['method'] == 'POST':
+            await self._llm_request(scope, receive, send, flow)
+        elif feed_domain:
+            await self._feed_request(scope, receive, send, feed_domain)
+        elif is_a2a_receive(scope):
+            await self._a2a_receive_request(scope, receive, send)
+        else:
+            await self._wsgi_request(scope, receive, send)
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._ensure_started()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for executor in (self.wsgi_executor, self.llm_executor):
+                    if executor is not None:
+                        executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _pump_body(self, receive, body: _RequestBody, disconnected: asyncio.Event) -> None:
+        """
+        Moves the request body into `body`, then keeps listening so a client disconnect is noticed.
+        """
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    disconnected.set()
+                    return
+                if message['type'] == 'http.request':
+                    chunk = message.get('body', b'')
+                    if chunk:
+                        await body.feed(chunk)
+                    if not message.get('more_body', False):
+                        break
+            body.finish()
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+        finally:
+            body.finish()
+
+    async def _wsgi_request(self, scope, receive, send) -> None:
+        # Response messages are sent as the handler produces them; the handler thread
+        # waits for each send, so streaming responses follow the client's pace.
+        loop = asyncio.get_running_loop()
+        body = _RequestBody(loop)
+        disconnected = asyncio.Event()
+        pump = asyncio.create_task(self._pump_body(receive, body, disconnected))
+        environ = build_environ(scope, io.BufferedReader(body))
+
+        def emit(message: Dict[str, Any]) -> None:
+            if disconnected.is_set():
+                raise ConnectionResetError("Client disconnected.")
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        try:
+            await loop.run_in_executor(self.wsgi_executor, run_wsgi, environ, emit)
+        except ConnectionResetError:
+            pass
+        finally:
+            pump.cancel()
+
+    async def _feed_request(self, scope, receive, send, domain: str) -> None:
+        headers = dict(scope.get('headers', []))
+        last_event_id = headers.get(b'last-event-id', b'').decode('latin-1')
+        if not last_event_id:
+            query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+            last_event_id = (query.get('lastEventId') or [''])[0]
+        try:
+            subscription = subscribe(domain, last_event_id or None)
+        except FeedFullError as e:
+            for message in json_response(503, str(e), [(b'retry-after', b'5')]):
+                await send(message)
+            return
+
+        async def write_events() -> str:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ]})
+            async for chunk in subscription:
+                try:
+                    await asyncio.wait_for(send({'type': 'http.response.body', 'body': chunk, 'more_body': True}),
+                                           LIVE_FEED_SEND_TIMEOUT)
+                except asyncio.TimeoutError:
+                    return 'slow_consumer'
+            return 'closed'
+
+        async def wait_disconnect() -> str:
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            return 'client'
+
+        writer = asyncio.create_task(write_events())
+        watch = asyncio.create_task(wait_disconnect())
+        try:
+            done, _ = await asyncio.wait({writer, watch}, return_when=asyncio.FIRST_COMPLETED)
+            finished = done.pop()
+            reason = finished.result() if not finished.cancelled() and finished.exception() is None else 'error'
+            LIVE_FEED_DISCONNECTS.inc(reason=reason)
+        finally:
+            writer.cancel()
+            watch.cancel()
+            subscription.close()
+
+    async def _a2a_receive_request(self, scope, receive, send) -> None:
+        query = {name: values[0] for name, values in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+        try:
+            agent_id, max_messages, timeout = parse_receive_args(query)
+        except ValueError as e:
+            for message in json_response(400, str(e)):
+                await send(message)
+            return
+
+        async def wait_disconnect() -> None:
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        poll = asyncio.create_task(get_broker().receive_async(agent_id, max_messages, timeout))
+        watch = asyncio.create_task(wait_disconnect())
+        try:
+            await asyncio.wait({poll, watch}, return_when=asyncio.FIRST_COMPLETED)
+            if poll.done():
+                # Messages taken by the poll are sent even if the client is going away
+                for message in json_body(200, {"agent_id": agent_id, "messages": poll.result()}):
+                    await send(message)
+        finally:
+            poll.cancel()
+            watch.cancel()
+
+    async def _llm_request(self, scope, receive, send, flow: str) -> None:
+        loop = asyncio.get_running_loop()
+        body = _RequestBody(loop)
+        disconnected = asyncio.Event()
+        pump = asyncio.create_task(self._pump_body(receive, body, disconnected))
+        watch = asyncio.create_task(disconnected.wait())
+        try:
+            # Wait for a slot, giving up on queue timeout or when the client goes away
+            acquire = asyncio.create_task(self.gate.acquire(flow))
+            await asyncio.wait({acquire, watch}, timeout=LLM_QUEUE_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+            if not acquire.done():
+                acquire.cancel()
+                reason = 'disconnected' if watch.done() else 'queue_timeout'
+                LLM_REQUESTS_REJECTED.inc(flow=flow, reason=reason)
+                if reason == 'queue_timeout':
+                    for message in json_response(503, f"Too many concurrent '{flow}' requests; try again shortly.",
+                                                 [(b'retry-after', b'1')]):
+                        await send(message)
+                return
+
+            # The response is collected on the worker thread and sent from here, so a
+            # timed-out handler that finishes later writes nothing to the connection.
+            messages: List[Dict[str, Any]] = []
+            environ = build_environ(scope, io.BufferedReader(body))
+            future = loop.run_in_executor(self.llm_executor, run_wsgi, environ, messages.append)
+            future.add_done_callback(lambda _: self.gate.release(flow))
+
+            done, _ = await asyncio.wait({future, watch}, timeout=LLM_REQUEST_TIMEOUT,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if future in done:
+                future.result()
+                for message in messages:
+                    await send(message)
+            elif watch in done:
+                LLM_REQUESTS_REJECTED.inc(flow=flow, reason='disconnected')
+            else:
+                LLM_REQUESTS_REJECTED.inc(flow=flow, reason='timeout')
+                for message in json_response(504, f"'{flow}' did not finish within {LLM_REQUEST_TIMEOUT:g}s."):
+                    await send(message)
+        finally:
+            watch.cancel()
+            pump.cancel()
+
+
+application = Application()
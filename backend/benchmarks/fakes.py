@@ -0,0 +1,301 @@
+import hashlib
+import json
+import sys
+import threading
+import time
+import types
+import typing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from pydantic import BaseModel
+
+from services.storage import StorageBackend, QueryFilter, merge_rollup, rollup_doc_id
+
+# Stand-ins for the external services the backend calls, so benchmarks measure our
+# own overhead plus a configurable, reproducible amount of simulated remote latency.
+
+
+class FakeLLM:
+    """
+    Replaces genkit.generate: sleeps for a fixed latency and returns a schema-valid sample output.
+    A `responder(prompt, output_schema)` hook can build specific outputs.
+    """
+
+    def __init__(self, latency: float = 0.5, responder: Optional[Callable[[str, type], Any]] = None):
+        self.latency = latency
+        self.responder = responder
+        self.calls = 0
+        self.prompt_tokens = 0
+        self._lock = threading.Lock()
+
+    def generate(self, model=None, prompt: str = '', output_schema=None, config=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += len(prompt) // 4 + 1
+        time.sleep(self.latency)
+        output = self.responder(prompt, output_schema) if self.responder else None
+        if output is None and output_schema is not None:
+            output = sample_instance(output_schema)
+        return types.SimpleNamespace(output=output)
+
+
+def _sample_value(annotation: Any, field_info=None) -> Any:
+    origin = typing.get_origin(annotation)
+    if origin is typing.Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        return _sample_value(args[0]) if args else None
+    if origin in (list, List):
+        return []
+    if origin in (dict, Dict):
+        return {}
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return sample_instance(annotation)
+    if annotation is bool:
+        return False
+    if annotation is int:
+        lower = 1
+        for meta in getattr(field_info, 'metadata', []) or []:
+            lower = max(lower, getattr(meta, 'ge', lower) or lower)
+        return lower
+    if annotation is float:
+        return 0.0
+    return "sample"
+
+
+def sample_instance(schema: type) -> BaseModel:
+    """
+    Builds a minimal valid instance of a pydantic model from its field annotations.
+    """
+    values = {}
+    for name, field in schema.model_fields.items():
+        values[field.alias or name] = _sample_value(field.annotation, field)
+    return schema.model_validate(values)
+
+
+def install_fake_genkit(llm: FakeLLM) -> None:
+    """
+    Registers stand-in `genkit` and `genkit.google_ai` modules before the app is imported.
+    """
+    genkit = types.ModuleType('genkit')
+    google_ai_module = types.ModuleType('genkit.google_ai')
+
+    class _GoogleAI:
+        gemini_pro = 'googleai/gemini-pro'
+
+        def __call__(self, **kwargs):
+            return self
+
+    google_ai_module.google_ai = _GoogleAI()
+
+    def flow(name, input_schema=None, output_schema=None):
+        def decorator(fn):
+            fn.flow_name = name
+            fn.input_schema = input_schema
+            return fn
+        return decorator
+
+    def run(flow_fn, flow_input):
+        schema = getattr(flow_fn, 'input_schema', None)
+        if isinstance(schema, type) and issubclass(schema, BaseModel) and not isinstance(flow_input, BaseModel):
+            flow_input = schema.model_validate(flow_input)
+        return flow_fn(flow_input)
+
+    genkit.init = lambda **kwargs: None
+    genkit.flow = flow
+    genkit.run = run
+    genkit.generate = llm.generate
+    genkit.google_ai = google_ai_module
+    sys.modules['genkit'] = genkit
+    sys.modules['genkit.google_ai'] = google_ai_module
+
+
+class FakeFirestoreBackend(StorageBackend):
+    """
+    In-memory storage with a simulated per-commit round trip, standing in for Firestore.
+    """
+
+    name = 'fake-firestore'
+    max_batch_size = 500
+    parallel_commits = True
+
+    def __init__(self, commit_latency: float = 0.05, read_latency: float = 0.01):
+        self.commit_latency = commit_latency
+        self.read_latency = read_latency
+        self.configs: Dict[str, Dict[str, Any]] = {}
+        self.tables: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.rollups: Dict[str, Dict[str, Any]] = {}
+        self.commits = 0
+        self.config_reads = 0
+        self._lock = threading.Lock()
+
+    def get_config(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        time.sleep(self.read_latency)
+        with self._lock:
+            self.config_reads += 1
+            config = self.configs.get(doc_id)
+        return dict(config) if config is not None else None
+
+    def put_config(self, doc_id: str, config: Dict[str, Any]) -> None:
+        time.sleep(self.commit_latency)
+        with self._lock:
+            self.configs[doc_id] = {**config, "created_at": time.time()}
+
+    def list_configs(self) -> List[Dict[str, Any]]:
+        time.sleep(self.read_latency)
+        with self._lock:
+            return [dict(config) for config in self.configs.values()]
+
+    def insert_rows(self, table_name: str, rows: List[Tuple[str, Dict[str, Any]]]) -> None:
+        if len(rows) > self.max_batch_size:
+            raise ValueError(f"Batch of {len(rows)} writes exceeds the {self.max_batch_size} write limit.")
+        time.sleep(self.commit_latency)
+        timestamp = time.time()
+        with self._lock:
+            self.commits += 1
+            table = self.tables.setdefault(table_name, {})
+            for doc_id, data in rows:
+                table[doc_id] = {**data, "insert_timestamp": timestamp}
+
+    def query(self, table_name: str, filters: Optional[List[QueryFilter]] = None, order_by: str = 'insert_timestamp',
+              descending: bool = True, limit: int = 100, start_after: Optional[Dict[str, Any]] = None,
+              fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        time.sleep(self.read_latency)
+        with self._lock:
+            rows = list(self.tables.get(table_name, {}).values())
+        for field, op, value in filters or []:
+            if op == '==':
+                rows = [row for row in rows if row.get(field) == value]
+            elif op == 'in':
+                rows = [row for row in rows if row.get(field) in value]
+        rows.sort(key=lambda row: (row.get(order_by), row.get('uuid')), reverse=descending)
+        if start_after:
+            cursor = (start_after[order_by], start_after['uuid'])
+            rows = [row for row in rows
+                    if ((row.get(order_by), row.get('uuid')) < cursor) == descending and
+                    (row.get(order_by), row.get('uuid')) != cursor]
+        rows = rows[:limit]
+        if fields:
+            keep = set(fields) | {order_by, 'uuid'}
+            rows = [{key: value for key, value in row.items() if key in keep} for row in rows]
+        return rows
+
+    def merge_rollups(self, deltas: List[Dict[str, Any]]) -> None:
+        time.sleep(self.commit_latency)
+        with self._lock:
+            for delta in deltas:
+                doc_id = rollup_doc_id(delta)
+                self.rollups[doc_id] = merge_rollup(self.rollups.get(doc_id), delta)
+
+    def get_rollups(self, granularity: str, domain: Optional[str] = None, since: Optional[str] = None,
+                    until: Optional[str] = None) -> List[Dict[str, Any]]:
+        time.sleep(self.read_latency)
+        with self._lock:
+            rollups = [dict(rollup) for rollup in self.rollups.values()]
+        return sorted(
+            (rollup for rollup in rollups
+             if rollup["granularity"] == granularity and (not domain or rollup["domain"] == domain)
+             and (not since or rollup["bucket"] >= since) and (not until or rollup["bucket"] <= until)),
+            key=lambda rollup: rollup["bucket"]
+        )
+
+
+class FakeRestSource:
+    """
+    Local HTTP/1.1 server standing in for a polled REST API. Serves `records` as
+    {"items": [...], "next": token} pages of `page_size`, filters on ?since=<updated_at>,
+    answers If-None-Match with 304 and counts requests and TCP connections.
+
+        source = FakeRestSource(latency=0.05).start()
+        source.add({"id": 1, "updated_at": 1})
+        ... poll source.url ...
+        source.stop()
+    """
+
+    def __init__(self, latency: float = 0.0, page_size: int = 100, cursor_field: str = 'updated_at'):
+        self.latency = latency
+        self.page_size = page_size
+        self.cursor_field = cursor_field
+        self.records: List[Dict[str, Any]] = []
+        self.requests = 0
+        self.not_modified = 0
+        self.connections = 0
+        self.fail_next = 0  # Respond 503 to this many upcoming requests
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/records"
+
+    def add(self, *records: Dict[str, Any]) -> None:
+        with self._lock:
+            self.records.extend(records)
+
+    def _etag(self, records: List[Dict[str, Any]]) -> str:
+        return '"' + hashlib.sha256(json.dumps(records, sort_keys=True).encode()).hexdigest()[:16] + '"'
+
+    def _page(self, query: Dict[str, List[str]]) -> Tuple[List[Dict[str, Any]], Optional[str], str]:
+        with self._lock:
+            records = list(self.records)
+        if 'since' in query:
+            since = json.loads(query['since'][0])
+            records = [record for record in records if record.get(self.cursor_field, 0) > since]
+        etag = self._etag(records)
+        offset = int(query.get('page', ['0'])[0])
+        page = records[offset:offset + self.page_size]
+        next_token = str(offset + self.page_size) if offset + self.page_size < len(records) else None
+        return page, next_token, etag
+
+    def start(self) -> 'FakeRestSource':
+        source = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with source._lock:
+                    source.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                time.sleep(source.latency)
+                with source._lock:
+                    source.requests += 1
+                    failing = source.fail_next > 0
+                    source.fail_next -= 1 if failing else 0
+                if failing:
+                    self._send(503, b'{"error": "unavailable"}')
+                    return
+                page, next_token, etag = source._page(parse_qs(urlsplit(self.path).query))
+                if self.headers.get('If-None-Match') == etag:
+                    with source._lock:
+                        source.not_modified += 1
+                    self._send(304, b'', etag)
+                    return
+                self._send(200, json.dumps({"items": page, "next": next_token}).encode(), etag)
+
+            def _send(self, status, body, etag=None):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                if etag:
+                    self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='fake-rest-source', daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,464 @@
+"""
+Reproducible load generator for the backend.
+
+Drives /ingest/<domain>/<endpoint_id> across batch sizes and concurrency levels, the
+Genkit flow routes, A2A message exchange between many simulated agents, and RestAPI
+pull polling, against stand-ins for genkit.generate, Firestore and the polled API with
+configurable latency. Results (p50/p95/p99 latency, requests and records per second, peak RSS) are
+written as JSON so runs can be compared across commits:
+
+    cd backend
+    python -m benchmarks.run_benchmarks --out bench-$(git rev-parse --short HEAD).json
+    python -m benchmarks.run_benchmarks --baseline bench-abc1234.json
+
+Pass --url to drive an already running server over HTTP instead of the in-process app.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BENCH_DOMAIN = 'Bench'
+BENCH_ENDPOINT = 'bench_sensor_v1'
+BENCH_TABLE = 'bench_sensor_readings'
+BENCH_PULL_TABLE = 'bench_pulled_readings'
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(q / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def sample_record(i: int) -> Dict[str, Any]:
+    return {
+        "sensor_id": f"sensor-{i % 97}",
+        "reading": round(20 + (i % 50) * 0.25, 2),
+        "status": "ok" if i % 11 else "alert",
+        "location": {"lat": 12.97 + (i % 10) * 0.001, "lng": 77.59},
+        "observed_at": "2024-06-01T12:00:00Z",
+    }
+
+
+class InProcessClient:
+    """Posts to the Flask app through its WSGI test client (one client per thread)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def post(self, path: str, body: Any) -> int:
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        return client.post(path, json=body).status_code
+
+    def get(self, path: str) -> Tuple[int, Any]:
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.get(path)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HTTPClient:
+    """Posts to a running server over HTTP."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+
+    def post(self, path: str, body: Any) -> int:
+        request = urllib.request.Request(
+            self.base_url + path, data=json.dumps(body).encode('utf-8'),
+            headers={'Content-Type': 'application/json'}, method='POST'
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def get(self, path: str) -> Tuple[int, Any]:
+        try:
+            with urllib.request.urlopen(self.base_url + path, timeout=120) as response:
+                return response.status, json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+
+def run_scenario(name: str, client, requests: int, concurrency: int,
+                 make_request: Callable[[int], Tuple[str, Any]], records_per_request: int = 0) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i: int) -> None:
+        nonlocal errors
+        path, body = make_request(i)
+        started = time.perf_counter()
+        try:
+            status = client.post(path, body)
+        except Exception:
+            status = 599
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "scenario": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "records_per_request": records_per_request,
+        "errors": errors,
+        "wall_seconds": round(wall, 4),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+        "requests_per_second": round(requests / wall, 2) if wall else 0.0,
+        "records_per_second": round(requests * records_per_request / wall, 2) if wall else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def ingest_scenarios(client, args) -> List[Dict[str, Any]]:
+    results = []
+    path = f"/ingest/{BENCH_DOMAIN}/{BENCH_ENDPOINT}"
+    for batch_size in args.batch_sizes:
+        batch = [sample_record(i) for i in range(batch_size)]
+        for concurrency in args.concurrency:
+            # Keep total records roughly comparable across batch sizes
+            requests = max(args.min_requests, min(args.requests, args.records_budget // batch_size))
+            results.append(run_scenario(
+                f"ingest[batch={batch_size},concurrency={concurrency}]", client, requests, concurrency,
+                lambda i, batch=batch: (path, batch), records_per_request=batch_size
+            ))
+            report(results[-1])
+    return results
+
+
+def flow_scenarios(client, args) -> List[Dict[str, Any]]:
+    record = {"uuid": "bench-1", "tableName": BENCH_TABLE, "data": sample_record(1), "insert_timestamp": "2024-06-01T12:00:00Z"}
+    routes = [
+        ("define-data-domain", lambda i: ("/define-data-domain", {"prompt": f"Bus GPS positions, feed {i}"})),
+        ("extract-api-metadata", lambda i: ("/extract-api-metadata", {"prompt": f"Air quality webhook, feed {i}"})),
+        ("generate-transformation-script", lambda i: ("/generate-transformation-script", {"transformationPrompt": f"Convert F to C, v{i}"})),
+        ("summarize-record", lambda i: ("/summarize-record", {**record, "uuid": f"bench-{i}"})),
+    ]
+    results = []
+    for name, make_request in routes:
+        for concurrency in args.concurrency:
+            results.append(run_scenario(f"{name}[concurrency={concurrency}]", client, args.flow_requests, concurrency, make_request))
+            report(results[-1])
+    return results
+
+
+def a2a_scenarios(client, args) -> List[Dict[str, Any]]:
+    """
+    Simulated agents long-poll /a2a/receive while senders post batches to /a2a/send.
+    Reports send throughput plus end-to-end delivery rate and latency.
+    """
+    results = []
+    agents = [f"bench-agent-{n}" for n in range(args.a2a_agents)]
+    requests = max(1, args.a2a_messages // args.a2a_batch)
+    for concurrency in args.concurrency:
+        expected = requests * args.a2a_batch
+        delivery: List[float] = []
+        lock = threading.Lock()
+        done = threading.Event()
+
+        def receiver(agent: str) -> None:
+            while not done.is_set():
+                try:
+                    status, body = client.get(f"/a2a/receive?agent_id={agent}&timeout=1")
+                except Exception:
+                    continue
+                if status != 200 or not body:
+                    continue
+                now = time.time()
+                with lock:
+                    delivery.extend(now - message["payload"]["sent_at"] for message in body["messages"])
+                    if len(delivery) >= expected:
+                        done.set()
+
+        receivers = [threading.Thread(target=receiver, args=(agent,), daemon=True) for agent in agents]
+        for thread in receivers:
+            thread.start()
+
+        def make_request(i: int) -> Tuple[str, Any]:
+            sent_at = time.time()
+            return "/a2a/send", {"messages": [
+                {"from": "bench-sender", "to": agents[(i * args.a2a_batch + j) % len(agents)],
+                 "payload": {"seq": j, "sent_at": sent_at}}
+                for j in range(args.a2a_batch)
+            ]}
+
+        started = time.perf_counter()
+        result = run_scenario(f"a2a[agents={len(agents)},batch={args.a2a_batch},concurrency={concurrency}]",
+                              client, requests, concurrency, make_request, records_per_request=args.a2a_batch)
+        done.wait(timeout=30)
+        elapsed = time.perf_counter() - started
+        done.set()
+        for thread in receivers:
+            thread.join()
+
+        with lock:
+            delivery.sort()
+            result["messages_delivered"] = len(delivery)
+            result["delivered_per_second"] = round(len(delivery) / elapsed, 2) if elapsed else 0.0
+            result["delivery_latency_ms"] = {
+                "p50": round(percentile(delivery, 50) * 1000, 2),
+                "p95": round(percentile(delivery, 95) * 1000, 2),
+                "p99": round(percentile(delivery, 99) * 1000, 2),
+            }
+        results.append(result)
+        report(result)
+    return results
+
+
+class PullPoller:
+    """
+    Lets run_scenario drive PullScheduler.poll: post(path, source) polls `source` and
+    returns 200, or 502 for an 'error' outcome. Outcomes are counted per phase.
+    """
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.outcomes: Dict[str, int] = {}
+        self.records_fetched = 0
+        self._lock = threading.Lock()
+
+    def post(self, path: str, source) -> int:
+        result = self.scheduler.poll(source)
+        with self._lock:
+            self.outcomes[result.outcome] = self.outcomes.get(result.outcome, 0) + 1
+            self.records_fetched += result.records_fetched
+        return 502 if result.outcome == 'error' else 200
+
+
+def pull_scenarios(args) -> List[Dict[str, Any]]:
+    """
+    PullScheduler.poll against a local FakeRestSource, in four phases per concurrency level:
+    'initial' pages through every record, 'caught_up' sends the `since` cursor and gets
+    nothing new, 'unchanged' is answered 304 from the stored ETag, and 'incremental'
+    fetches only the records added since. In-process only.
+    """
+    from benchmarks.fakes import FakeRestSource
+    from services.pull_scheduler import PullScheduler, PullSource
+
+    results = []
+    for concurrency in args.concurrency:
+        server = FakeRestSource(latency=args.pull_latency, page_size=100).start()
+        server.add(*({**sample_record(i), "id": i, "updated_at": i + 1} for i in range(args.pull_records)))
+        scheduler = PullScheduler(max_concurrency=concurrency,
+                                  state_path=os.path.join(args.workdir, f"pull_state_{concurrency}.json"))
+        sources = [
+            PullSource(
+                domain=BENCH_DOMAIN, endpoint_id=f"bench_pull_{concurrency}_{n}", table_name=BENCH_PULL_TABLE,
+                url=server.url, records_path='items', cursor_field='updated_at', cursor_param='since',
+                next_page_path='next', next_page_param='page', config={"tableName": BENCH_PULL_TABLE},
+            )
+            for n in range(args.pull_sources)
+        ]
+        new_records = max(1, args.pull_records // 10)
+        phases = [
+            ('initial', args.pull_records),
+            ('caught_up', 0),
+            ('unchanged', 0),
+            ('incremental', new_records),
+        ]
+        try:
+            for phase, records_per_poll in phases:
+                if phase == 'incremental':
+                    server.add(*({**sample_record(i), "id": i, "updated_at": i + 1}
+                                 for i in range(args.pull_records, args.pull_records + new_records)))
+                poller = PullPoller(scheduler)
+                requests_before = server.requests
+                result = run_scenario(
+                    f"pull[{phase},sources={len(sources)},concurrency={concurrency}]", poller, len(sources),
+                    concurrency, lambda i: ("", sources[i]), records_per_request=records_per_poll
+                )
+                result["outcomes"] = poller.outcomes
+                result["records_fetched"] = poller.records_fetched
+                result["source_requests"] = server.requests - requests_before
+                results.append(result)
+                report(result)
+            results[-1]["connections_opened"] = scheduler.pool.connections_opened
+        finally:
+            scheduler.pool.close()
+            server.stop()
+    return results
+
+
+def report(result: Dict[str, Any]) -> None:
+    latency = result["latency_ms"]
+    print(f"{result['scenario']:<55} p50={latency['p50']:>9.2f}ms p95={latency['p95']:>9.2f}ms "
+          f"p99={latency['p99']:>9.2f}ms rps={result['requests_per_second']:>9.2f} "
+          f"rec/s={result['records_per_second']:>10.2f} errors={result['errors']}", file=sys.stderr)
+
+
+def compare(current: Dict[str, Any], baseline_path: str) -> None:
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {result["scenario"]: result for result in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path}:", file=sys.stderr)
+    for result in current["results"]:
+        before = baseline.get(result["scenario"])
+        if not before:
+            continue
+        def change(now, then):
+            return f"{(now - then) / then * 100:+.1f}%" if then else "n/a"
+        print(f"{result['scenario']:<55} p95 {change(result['latency_ms']['p95'], before['latency_ms']['p95']):>8} "
+              f"rps {change(result['requests_per_second'], before['requests_per_second']):>8}", file=sys.stderr)
+
+
+def setup_in_process(args):
+    """
+    Installs the stand-ins and imports the Flask app against them.
+    """
+    os.environ.setdefault('LLM_CACHE_ENABLED', 'true' if args.llm_cache else 'false')
+    os.environ.setdefault('LLM_CACHE_PATH', os.path.join(args.workdir, 'llm_cache.sqlite3'))
+    os.environ.setdefault('INGEST_SPOOL_DIR', os.path.join(args.workdir, 'spool'))
+    if args.storage == 'sqlite':
+        os.environ['STORAGE_BACKEND'] = 'sqlite'
+        os.environ.setdefault('SQLITE_PATH', os.path.join(args.workdir, 'bench.sqlite3'))
+
+    # Imported only after the environment is set, since service modules read it at import time
+    from benchmarks.fakes import FakeLLM, FakeFirestoreBackend, install_fake_genkit
+
+    llm = FakeLLM(latency=args.llm_latency)
+    install_fake_genkit(llm)
+
+    from services import storage
+    if args.storage == 'fake':
+        storage.set_storage(FakeFirestoreBackend(commit_latency=args.commit_latency, read_latency=args.read_latency))
+
+    import main
+    return InProcessClient(main.app), llm
+
+
+def build_parser() -> argparse.ArgumentParser:
+    def int_list(value: str) -> List[int]:
+        return [int(part) for part in value.split(',') if part]
+
+    parser = argparse.ArgumentParser(description="Benchmark the City Pulse backend.")
+    parser.add_argument('--scenarios', default='ingest,flows', help="Comma-separated: ingest, flows, a2a, pull")
+    parser.add_argument('--batch-sizes', type=int_list, default=[1, 10, 100, 1000])
+    parser.add_argument('--concurrency', type=int_list, default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=400, help="Max requests per ingest scenario")
+    parser.add_argument('--min-requests', type=int, default=20, help="Min requests per ingest scenario")
+    parser.add_argument('--records-budget', type=int, default=50000, help="Target records per ingest scenario")
+    parser.add_argument('--flow-requests', type=int, default=40, help="Requests per flow scenario")
+    parser.add_argument('--a2a-agents', type=int, default=200, help="Simulated agents long-polling in the a2a scenario")
+    parser.add_argument('--a2a-messages', type=int, default=20000, help="Messages sent per a2a scenario")
+    parser.add_argument('--a2a-batch', type=int, default=50, help="Messages per /a2a/send request")
+    parser.add_argument('--pull-sources', type=int, default=20, help="REST sources polled in the pull scenario")
+    parser.add_argument('--pull-records', type=int, default=1000, help="Records each source serves on its first poll")
+    parser.add_argument('--pull-latency', type=float, default=0.02, help="Seconds per fake REST API response")
+    parser.add_argument('--llm-latency', type=float, default=0.5, help="Seconds per fake genkit.generate call")
+    parser.add_argument('--commit-latency', type=float, default=0.05, help="Seconds per fake Firestore commit")
+    parser.add_argument('--read-latency', type=float, default=0.01, help="Seconds per fake Firestore read")
+    parser.add_argument('--storage', choices=['fake', 'sqlite'], default='fake')
+    parser.add_argument('--llm-cache', action='store_true', help="Leave the LLM response cache enabled")
+    parser.add_argument('--url', help="Benchmark a running server instead of the in-process app")
+    parser.add_argument('--out', help="Write results JSON here (default: stdout)")
+    parser.add_argument('--baseline', help="Print changes relative to an earlier results file")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    args = build_parser().parse_args(argv)
+    args.workdir = tempfile.mkdtemp(prefix='citypulse-bench-')
+    scenarios = {name.strip() for name in args.scenarios.split(',')}
+
+    llm = None
+    if args.url:
+        client = HTTPClient(args.url)
+    else:
+        client, llm = setup_in_process(args)
+
+    status = client.post('/store-endpoint-config', {
+        "domain": BENCH_DOMAIN, "endpointId": BENCH_ENDPOINT, "tableName": BENCH_TABLE, "ingestionType": "Webhooks",
+    })
+    if status >= 400:
+        raise SystemExit(f"Could not store the benchmark endpoint config (HTTP {status}).")
+
+    results: List[Dict[str, Any]] = []
+    if 'ingest' in scenarios:
+        results.extend(ingest_scenarios(client, args))
+    if 'flows' in scenarios:
+        results.extend(flow_scenarios(client, args))
+    if 'a2a' in scenarios:
+        results.extend(a2a_scenarios(client, args))
+    if 'pull' in scenarios:
+        if args.url:
+            print("Skipping the pull scenario: it polls in-process and cannot run against --url.", file=sys.stderr)
+        else:
+            results.extend(pull_scenarios(args))
+
+    output = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "target": args.url or "in-process",
+            "storage": args.storage if not args.url else "remote",
+            "llm_latency": args.llm_latency,
+            "commit_latency": args.commit_latency,
+            "read_latency": args.read_latency,
+            "llm_calls": llm.calls if llm else None,
+        },
+        "results": results,
+    }
+
+    text = json.dumps(output, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.baseline:
+        compare(output, args.baseline)
+    return output
+
+
+if __name__ == '__main__':
+    main()
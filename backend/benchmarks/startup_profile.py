@@ -0,0 +1,110 @@
+"""
+Reports what importing the backend costs, module by module.
+
+Runs `import main` in a fresh interpreter under `python -X importtime` and prints the
+slowest imports by cumulative and by self time, plus the wall time of the import itself:
+
+    cd backend
+    python -m benchmarks.startup_profile
+    python -m benchmarks.startup_profile --warm-up     # also time main.warm_up() per step
+    python -m benchmarks.startup_profile --fake-genkit # profile without genkit installed
+
+Use it before and after adding a top-level import to see what it does to cold starts.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+_CHILD = """
+import json, sys, time
+if {fake_genkit!r}:
+    from benchmarks.fakes import FakeLLM, install_fake_genkit
+    install_fake_genkit(FakeLLM(latency=0.0))
+started = time.perf_counter()
+import main
+report = {{"import_seconds": round(time.perf_counter() - started, 4)}}
+if {warm_up!r}:
+    report["warm_up_seconds"] = main.warm_up()
+sys.stdout.write("STARTUP_PROFILE " + json.dumps(report) + "\\n")
+"""
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, object]]:
+    """
+    Parses `-X importtime` lines ("import time: self | cumulative | name") into records.
+    Depth is taken from the indentation of the module name.
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        entries.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip())) // 2,
+            "self_ms": int(parts[0]) / 1000.0,
+            "cumulative_ms": int(parts[1]) / 1000.0,
+        })
+    return entries
+
+
+def profile(warm_up: bool = False, fake_genkit: bool = False) -> Dict[str, object]:
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, 'STARTUP_WARMUP': 'false'}
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _CHILD.format(fake_genkit=fake_genkit, warm_up=warm_up)],
+        cwd=backend_dir, env=env, capture_output=True, text=True
+    )
+    report = None
+    for line in completed.stdout.splitlines():
+        if line.startswith('STARTUP_PROFILE '):
+            report = json.loads(line[len('STARTUP_PROFILE '):])
+    if completed.returncode != 0 or report is None:
+        tail = "\n".join(line for line in completed.stderr.splitlines() if not line.startswith('import time:'))
+        raise SystemExit(f"Importing main failed:\n{tail}")
+    report["modules"] = parse_importtime(completed.stderr)
+    return report
+
+
+def print_report(report: Dict[str, object], top: int) -> None:
+    modules = report["modules"]
+    print(f"import main: {report['import_seconds'] * 1000:.1f} ms wall, {len(modules)} modules imported")
+
+    print(f"\nTop {top} by cumulative time (module and everything it imported):")
+    for entry in sorted(modules, key=lambda e: e["cumulative_ms"], reverse=True)[:top]:
+        print(f"  {entry['cumulative_ms']:>9.1f} ms  {'  ' * entry['depth']}{entry['module']}")
+
+    print(f"\nTop {top} by self time:")
+    for entry in sorted(modules, key=lambda e: e["self_ms"], reverse=True)[:top]:
+        print(f"  {entry['self_ms']:>9.1f} ms  {entry['module']}")
+
+    if report.get("warm_up_seconds"):
+        print("\nwarm_up() steps:")
+        for step, seconds in report["warm_up_seconds"].items():
+            print(f"  {seconds * 1000:>9.1f} ms  {step}")
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, object]:
+    parser = argparse.ArgumentParser(description="Profile the import cost of the City Pulse backend.")
+    parser.add_argument('--top', type=int, default=20, help="Modules to list per table")
+    parser.add_argument('--warm-up', action='store_true', help="Also run and time main.warm_up()")
+    parser.add_argument('--fake-genkit', action='store_true', help="Use the benchmark stand-in for genkit")
+    parser.add_argument('--json', action='store_true', help="Print the raw report as JSON")
+    args = parser.parse_args(argv)
+
+    report = profile(warm_up=args.warm_up, fake_genkit=args.fake_genkit)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, args.top)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,18 @@
 import genkit
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from genkit.google_ai import google_ai
 from pydantic import BaseModel, Field
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+from services.metrics import instrumented_generate
+from services.context_store import session_context, remember
+
+# Limits for batch summarization. Records are packed into a single model call until the
+# estimated prompt size reaches the token budget or the per-call record cap.
+SUMMARIZE_BATCH_TOKEN_BUDGET = int(os.environ.get('SUMMARIZE_BATCH_TOKEN_BUDGET', 6000))
+SUMMARIZE_BATCH_MAX_RECORDS = int(os.environ.get('SUMMARIZE_BATCH_MAX_RECORDS', 25))
+SUMMARIZE_MAX_CONCURRENCY = int(os.environ.get('SUMMARIZE_MAX_CONCURRENCY', 4))
 
 # Pydantic model for the flow's input
 class SummarizeRecordInput(BaseModel):
@@ -15,6 +25,74 @@ class SummarizeRecordInput(BaseModel):
 class SummarizeRecordOutput(BaseModel):
     summary: str = Field(..., description="A concise, human-readable summary of the record's data. If the original data is in a language other than English, translate the relevant parts and provide the summary in English.")
 
+class SummarizeRecordsInput(BaseModel):
+    records: List[SummarizeRecordInput]
+    # Callers may lower these, never raise them: the flow clamps both to the server limits
+    maxConcurrency: int = SUMMARIZE_MAX_CONCURRENCY
+    tokenBudget: int = SUMMARIZE_BATCH_TOKEN_BUDGET
+
+class RecordSummary(BaseModel):
+    uuid: str = Field(..., description="The uuid of the record being summarized, copied exactly from the input.")
+    summary: str = Field(..., description="A concise, human-readable summary of this record's data, in English.")
+
+# Structured output for one packed model call
+class PackedSummariesOutput(BaseModel):
+    summaries: List[RecordSummary]
+
+class RecordSummaryResult(BaseModel):
+    uuid: str
+    summary: Optional[str] = None
+    error: Optional[str] = None
+
+class SummarizeRecordsOutput(BaseModel):
+    results: List[RecordSummaryResult]
+    succeeded: int
+    failed: int
+    model_calls: int
+
+def compact_json(data: Any) -> str:
+    # No indentation or spaces after separators: whitespace is paid for in tokens
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False, default=str)
+
+def estimate_tokens(text: str) -> int:
+    # Rough heuristic for Gemini tokenization of English/JSON text
+    return len(text) // 4 + 1
+
+def _summarize_one(record: SummarizeRecordInput, context: str = '') -> SummarizeRecordOutput:
+    llm = google_ai.gemini_pro
+
+    prompt = f"""
+        As an AI assistant for a smart city platform, your task is to summarize an ingested data record into a clear, human-readable format.
+        The end-user is non-technical, so avoid jargon.
+        If the data contains non-English text, you MUST translate the key information and provide the final summary in English.
+
+        Here is the data record to summarize:
+        - Table Name: {record.tableName}
+        - Record Data: {compact_json(record.data)}
+
+        Based on this, provide a concise summary as a single block of text.
+    """
+    if context:
+        prompt += f"""
+        Summaries given earlier in this session, for context (mention notable changes from them):
+        {context}
+    """
+
+    response = instrumented_generate(
+        genkit.generate,
+        'summarizeRecordFlow',
+        model=llm,
+        prompt=prompt,
+        output_schema=SummarizeRecordOutput,
+        config={"temperature": 0.3}
+    )
+
+    structured_output = response.output
+    if not structured_output:
+        raise Exception("Failed to generate a valid summary from the model.")
+
+    return structured_output
+
 @genkit.flow(
     'summarizeRecordFlow',
     input_schema=SummarizeRecordInput,
@@ -23,30 +101,114 @@ class SummarizeRecordOutput(BaseModel):
 def summarize_record_flow(record: SummarizeRecordInput) -> SummarizeRecordOutput:
     """
     This flow takes an ingested data record and returns a human-readable summary in English.
+    Inside an MCP session, earlier summaries from the session (trimmed to its token budget)
+    are included in the prompt and this one is added to them.
     """
+    output = _summarize_one(record, session_context())
+    remember('assistant', f"{record.tableName} {record.uuid} ({record.insert_timestamp}): {output.summary}")
+    return output
+
+def _record_line(record: SummarizeRecordInput) -> str:
+    return compact_json({"uuid": record.uuid, "table": record.tableName, "data": record.data})
+
+def pack_records(records: List[SummarizeRecordInput], token_budget: int,
+                 max_records: int = SUMMARIZE_BATCH_MAX_RECORDS) -> List[List[SummarizeRecordInput]]:
+    """
+    Greedily groups records into packs whose serialized size fits the token budget.
+    A record larger than the budget on its own gets a pack to itself.
+    """
+    packs, current, current_tokens = [], [], 0
+    for record in records:
+        tokens = estimate_tokens(_record_line(record))
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_records):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(record)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+def _summarize_pack(pack: List[SummarizeRecordInput]) -> Dict[str, str]:
     llm = google_ai.gemini_pro
+    lines = "\n".join(_record_line(record) for record in pack)
 
     prompt = f"""
-        As an AI assistant for a smart city platform, your task is to summarize an ingested data record into a clear, human-readable format.
+        As an AI assistant for a smart city platform, your task is to summarize ingested data records into clear, human-readable text.
         The end-user is non-technical, so avoid jargon.
-        If the data contains non-English text, you MUST translate the key information and provide the final summary in English.
+        If a record contains non-English text, you MUST translate the key information and write its summary in English.
 
-        Here is the data record to summarize:
-        - Table Name: {record.tableName}
-        - Record Data: {json.dumps(record.data, indent=2)}
+        Each line below is one record as compact JSON with its uuid, table name and data:
+        {lines}
 
-        Based on this, provide a concise summary as a single block of text.
+        Return exactly one concise summary per record, each tagged with that record's uuid.
     """
 
-    response = genkit.generate(
+    response = instrumented_generate(
+        genkit.generate,
+        'summarizeRecordsFlow',
         model=llm,
         prompt=prompt,
-        output_schema=SummarizeRecordOutput,
+        output_schema=PackedSummariesOutput,
         config={"temperature": 0.3}
     )
 
     structured_output = response.output
     if not structured_output:
-        raise Exception("Failed to generate a valid summary from the model.")
+        raise Exception("Failed to generate valid summaries from the model.")
 
-    return structured_output
+    expected = {record.uuid for record in pack}
+    return {item.uuid: item.summary for item in structured_output.summaries if item.uuid in expected and item.summary}
+
+@genkit.flow(
+    'summarizeRecordsFlow',
+    input_schema=SummarizeRecordsInput,
+    output_schema=SummarizeRecordsOutput
+)
+def summarize_records_flow(batch: SummarizeRecordsInput) -> SummarizeRecordsOutput:
+    """
+    This flow summarizes many records at once. Records are packed into as few model calls
+    as the token budget allows and run with bounded concurrency; any record missing from
+    its pack's response (or whose pack failed) is retried on its own.
+    """
+    records = batch.records
+    if not records:
+        return SummarizeRecordsOutput(results=[], succeeded=0, failed=0, model_calls=0)
+
+    # Capped server-side: one request admitted by asgi.LLMGate must not fan out into more, or larger, model calls
+    token_budget = min(max(1, batch.tokenBudget), SUMMARIZE_BATCH_TOKEN_BUDGET)
+    concurrency = min(max(1, batch.maxConcurrency), SUMMARIZE_MAX_CONCURRENCY)
+    packs = pack_records(records, token_budget)
+    summaries: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [(pack, pool.submit(_summarize_pack, pack)) for pack in packs]
+        for pack, future in futures:
+            try:
+                summaries.update(future.result())
+            except Exception as e:
+                for record in pack:
+                    errors[record.uuid] = str(e)
+
+        missing = [record for record in records if record.uuid not in summaries]
+        retries = [(record, pool.submit(_summarize_one, record)) for record in missing]
+        for record, future in retries:
+            try:
+                summaries[record.uuid] = future.result().summary
+                errors.pop(record.uuid, None)
+            except Exception as e:
+                errors[record.uuid] = str(e)
+
+    results = [
+        RecordSummaryResult(uuid=record.uuid, summary=summaries.get(record.uuid),
+                            error=None if record.uuid in summaries else errors.get(record.uuid, "No summary returned."))
+        for record in records
+    ]
+    succeeded = sum(1 for result in results if result.summary is not None)
+    return SummarizeRecordsOutput(
+        results=results,
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        model_calls=len(packs) + len(missing)
+    )
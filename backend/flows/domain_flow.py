@@ -1,5 +1,6 @@
 import genkit
 from genkit.google_ai import google_ai
+from services.llm_cache import cached_generate
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any
 
@@ -34,14 +35,13 @@ def define_data_domain_flow(prompt: str) -> DataDomainModel:
         Provide your response in a structured JSON format.
     """
 
-    response = genkit.generate(
+    structured_output = cached_generate(
         model=llm,
         prompt=define_data_domain_prompt,
         output_schema=DataDomainModel,
-        config={"temperature": 0.2}
+        config={"temperature": 0.2},
+        flow='defineDataDomainFlow'
     )
-    
-    structured_output = response.output
     if not structured_output:
         raise Exception("Failed to generate a valid data domain definition from the model.")
 
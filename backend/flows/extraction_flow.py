@@ -1,5 +1,9 @@
 import genkit
+import json
 from pydantic import BaseModel
+from services.pull_scheduler import PullSource, PullError, get_pull_scheduler
+
+PREVIEW_RECORDS = 3
 
 class ExtractionInput(BaseModel):
     source_type: str
@@ -9,11 +13,28 @@ class ExtractionOutput(BaseModel):
     status: str
     data_preview: str
 
-# Placeholder for extraction flow
-extraction_flow = genkit.flow(
+@genkit.flow(
     'extractionFlow',
     input_schema=ExtractionInput,
     output_schema=ExtractionOutput
-)(
-    lambda data: {"status": "success", "data_preview": f"Data extracted from {data.source_type}"}
 )
+def extraction_flow(data: ExtractionInput) -> ExtractionOutput:
+    """
+    Fetches a RestAPI source once, without ingesting or moving its cursor, and returns the
+    first few records so a pull config can be checked before the scheduler picks it up.
+    Scheduled polling itself runs in services/pull_scheduler.py.
+    """
+    if data.source_type != 'RestAPI':
+        return ExtractionOutput(status="unsupported", data_preview=f"No extractor for '{data.source_type}' sources.")
+    source = PullSource.from_config({**data.config, "ingestionType": "RestAPI"})
+    if source is None:
+        return ExtractionOutput(status="error", data_preview="Config needs a tableName and a 'pull' block with a url.")
+    try:
+        fetched = get_pull_scheduler().fetch(source)
+    except PullError as e:
+        return ExtractionOutput(status="error", data_preview=str(e))
+    preview = json.dumps(fetched.records[:PREVIEW_RECORDS], indent=2, default=str)
+    return ExtractionOutput(
+        status="success",
+        data_preview=f"Fetched {len(fetched.records)} records in {fetched.pages} page(s) from {source.url}:\n{preview}"
+    )
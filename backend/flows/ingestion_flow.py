@@ -1,14 +1,15 @@
 import genkit
 from genkit.google_ai import google_ai
+from services.llm_cache import cached_generate
+from services.context_store import session_context, remember
 from pydantic import BaseModel, Field
 from typing import List, Optional
 
-# This Pydantic model defines the structured output the AI should generate.
-# It aligns with the frontend's 'ExtractApiMetadataOutput' type.
-class ApiMetadataModel(BaseModel):
+# Everything the AI generates except the schema. When a sample is available the schema is
+# inferred locally (services/schema_inference.py) and the AI only fills in these fields.
+class ApiDescriptionModel(BaseModel):
     domain: str = Field(..., description="The domain of the API (e.g., 'CityServices', 'PublicHealth', 'Transportation'). Use PascalCase.")
     endpointId: str = Field(..., description="A unique identifier for the API endpoint (e.g., 'traffic_incidents_v1', 'air_quality_feed'). Use snake_case.")
-    schema_str: str = Field(..., alias='schema', description="A string representation of the JSON schema of the data returned by the API. This must be a valid JSON string.")
     source: str = Field(..., description="The source of the data (e.g., 'Metropolis Transport Authority API', 'Citizen Reporting Portal').")
     isTransformationRequired: bool = Field(..., description="Whether data transformation is required to match the target schema or for cleaning purposes. Infer this from the user's description.")
     isAttachment: bool = Field(..., description="Whether the data typically includes a file attachment. Defaults to false if not mentioned.")
@@ -19,6 +20,33 @@ class ApiMetadataModel(BaseModel):
     dataUsagePrompt: str = Field(..., description="Generate a concise prompt that an AI could use to understand the context and purpose of this data.")
     dataUsers: List[str] = Field(..., description="A list of potential user roles who would access this data, e.g., 'Administrators', 'Data Analysts', 'Emergency Responders'.")
 
+# This Pydantic model defines the structured output the AI should generate.
+# It aligns with the frontend's 'ExtractApiMetadataOutput' type.
+class ApiMetadataModel(ApiDescriptionModel):
+    schema_str: str = Field(..., alias='schema', description="A string representation of the JSON schema of the data returned by the API. This must be a valid JSON string.")
+
+class ApiSampleMetadataInput(BaseModel):
+    prompt: str
+    schema_str: str  # Inferred from the sample
+    column_summary: str
+    ingestionType: Optional[str] = None  # Known from how the sample arrived, e.g. 'FileUpload'
+
+# With an MCP session (see services/context_store.py), earlier sources described in the
+# session are passed along so related endpoints get consistent domains and naming
+def _session_section() -> str:
+    context = session_context()
+    if not context:
+        return ""
+    return f"""
+        Earlier in this session (keep domain names and naming conventions consistent with it):
+        {context}
+    """
+
+def _remember_extraction(prompt: str, metadata: ApiMetadataModel) -> None:
+    remember('user', prompt)
+    remember('assistant', f"domain={metadata.domain} endpointId={metadata.endpointId} tableName={metadata.tableName} "
+                          f"ingestionType={metadata.ingestionType}")
+
 @genkit.flow(
     'extractApiMetadataFlow',
     input_schema=str,
@@ -36,17 +64,58 @@ def extract_api_metadata_flow(prompt: str) -> ApiMetadataModel:
 
         Adhere strictly to the requested JSON schema. The 'schema' field must be a stringified JSON representing the data structure.
     """
+    extraction_prompt += _session_section()
     
     llm = google_ai.gemini_pro
-    response = genkit.generate(
+    structured_output = cached_generate(
         model=llm,
         prompt=extraction_prompt,
         output_schema=ApiMetadataModel,
-        config={"temperature": 0.1}
+        config={"temperature": 0.1},
+        flow='extractApiMetadataFlow'
     )
-    
-    structured_output = response.output
     if not structured_output:
         raise Exception("Failed to generate valid API metadata from the model.")
-        
+
+    _remember_extraction(prompt, structured_output)
     return structured_output
+
+@genkit.flow(
+    'extractApiMetadataFromSampleFlow',
+    input_schema=ApiSampleMetadataInput,
+    output_schema=ApiMetadataModel
+)
+def extract_api_metadata_from_sample_flow(data: ApiSampleMetadataInput) -> ApiMetadataModel:
+    """
+    Like extract_api_metadata_flow, but for a source whose schema was already inferred
+    from sample data. The AI sees the inferred columns and writes only the descriptive fields.
+    """
+    extraction_prompt = f"""
+        You are an expert data architect for a smart city platform. Describe a data source from the user's description and the columns inferred from a sample of its data. Format the output as a structured JSON object.
+
+        User's Description: "{data.prompt}"
+
+        Columns (name: type, nullability, distinct values in the sample, examples):
+        {data.column_summary}
+    """
+    if data.ingestionType:
+        extraction_prompt += f"\n        The data arrives via '{data.ingestionType}'; use that as the ingestionType.\n"
+    extraction_prompt += _session_section()
+
+    llm = google_ai.gemini_pro
+    description = cached_generate(
+        model=llm,
+        prompt=extraction_prompt,
+        output_schema=ApiDescriptionModel,
+        config={"temperature": 0.1},
+        flow='extractApiMetadataFromSampleFlow'
+    )
+    if not description:
+        raise Exception("Failed to generate valid API metadata from the model.")
+
+    metadata = description.model_dump()
+    if data.ingestionType:
+        metadata['ingestionType'] = data.ingestionType
+    result = ApiMetadataModel(**metadata, schema=data.schema_str)
+    _remember_extraction(data.prompt, result)
+    return result
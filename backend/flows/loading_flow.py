@@ -1,14 +1,27 @@
+import os
+import random
+import time
 import genkit
 from pydantic import BaseModel
-from services.firebase_service import insert_data
+from typing import List, Optional
+from services.firebase_service import insert_data, ChunkResult
+
+# Failed chunks are retried after a randomized exponential backoff, so loaders that
+# failed together (e.g. on a storage quota error) do not retry in lockstep.
+LOAD_RETRY_BACKOFF = float(os.environ.get('LOAD_RETRY_BACKOFF', 0.5))  # Seconds before the first retry, doubled per attempt
+LOAD_RETRY_BACKOFF_MAX = float(os.environ.get('LOAD_RETRY_BACKOFF_MAX', 10))
 
 class LoadingInput(BaseModel):
     table_name: str
     data: list
+    max_retries: int = 2
+    doc_ids: Optional[List[Optional[str]]] = None
+    domain: str = ''
 
 class LoadingOutput(BaseModel):
     status: str
     rows_loaded: int
+    chunks: List[ChunkResult] = []
 
 @genkit.flow(
     'loadingFlow',
@@ -18,6 +31,8 @@ class LoadingOutput(BaseModel):
 def loading_flow(load_input: LoadingInput) -> LoadingOutput:
     """
     This flow takes data and a table name and inserts the data into Firestore.
+    When some chunks of a large payload fail to commit, only those row ranges are retried,
+    with the same document IDs so rows that did land are skipped rather than written twice.
     """
     if not load_input.table_name:
         raise ValueError("Table name is required for loading data.")
@@ -28,15 +43,52 @@ def loading_flow(load_input: LoadingInput) -> LoadingOutput:
         # Using the service to interact with Firestore
         response = insert_data(
             table_name=load_input.table_name,
-            data_list=load_input.data
+            data_list=load_input.data,
+            doc_ids=load_input.doc_ids,
+            domain=load_input.domain
         )
-        
-        if response.success:
-            return LoadingOutput(status="success", rows_loaded=response.rows_added)
+        if not response.chunks:
+            # The request failed before any chunk was attempted
+            raise Exception(f"Failed to load data: {response.message}")
+
+        # Chunk results keyed by their row offset in the original payload
+        results = {chunk.start: chunk for chunk in response.chunks}
+
+        for attempt in range(load_input.max_retries):
+            failed = [chunk for chunk in results.values() if not chunk.success]
+            if not failed:
+                break
+            time.sleep(random.uniform(0, min(LOAD_RETRY_BACKOFF * 2 ** attempt, LOAD_RETRY_BACKOFF_MAX)))
+            for chunk in failed:
+                retry = insert_data(
+                    table_name=load_input.table_name,
+                    data_list=load_input.data[chunk.start:chunk.end],
+                    doc_ids=load_input.doc_ids[chunk.start:chunk.end] if load_input.doc_ids is not None else None,
+                    domain=load_input.domain
+                )
+                # Re-base the retried sub-chunks onto the original row offsets
+                for sub_chunk in retry.chunks:
+                    rebased = sub_chunk.model_copy(update={
+                        "start": chunk.start + sub_chunk.start,
+                        "end": chunk.start + sub_chunk.end,
+                    })
+                    results[rebased.start] = rebased
+                if not retry.chunks:
+                    results[chunk.start] = chunk.model_copy(update={"error": retry.message})
+
+        chunks = [results[start] for start in sorted(results)]
+        for index, chunk in enumerate(chunks):
+            chunk.index = index
+        rows_loaded = sum(chunk.rows_added for chunk in chunks)
+
+        if all(chunk.success for chunk in chunks):
+            return LoadingOutput(status="success", rows_loaded=rows_loaded, chunks=chunks)
+        elif rows_loaded:
+            return LoadingOutput(status="partial", rows_loaded=rows_loaded, chunks=chunks)
         else:
             # Propagate error from the service layer
-            raise Exception(f"Failed to load data: {response.message}")
-            
+            raise Exception(f"Failed to load data: {chunks[0].error}")
+
     except Exception as e:
         # Catch any other exceptions
         raise Exception(f"An error occurred during the loading process: {str(e)}")
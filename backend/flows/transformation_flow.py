@@ -1,5 +1,6 @@
 import genkit
 from genkit.google_ai import google_ai
+from services.llm_cache import cached_generate
 from pydantic import BaseModel, Field
 
 # Pydantic model for the structured output
@@ -21,6 +22,7 @@ def generate_transformation_script_flow(transformation_prompt: str) -> Transform
         Your task is to generate a Python script based on a user's request.
 
         The script MUST contain a function `transform(data)` that takes a single dictionary object as input and returns a transformed dictionary object.
+        Where the logic can be vectorized, ALSO define `transform_batch(df)` that applies the same transformation to a whole pandas DataFrame (one row per record) and returns a DataFrame.
         The script should include necessary imports, primarily `pandas`. Do not include any example usage or calls to the function itself.
 
         User's Transformation Request: "{transformation_prompt}"
@@ -29,14 +31,13 @@ def generate_transformation_script_flow(transformation_prompt: str) -> Transform
     """
 
     llm = google_ai.gemini_pro
-    response = genkit.generate(
+    structured_output = cached_generate(
         model=llm,
         prompt=script_gen_prompt,
         output_schema=TransformScriptGenOutput,
-        config={"temperature": 0.2}
+        config={"temperature": 0.2},
+        flow='generateTransformationScriptFlow'
     )
-    
-    structured_output = response.output
     if not structured_output:
         raise Exception("Failed to generate a valid Python script from the model.")
         
@@ -1,30 +1,91 @@
+import importlib
+import math
 import os
-import genkit
-from flask import Flask, request, jsonify, make_response
+import time
+from flask import Flask, request, jsonify, make_response, g
 from flask_cors import CORS
 from dotenv import load_dotenv
 
-# Import flows
-from flows.domain_flow import define_data_domain_flow
-from flows.ingestion_flow import extract_api_metadata_flow
-from flows.transformation_flow import generate_transformation_script_flow
-from flows.consumption_flow import summarize_record_flow
-from services.firebase_service import store_endpoint_config, get_endpoint_config, insert_data
+from services.firebase_service import store_endpoint_config, get_endpoint_config, insert_data, get_endpoint_config_cache_stats
+from services.ingest_buffer import get_ingest_buffer, submit_to_buffer, BufferFullError
+from services.transform_executor import run_transform, TransformError, TransformTimeoutError
+from services.llm_cache import cache_bypass, get_llm_cache, get_llm_cache_stats, LLM_CACHE_ENABLED
+from services.stream_ingest import stream_format, ingest_stream, failed_offsets, row_ranges
+from services.idempotency import idempotency_fields, record_ids, recent_ids
+from services.rollups import configure_rollups, get_stats, GRANULARITIES
+from services.live_feed import subscribe, FeedFullError, get_live_feed_stats
+from services.rate_limit import ingest_admission
+from services.pull_scheduler import get_pull_scheduler, PullError, PULL_SCHEDULER_ENABLED
+from services.query_service import query_fields, parse_filters, parse_limit, query_rows, iter_ndjson, get_query_cache_stats
+from services.schema_validator import compile_endpoint_schema, validate_records, load_pandas
+from services.schema_inference import infer_schema, infer_upload, sample_format, SampleError
+from services.runtime import get_genkit
+from services.context_store import mcp_session
+from protocols.mcp import mcp_server
+from protocols.a2a import a2a_server
+from services.storage import get_storage
+from services.metrics import (
+    render_metrics, start_trace, finish_trace, timed_stage, observe_stage, UNKNOWN_LABEL,
+    HTTP_REQUEST_SECONDS, RECORDS_INGESTED, RECORDS_REJECTED, INGEST_BYTES, ERRORS
+)
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize Genkit with Google AI plugin
-# Make sure to set GOOGLE_API_KEY in your .env file
-genkit.init(
-    log_level="INFO",
-    plugins=[
-        genkit.google_ai.google_ai(api_key=os.environ.get("GOOGLE_API_KEY")),
-    ],
+# Genkit (with the Google AI plugin) and the flow modules are loaded by the first request
+# that runs a flow; see services/runtime.py. Make sure to set GOOGLE_API_KEY in your .env file.
+# Set STARTUP_WARMUP=true to load them, and open storage and cache clients, before serving.
+STARTUP_WARMUP = os.environ.get('STARTUP_WARMUP', 'false').lower() == 'true'
+
+FLOW_MODULES = (
+    'flows.domain_flow',
+    'flows.ingestion_flow',
+    'flows.transformation_flow',
+    'flows.consumption_flow',
+    'flows.extraction_flow',
 )
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
+app.register_blueprint(mcp_server, url_prefix='/mcp')
+app.register_blueprint(a2a_server, url_prefix='/a2a')
+
+# Request timing: every response is recorded in the latency histogram, errors are counted per route
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    start_trace()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_REQUEST_SECONDS.observe(elapsed, route=route, method=request.method, status=response.status_code)
+    view_args = request.view_args or {}
+    if response.status_code >= 400:
+        # Domain/endpoint labels come from a resolved config (see lookup_endpoint_config), never the raw URL
+        domain, endpoint = g.get('metric_labels') or (
+            UNKNOWN_LABEL if 'domain' in view_args else '', UNKNOWN_LABEL if 'endpoint_id' in view_args else ''
+        )
+        ERRORS.inc(route=route, domain=domain, endpoint=endpoint, status=response.status_code)
+    finish_trace(route=route, method=request.method, status=response.status_code,
+                 total_ms=round(elapsed * 1000, 3), **view_args)
+    return response
+
+# Helper to look up an endpoint config, timing the lookup. Metrics only carry a request's domain/endpoint
+# labels once its config has resolved; before that they use UNKNOWN_LABEL, so requests for made-up
+# endpoints cannot create new time series. Returns the config, or None when there is none.
+def lookup_endpoint_config(domain, endpoint_id):
+    started = time.perf_counter()
+    config_response = get_endpoint_config(domain, endpoint_id)
+    config = config_response.config if config_response.success else None
+    if config:
+        g.metric_labels = (domain, endpoint_id)
+    observe_stage('config_lookup', time.perf_counter() - started, *g.get('metric_labels', (UNKNOWN_LABEL, UNKNOWN_LABEL)))
+    return config
 
 # Helper to build responses from flow outputs
 def build_response(result):
@@ -36,6 +97,30 @@ def build_response(result):
 def build_error_response(message, status_code):
     return jsonify({"status": "error", "message": message}), status_code
 
+# 429 for a throttled ingest request; Retry-After is rounded up to whole seconds
+def build_throttle_response(throttle):
+    response, status_code = build_error_response(throttle.message, 429)
+    response.headers['Retry-After'] = str(max(1, math.ceil(throttle.retry_after)))
+    return response, status_code
+
+# Helper to run a Genkit flow, importing its module on first use
+def run_flow(module_name, flow_name, flow_input):
+    genkit = get_genkit()
+    flow = getattr(importlib.import_module(module_name), flow_name)
+    return genkit.run(flow, flow_input)
+
+# Helper to read the LLM cache bypass flag ("bypassCache": true in the body, or ?bypassCache=true)
+def wants_cache_bypass(data):
+    if isinstance(data, dict) and data.get('bypassCache') is True:
+        return True
+    return request.args.get('bypassCache', '').lower() == 'true'
+
+# Helper to read the MCP context session of a flow request ("sessionId" in the body, or an X-Session-Id header)
+def request_session_id(data):
+    if isinstance(data, dict) and isinstance(data.get('sessionId'), str):
+        return data['sessionId']
+    return request.headers.get('X-Session-Id')
+
 # API Endpoint to define a data domain
 @app.route('/define-data-domain', methods=['POST'])
 def define_data_domain_route():
@@ -44,26 +129,78 @@ def define_data_domain_route():
         prompt = data.get('prompt')
         if not prompt:
             return build_error_response("Request body must include 'prompt'.", 400)
-        result = genkit.run(define_data_domain_flow, prompt)
+        with cache_bypass(wants_cache_bypass(data)):
+            result = run_flow('flows.domain_flow', 'define_data_domain_flow', prompt)
         return build_response(result)
     except Exception as e:
         print(f"Error in /define-data-domain: {e}")
         return build_error_response(f"An unexpected error occurred: {e}", 500)
 
+# Infers a schema from the request's sample, if it has one: an uploaded file (multipart field
+# 'file') or sample records ("samples" in a JSON body). Returns (schema or None, ingestionType hint).
+def infer_request_sample(data):
+    upload = request.files.get('file')
+    if upload is not None:
+        fmt = sample_format(upload.filename, upload.mimetype)
+        return infer_upload(upload.stream, fmt, upload.filename), 'FileUpload'
+    samples = data.get('samples') if isinstance(data, dict) else None
+    if samples:
+        return infer_schema(samples if isinstance(samples, list) else [samples]), data.get('ingestionType')
+    return None, None
+
 # API Endpoint to extract metadata from a data source description
 @app.route('/extract-api-metadata', methods=['POST'])
 def extract_api_metadata_route():
     try:
-        data = request.get_json()
+        # Multipart uploads carry the prompt as a form field next to the file
+        data = request.form.to_dict() if request.files else request.get_json()
         prompt = data.get('prompt')
         if not prompt:
             return build_error_response("Request body must include a 'prompt'.", 400)
-        result = genkit.run(extract_api_metadata_flow, prompt)
+        try:
+            inferred, ingestion_type = infer_request_sample(data)
+        except SampleError as e:
+            return build_error_response(str(e), 400)
+        with cache_bypass(wants_cache_bypass(data)), mcp_session(request_session_id(data)):
+            if inferred is None:
+                result = run_flow('flows.ingestion_flow', 'extract_api_metadata_flow', prompt)
+            else:
+                # The schema comes from the sample; the model only writes the descriptive fields
+                result = run_flow('flows.ingestion_flow', 'extract_api_metadata_from_sample_flow', {
+                    "prompt": prompt, "schema_str": inferred.schema_str(),
+                    "column_summary": inferred.summary(), "ingestionType": ingestion_type
+                })
         return build_response(result)
     except Exception as e:
         print(f"Error in /extract-api-metadata: {e}")
         return build_error_response(f"An unexpected error occurred: {e}", 500)
 
+# Schema and column profile of a sample file or payloads, inferred locally without the model
+@app.route('/infer-schema', methods=['POST'])
+def infer_schema_route():
+    try:
+        if request.files:
+            data = {}
+        elif request.mimetype == 'application/json':
+            data = request.get_json()
+        else:
+            # A raw CSV or NDJSON body
+            fmt = sample_format(None, request.mimetype)
+            data = None
+        try:
+            if data is None:
+                inferred = infer_upload(request.stream, fmt)
+            else:
+                inferred, _ = infer_request_sample(data)
+        except SampleError as e:
+            return build_error_response(str(e), 400)
+        if inferred is None:
+            return build_error_response("Send a file (multipart field 'file'), a CSV/NDJSON body or {\"samples\": [...]}.", 400)
+        return jsonify({"schema": inferred.schema_str(), **inferred.model_dump()})
+    except Exception as e:
+        print(f"Error in /infer-schema: {e}")
+        return build_error_response(f"An unexpected error occurred: {e}", 500)
+
 # API Endpoint to generate a Python transformation script
 @app.route('/generate-transformation-script', methods=['POST'])
 def generate_transformation_script_route():
@@ -72,7 +209,8 @@ def generate_transformation_script_route():
         transformation_prompt = data.get('transformationPrompt')
         if not transformation_prompt:
             return build_error_response("Request body must include 'transformationPrompt'.", 400)
-        result = genkit.run(generate_transformation_script_flow, transformation_prompt)
+        with cache_bypass(wants_cache_bypass(data)):
+            result = run_flow('flows.transformation_flow', 'generate_transformation_script_flow', transformation_prompt)
         return build_response(result)
     except Exception as e:
         print(f"Error in /generate-transformation-script: {e}")
@@ -87,6 +225,8 @@ def store_endpoint_config_route():
             return build_error_response("Request body must be a valid JSON.", 400)
         response = store_endpoint_config(config_data)
         if response.success:
+            if config_data.get('pull'):
+                get_pull_scheduler().refresh_soon()
             return jsonify({"status": "success", "message": response.message})
         else:
             return build_error_response(response.message, 500)
@@ -101,52 +241,359 @@ def summarize_record_route():
         record_data = request.get_json()
         if not record_data:
             return build_error_response("Request body must be a valid JSON record.", 400)
-        result = genkit.run(summarize_record_flow, record_data)
+        with mcp_session(request_session_id(record_data)):
+            result = run_flow('flows.consumption_flow', 'summarize_record_flow', record_data)
         return build_response(result)
     except Exception as e:
         print(f"Error in /summarize-record: {e}")
         return build_error_response(f"An unexpected error occurred: {e}", 500)
 
+# API Endpoint to summarize many ingested records with packed, concurrent model calls
+@app.route('/summarize-records', methods=['POST'])
+def summarize_records_route():
+    try:
+        batch_data = request.get_json()
+        if not batch_data or not isinstance(batch_data.get('records'), list):
+            return build_error_response("Request body must include a 'records' list.", 400)
+        result = run_flow('flows.consumption_flow', 'summarize_records_flow', batch_data)
+        return build_response(result)
+    except Exception as e:
+        print(f"Error in /summarize-records: {e}")
+        return build_error_response(f"An unexpected error occurred: {e}", 500)
+
 # Dynamic data ingestion endpoint
 @app.route('/ingest/<domain>/<endpoint_id>', methods=['POST'])
 def ingest_data_route(domain: str, endpoint_id: str):
     try:
         # 1. Get the configuration for this endpoint
-        config_response = get_endpoint_config(domain, endpoint_id)
-        if not config_response.success or not config_response.config:
+        config = lookup_endpoint_config(domain, endpoint_id)
+        if not config:
             return build_error_response(f"Endpoint '{domain}/{endpoint_id}' not found or configured.", 404)
-        
-        config = config_response.config
+
+        # Refuse floods before doing any work: endpoint and domain token buckets, then the adaptive concurrency limit
+        throttle = ingest_admission.admit(domain, endpoint_id, config)
+        if throttle:
+            return build_throttle_response(throttle)
+        try:
+            return ingest_records_route(domain, endpoint_id, config)
+        finally:
+            ingest_admission.release()
+    except Exception as e:
+        print(f"Error in /ingest/{domain}/{endpoint_id}: {e}")
+        return build_error_response(f"An error occurred during ingestion: {e}", 500)
+
+# The ingest pipeline for one admitted request: parse, transform, validate, then insert or buffer
+def ingest_records_route(domain: str, endpoint_id: str, config: dict):
+    write_behind = config.get('ingestMode') == 'async' or request.args.get('async', '').lower() == 'true'
+
+    # NDJSON and CSV bodies are parsed incrementally and ingested chunk by chunk
+    fmt = stream_format(request.mimetype)
+    if fmt:
+        return ingest_stream_route(domain, endpoint_id, config, fmt, write_behind)
+
+    with timed_stage('parse', domain, endpoint_id):
         data_list = request.get_json()
+    INGEST_BYTES.inc(request.content_length or 0, domain=domain, endpoint=endpoint_id)
+    
+    # Ensure data is a list
+    if not isinstance(data_list, list):
+        data_list = [data_list]
+    for index, record in enumerate(data_list):
+        if not isinstance(record, dict):
+            return build_error_response(f"Record {index} is not a JSON object.", 400)
+
+    # Request position of each record, used to report failed rows; unknown once a script has reshaped them
+    positions = list(range(len(data_list)))
+
+    # 2. (Optional) Apply transformation
+    # The script runs in the transform worker pool, compiled once per script version
+    if config.get('pythonScript'):
+        positions = None
+        try:
+            with timed_stage('transform', domain, endpoint_id):
+                data_list = run_transform(config['pythonScript'], data_list)
+        except TransformTimeoutError as e:
+            return build_error_response(f"Transformation timed out: {e}", 504)
+        except TransformError as e:
+            return build_error_response(f"Transformation failed: {e}", 422)
+
+    # 3. Enforce the endpoint's schema; invalid rows are split off and reported, not inserted
+    ingest_report = {}
+    schema = compile_endpoint_schema(config)
+    if schema:
+        with timed_stage('validate', domain, endpoint_id):
+            validation = validate_records(schema, data_list)
+        data_list = validation.valid_rows
+        if positions is not None:
+            positions = [positions[index] for index in validation.valid_indexes]
+        RECORDS_REJECTED.inc(validation.rejected_count, domain=domain, endpoint=endpoint_id)
+        if validation.rejected_count:
+            ingest_report = {
+                "rows_rejected": validation.rejected_count,
+                "rejected_rows": [rejection.model_dump() for rejection in validation.rejections]
+            }
+
+    # 4. Insert data into the correct table
+    table_name = config.get('tableName')
+    if not table_name:
+        return build_error_response("Table name not configured for this endpoint.", 500)
+    configure_rollups(domain, table_name, config)
+
+    # Idempotent endpoints derive document IDs from record content so retried requests are not stored twice
+    doc_ids = record_ids(data_list, idempotency_fields(config))
         
-        # Ensure data is a list
-        if not isinstance(data_list, list):
-            data_list = [data_list]
-
-        # 2. (Optional) Apply transformation
-        # Placeholder for transformation logic execution
-        # if config.get('pythonScript'):
-        #     # In a real scenario, you'd execute this script securely
-        #     # For now, we'll just log that it would be applied
-        #     print(f"Transformation script would be applied for {domain}/{endpoint_id}")
-        
-        # 3. Insert data into the correct table
+    # Write-behind mode: spool the records and let the background flusher coalesce them.
+    # Enabled per endpoint with "ingestMode": "async" in its config, or per request with ?async=true.
+    if write_behind:
+        try:
+            with timed_stage('buffer', domain, endpoint_id):
+                accepted = get_ingest_buffer().submit(table_name, data_list, doc_ids, domain=domain)
+        except BufferFullError as e:
+            response, status_code = build_error_response(str(e), 503)
+            response.headers['Retry-After'] = '1'
+            return response, status_code
+        RECORDS_INGESTED.inc(accepted, domain=domain, endpoint=endpoint_id)
+        return jsonify({
+            "status": "accepted",
+            "message": f"Accepted {accepted} records for '{table_name}'.",
+            **ingest_report
+        }), 202
+
+    with timed_stage('insert', domain, endpoint_id):
+        insertion_response = insert_data(table_name, data_list, doc_ids, domain=domain)
+    if doc_ids is not None:
+        ingest_report["duplicates_skipped"] = insertion_response.duplicates_skipped
+    RECORDS_INGESTED.inc(insertion_response.rows_added, domain=domain, endpoint=endpoint_id)
+    if not insertion_response.success:
+        if insertion_response.rows_added:
+            # Partial failure: report which request rows did not land so the publisher resends only those.
+            # After a transformation script only idempotent endpoints can say which, by document ID.
+            failed = failed_offsets(insertion_response, len(data_list))
+            if positions is not None:
+                ingest_report["failed_rows"] = row_ranges(positions[offset] for offset in failed)
+            elif doc_ids is not None:
+                ingest_report["failed_record_ids"] = [doc_ids[offset] for offset in failed]
+            return jsonify({
+                "status": "partial",
+                "message": f"Failed to insert data: {insertion_response.message}",
+                "rows_added": insertion_response.rows_added,
+                **ingest_report
+            }), 500
+        return build_error_response(f"Failed to insert data: {insertion_response.message}", 500)
+
+    return jsonify({
+        "status": "success", 
+        "message": f"Successfully ingested {insertion_response.rows_added} records into '{table_name}'.",
+        **ingest_report
+    })
+
+
+# Streaming ingestion for NDJSON/CSV bodies (optionally gzip-compressed)
+def ingest_stream_route(domain: str, endpoint_id: str, config: dict, fmt: str, write_behind: bool):
+    table_name = config.get('tableName')
+    if not table_name:
+        return build_error_response("Table name not configured for this endpoint.", 500)
+    configure_rollups(domain, table_name, config)
+
+    sink = submit_to_buffer if write_behind else insert_data
+
+    with timed_stage('stream', domain, endpoint_id):
+        result = ingest_stream(
+            request.stream,
+            fmt,
+            table_name,
+            script=config.get('pythonScript'),
+            schema=compile_endpoint_schema(config),
+            gzipped=request.headers.get('Content-Encoding', '').lower() == 'gzip',
+            sink=sink,
+            label=f"{domain}/{endpoint_id}",
+            key_fields=idempotency_fields(config),
+            domain=domain,
+        )
+    INGEST_BYTES.inc(result.bytes_read, domain=domain, endpoint=endpoint_id)
+    RECORDS_INGESTED.inc(result.rows_added, domain=domain, endpoint=endpoint_id)
+    RECORDS_REJECTED.inc(result.rows_rejected, domain=domain, endpoint=endpoint_id)
+    body = {"status": "success" if result.success else "partial", **result.model_dump()}
+    if result.success:
+        return jsonify(body), 202 if write_behind else 200
+    return jsonify(body), 500
+
+# Read API: one page of an endpoint's rows as NDJSON, newest first. Filter with ?field=value or
+# ?field__gte=value on the config's "queryFields", project with ?fields=a,b and page with the
+# cursor from the X-Next-Cursor header.
+@app.route('/query/<domain>/<endpoint_id>', methods=['GET'])
+def query_route(domain: str, endpoint_id: str):
+    try:
+        config = lookup_endpoint_config(domain, endpoint_id)
+        if not config:
+            return build_error_response(f"Endpoint '{domain}/{endpoint_id}' not found or configured.", 404)
         table_name = config.get('tableName')
         if not table_name:
             return build_error_response("Table name not configured for this endpoint.", 500)
-            
-        insertion_response = insert_data(table_name, data_list)
-        if not insertion_response.success:
-            return build_error_response(f"Failed to insert data: {insertion_response.message}", 500)
 
-        return jsonify({
-            "status": "success", 
-            "message": f"Successfully ingested {insertion_response.rows_added} records into '{table_name}'."
-        })
+        order = request.args.get('order', 'desc').lower()
+        if order not in ('asc', 'desc'):
+            return build_error_response("order must be 'asc' or 'desc'.", 400)
+        fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+        try:
+            with timed_stage('query', domain, endpoint_id):
+                page = query_rows(
+                    table_name,
+                    filters=parse_filters(request.args.to_dict(), query_fields(config)),
+                    limit=parse_limit(request.args.get('limit')),
+                    cursor=request.args.get('cursor') or None,
+                    fields=fields or None,
+                    descending=order == 'desc',
+                )
+        except ValueError as e:
+            return build_error_response(str(e), 400)
 
+        response = app.response_class(iter_ndjson(page.rows), mimetype='application/x-ndjson')
+        response.headers['X-Result-Count'] = str(len(page.rows))
+        response.headers['X-Cache'] = 'HIT' if page.cached else 'MISS'
+        if page.next_cursor:
+            response.headers['X-Next-Cursor'] = page.next_cursor
+        return response
     except Exception as e:
-        print(f"Error in /ingest/{domain}/{endpoint_id}: {e}")
-        return build_error_response(f"An error occurred during ingestion: {e}", 500)
+        print(f"Error in /query/{domain}/{endpoint_id}: {e}")
+        return build_error_response(f"An error occurred during the query: {e}", 500)
+
+# Live feed of a domain's newly ingested records as Server-Sent Events. Resumes after the
+# Last-Event-ID header (or ?lastEventId=) while those events are still buffered. Under
+# asgi.py this path is served by the event loop instead, so idle connections hold no thread.
+@app.route('/stream/<domain>', methods=['GET'])
+def stream_route(domain: str):
+    try:
+        subscription = subscribe(domain, request.headers.get('Last-Event-ID') or request.args.get('lastEventId'))
+    except FeedFullError as e:
+        response, status_code = build_error_response(str(e), 503)
+        response.headers['Retry-After'] = '5'
+        return response, status_code
+    response = app.response_class(iter(subscription), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(subscription.close)
+    return response
+
+# Live feed subscribers and per-domain publish/skip counters
+@app.route('/stream-stats', methods=['GET'])
+def stream_stats_route():
+    return jsonify(get_live_feed_stats())
+
+# Fetches a stored RestAPI source once and returns a preview of its records, without ingesting them.
+# Only URLs from stored endpoint configs are fetched, so callers cannot point the server at arbitrary hosts.
+@app.route('/preview-extraction', methods=['POST'])
+def preview_extraction_route():
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not data.get('domain') or not data.get('endpointId'):
+            return build_error_response("Request body must include 'domain' and 'endpointId' of a stored endpoint config.", 400)
+        config = lookup_endpoint_config(data['domain'], data['endpointId'])
+        if not config:
+            return build_error_response(f"Endpoint '{data['domain']}/{data['endpointId']}' not found or configured.", 404)
+        result = run_flow('flows.extraction_flow', 'extraction_flow',
+                          {"source_type": data.get('sourceType', 'RestAPI'), "config": config})
+        return build_response(result)
+    except Exception as e:
+        print(f"Error in /preview-extraction: {e}")
+        return build_error_response(f"An unexpected error occurred: {e}", 500)
+
+# Polls a configured RestAPI endpoint now instead of waiting for its next scheduled poll
+@app.route('/pull/<domain>/<endpoint_id>', methods=['POST'])
+def pull_now_route(domain: str, endpoint_id: str):
+    try:
+        config = lookup_endpoint_config(domain, endpoint_id)
+        if not config:
+            return build_error_response(f"Endpoint '{domain}/{endpoint_id}' not found or configured.", 404)
+        try:
+            result = get_pull_scheduler().poll_endpoint(config)
+        except PullError as e:
+            return build_error_response(str(e), 400)
+        return jsonify(result.model_dump()), 200 if result.outcome != 'error' else 502
+    except Exception as e:
+        print(f"Error in /pull/{domain}/{endpoint_id}: {e}")
+        return build_error_response(f"An unexpected error occurred: {e}", 500)
+
+# Pull scheduler sources, next poll times and last outcomes
+@app.route('/pull/status', methods=['GET'])
+def pull_status_route():
+    return jsonify(get_pull_scheduler().stats())
+
+# Cache counters, used to size the caches
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats_route():
+    return jsonify({
+        "endpoint_config_cache": get_endpoint_config_cache_stats(),
+        "llm_cache": get_llm_cache_stats(),
+        "idempotency": recent_ids.stats(),
+        "query_cache": get_query_cache_stats()
+    })
+
+# Prometheus scrape endpoint: request/stage latency histograms, ingest counters, cache gauges
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    response = make_response(render_metrics())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+# Dashboard aggregates: records per domain/table per hour or day, with sum/min/max of each
+# endpoint's "rollupFields". `since` and `until` are bucket labels (2024-05-01 or 2024-05-01T13:00:00Z).
+@app.route('/stats', methods=['GET'])
+def stats_route():
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return build_error_response(f"granularity must be one of {', '.join(GRANULARITIES)}.", 400)
+    try:
+        return jsonify(get_stats(
+            granularity,
+            domain=request.args.get('domain') or None,
+            since=request.args.get('since') or None,
+            until=request.args.get('until') or None,
+        ))
+    except Exception as e:
+        print(f"Error in /stats: {e}")
+        return build_error_response(f"An unexpected error occurred: {e}", 500)
+
+# Ingest rate limit buckets and the adaptive concurrency limit, used to tune quotas
+@app.route('/throttle-stats', methods=['GET'])
+def throttle_stats_route():
+    return jsonify(ingest_admission.stats())
+
+# Write-behind ingest buffer counters
+@app.route('/ingest-buffer/stats', methods=['GET'])
+def ingest_buffer_stats_route():
+    return jsonify(get_ingest_buffer().stats())
+
+# Optional pre-initialization so the first requests do not pay for imports and client setup.
+# Under gunicorn --preload this runs once in the master: the imported modules are shared with
+# the workers, and each worker re-creates the clients it needs after fork.
+def warm_up():
+    timings = {}
+    def step(name, fn):
+        started = time.perf_counter()
+        fn()
+        timings[name] = round(time.perf_counter() - started, 4)
+
+    step('genkit', get_genkit)
+    for module_name in FLOW_MODULES:
+        step(module_name, lambda: importlib.import_module(module_name))
+    step('storage', get_storage)
+    if LLM_CACHE_ENABLED:
+        step('llm_cache', get_llm_cache)
+    step('pandas', load_pandas)
+    print(f"Warm-up finished: {timings}")
+    return timings
+
+# Spawned child processes (transform workers) re-import this file as __mp_main__ when it is
+# run as a script; startup work belongs to the serving process only.
+SERVING_PROCESS = __name__ != '__mp_main__'
+
+if STARTUP_WARMUP and SERVING_PROCESS:
+    warm_up()
+
+# Scheduled pulls from RestAPI sources; enable in exactly one process
+if PULL_SCHEDULER_ENABLED and SERVING_PROCESS:
+    get_pull_scheduler()
 
 
 if __name__ == '__main__':
@@ -1,15 +1,74 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
+
+from services.a2a_broker import get_broker, A2A_MAX_BATCH
 
 # Agent2Agent (A2A) Protocol Blueprint
-# This is a placeholder for a more complex agent-to-agent communication protocol.
+# Agents exchange messages through the in-process broker in services/a2a_broker.py: batched
+# sends, and long-polling receives that wait for messages instead of being retried in a loop.
+# Under asgi.py, GET /a2a/receive is served on the event loop instead of by this route.
 a2a_server = Blueprint('a2a', __name__)
 
+
+def _error(message, status_code, headers=None):
+    response = jsonify({"status": "error", "message": message})
+    response.headers.update(headers or {})
+    return response, status_code
+
+
+def parse_receive_args(args):
+    """
+    (agent_id, max messages, timeout seconds) from the /receive query string.
+    Raises ValueError for a missing agent_id or a bad number.
+    """
+    agent_id = args.get('agent_id')
+    if not agent_id:
+        raise ValueError("Query string must include 'agent_id'.")
+    max_messages = int(args.get('max', A2A_MAX_BATCH))
+    timeout = float(args.get('timeout', 0))
+    if max_messages < 1 or timeout < 0:
+        raise ValueError("'max' must be positive and 'timeout' must not be negative.")
+    return agent_id, min(max_messages, A2A_MAX_BATCH), timeout
+
+
 @a2a_server.route('/send', methods=['POST'])
 def send_message():
-    # Logic for one agent to send a message to another
-    return jsonify({"status": "message sent"})
+    # Body: one message {"from", "to", "type"?, "payload"} or {"messages": [...]}
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return _error("Request body must be a JSON object.", 400)
+    messages = data['messages'] if isinstance(data.get('messages'), list) else [data]
+    if len(messages) > A2A_MAX_BATCH:
+        return _error(f"At most {A2A_MAX_BATCH} messages per request.", 413)
+    for index, message in enumerate(messages):
+        if not isinstance(message, dict) or not isinstance(message.get('to'), str) or not message['to']:
+            return _error(f"Message {index} needs a 'to' agent ID.", 400)
+
+    result = get_broker().send(messages)
+    body = {
+        "status": "message sent" if not result.rejected else "partially sent",
+        "accepted": len(result.accepted),
+        "message_ids": result.accepted,
+        "rejected": [rejection._asdict() for rejection in result.rejected],
+    }
+    if not result.accepted:
+        # Every recipient queue is full: the sender should back off
+        response = jsonify({**body, "status": "error", "message": "No messages were accepted."})
+        response.headers['Retry-After'] = '1'
+        return response, 429
+    return jsonify(body)
+
 
 @a2a_server.route('/receive', methods=['GET'])
 def receive_message():
-    # Logic for an agent to check for and receive messages
-    return jsonify({"message": "pong"})
+    # ?agent_id=...&max=100&timeout=25 waits up to `timeout` seconds for messages
+    try:
+        agent_id, max_messages, timeout = parse_receive_args(request.args)
+    except ValueError as e:
+        return _error(str(e), 400)
+    messages = get_broker().receive(agent_id, max_messages, timeout)
+    return jsonify({"agent_id": agent_id, "messages": messages})
+
+
+@a2a_server.route('/stats', methods=['GET'])
+def broker_stats():
+    return jsonify(get_broker().stats())
@@ -1,16 +1,70 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
+
+from services.context_store import get_context_store, new_session_id, PinnedBudgetError, ROLES
 
 # Model Context Protocol (MCP) Blueprint
-# This protocol would manage the context for different AI models,
-# allowing for stateful interactions and context sharing.
+# Manages per-session context for the AI flows, allowing for stateful interactions and
+# context sharing. Sessions live in services/context_store.py; flows pick one up when the
+# request carries a sessionId.
 mcp_server = Blueprint('mcp', __name__)
 
+
+def _error(message, status_code):
+    return jsonify({"status": "error", "message": message}), status_code
+
+
 @mcp_server.route('/context', methods=['GET'])
 def get_context():
-    # In a real implementation, this would retrieve context for a given session/model
-    return jsonify({"context_id": "ctx_123", "data": "some_context"})
+    session_id = request.args.get('session_id')
+    if not session_id:
+        return _error("Query string must include 'session_id'.", 400)
+    session = get_context_store().get(session_id)
+    if session is None:
+        return _error(f"Session '{session_id}' not found or expired.", 404)
+    session["context"] = get_context_store().render(session_id)
+    return jsonify(session)
+
 
 @mcp_server.route('/context', methods=['POST'])
 def update_context():
-    # In a real implementation, this would update the context
-    return jsonify({"status": "context updated"})
+    # Body: {"session_id"?, "role", "content", "pinned"?} or {"session_id"?, "entries": [...]}
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return _error("Request body must be a JSON object.", 400)
+    entries = data.get('entries') if isinstance(data.get('entries'), list) else [data]
+    for entry in entries:
+        if not isinstance(entry, dict) or not isinstance(entry.get('content'), str) or not entry['content']:
+            return _error("Each entry needs a non-empty 'content' string.", 400)
+        if entry.get('role', 'user') not in ROLES:
+            return _error(f"'role' must be one of {', '.join(ROLES)}.", 400)
+
+    session_id = data.get('session_id') or new_session_id()
+    store = get_context_store()
+    for entry in entries:
+        try:
+            session = store.append(session_id, entry.get('role', 'user'), entry['content'], pinned=entry.get('pinned') is True)
+        except PinnedBudgetError as e:
+            # Entries before this one stay applied, so the session ID is part of the message
+            return _error(f"{e} (session '{session_id}')", 400)
+    return jsonify({
+        "status": "context updated",
+        "session_id": session_id,
+        "tokens": session.tokens,
+        "token_budget": session.token_budget,
+        "trimmed": session.trimmed,
+    })
+
+
+@mcp_server.route('/context', methods=['DELETE'])
+def delete_context():
+    session_id = request.args.get('session_id')
+    if not session_id:
+        return _error("Query string must include 'session_id'.", 400)
+    if not get_context_store().delete(session_id):
+        return _error(f"Session '{session_id}' not found.", 404)
+    return jsonify({"status": "context deleted", "session_id": session_id})
+
+
+@mcp_server.route('/stats', methods=['GET'])
+def context_stats():
+    return jsonify(get_context_store().stats())
@@ -0,0 +1,308 @@
+import asyncio
+import fcntl
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from services.metrics import Gauge
+
+# In-process message broker behind the A2A blueprint. Every agent has a bounded FIFO queue;
+# senders post batches, and receivers long-poll: a receive with nothing queued parks until
+# a message arrives or its timeout passes, so an idle agent costs one waiting request
+# instead of a stream of empty polls. Threads wait on a per-agent condition; event loops
+# (see asgi.py) wait on an asyncio.Event, so idle async receivers hold no thread.
+# A queue exists only while it holds messages or has a receiver waiting on it, so polling
+# for unknown agents leaves nothing behind.
+# With A2A_LOG_PATH set, sends and deliveries are appended to a JSON-lines log that is
+# replayed at startup, so undelivered messages survive a restart. Each process holds an
+# exclusive lock on the log it writes; when A2A_LOG_PATH is taken by another live worker,
+# the process uses the first free numbered slot (A2A_LOG_PATH.1, .2, ...) instead.
+A2A_QUEUE_SIZE = int(os.environ.get('A2A_QUEUE_SIZE', 1000))
+A2A_MAX_AGENTS = int(os.environ.get('A2A_MAX_AGENTS', 10000))
+A2A_MAX_BATCH = int(os.environ.get('A2A_MAX_BATCH', 500))  # Messages per send or receive call
+A2A_MAX_WAIT = float(os.environ.get('A2A_MAX_WAIT', 30.0))  # Longest allowed long-poll
+A2A_LOG_PATH = os.environ.get('A2A_LOG_PATH', '')  # Empty = messages live in memory only
+A2A_LOG_COMPACT_BYTES = int(os.environ.get('A2A_LOG_COMPACT_BYTES', 64 * 1024 * 1024))
+
+
+class Rejection(NamedTuple):
+    index: int  # Position of the message in the send batch
+    to: str
+    reason: str
+
+
+class SendResult(NamedTuple):
+    accepted: List[int]  # Message IDs, in batch order
+    rejected: List[Rejection]
+
+
+class _AgentQueue:
+    def __init__(self, lock: threading.Lock):
+        self.messages: Deque[Dict[str, Any]] = deque()
+        self.ready = threading.Condition(lock)
+        self.loop_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+        self.thread_waiters = 0
+
+    def idle(self) -> bool:
+        return not self.messages and not self.thread_waiters and not self.loop_waiters
+
+
+class MessageLog:
+    """
+    Append-only JSON-lines log: {"op": "send", "msg": {...}} and {"op": "ack", "agent", "through"}.
+    """
+
+    def __init__(self, path: str):
+        self.path, self._lock_fd = self._claim(path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    @staticmethod
+    def _claim(path: str) -> Tuple[str, int]:
+        # The lock lives in a side file because compaction replaces the log file itself.
+        # A slot whose lock is free belongs to no live process, so its log is safe to replay.
+        for slot in itertools.count():
+            candidate = path if slot == 0 else f"{path}.{slot}"
+            fd = os.open(candidate + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            return candidate, fd
+
+    def replay(self) -> List[Dict[str, Any]]:
+        # Messages sent but not yet delivered, in send order
+        pending: Dict[str, Deque[Dict[str, Any]]] = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A torn last line from a crash
+                if entry.get('op') == 'send':
+                    message = entry['msg']
+                    pending.setdefault(message['to'], deque()).append(message)
+                elif entry.get('op') == 'ack':
+                    queue = pending.get(entry['agent'])
+                    while queue and queue[0]['id'] <= entry['through']:
+                        queue.popleft()
+        return sorted((message for queue in pending.values() for message in queue), key=lambda m: m['id'])
+
+    def append(self, entries: List[Dict[str, Any]]) -> None:
+        # One write per batch; flushed to the OS, not fsynced
+        self._file.write(''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries))
+        self._file.flush()
+
+    def size(self) -> int:
+        return self._file.tell()
+
+    def rewrite(self, pending: List[Dict[str, Any]]) -> None:
+        # Compaction: the log is replaced by one send entry per undelivered message
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for message in pending:
+                f.write(json.dumps({"op": "send", "msg": message}, separators=(',', ':')) + '\n')
+        self._file.close()
+        os.replace(temp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self) -> None:
+        self._file.close()
+        os.close(self._lock_fd)
+
+
+class MessageBroker:
+    """
+    Per-agent bounded queues with batched send, batched receive and long-poll waits.
+    """
+
+    def __init__(self, queue_size: int = A2A_QUEUE_SIZE, max_agents: int = A2A_MAX_AGENTS,
+                 log_path: str = A2A_LOG_PATH, compact_bytes: int = A2A_LOG_COMPACT_BYTES):
+        self.queue_size = queue_size
+        self.max_agents = max_agents
+        self.compact_bytes = compact_bytes
+        self._lock = threading.Lock()
+        self._agents: Dict[str, _AgentQueue] = {}
+        self._last_id = 0
+        self.sent = 0
+        self.delivered = 0
+        self.rejected = 0
+        self.log = MessageLog(log_path) if log_path else None
+        if self.log is not None:
+            for message in self.log.replay():
+                self._agents.setdefault(message['to'], _AgentQueue(self._lock)).messages.append(message)
+                self._last_id = message['id']
+            self.log.rewrite(self._pending())
+
+    def _pending(self) -> List[Dict[str, Any]]:
+        return sorted((message for agent in self._agents.values() for message in agent.messages), key=lambda m: m['id'])
+
+    def _queue(self, agent_id: str, create: bool) -> Optional[_AgentQueue]:
+        agent = self._agents.get(agent_id)
+        if agent is None and create and len(self._agents) < self.max_agents:
+            agent = self._agents[agent_id] = _AgentQueue(self._lock)
+        return agent
+
+    def _discard_if_idle(self, agent_id: str, agent: _AgentQueue) -> None:
+        # Called with the lock held; an empty queue with no waiters carries no state
+        if agent.idle() and self._agents.get(agent_id) is agent:
+            del self._agents[agent_id]
+
+    def send(self, messages: List[Dict[str, Any]]) -> SendResult:
+        """
+        Queues a batch of {"from", "to", "type"?, "payload"} messages. Messages to a full
+        queue (or to a new agent once A2A_MAX_AGENTS exist) are rejected; the rest are queued.
+        """
+        accepted, rejected, logged = [], [], []
+        woken: Dict[str, _AgentQueue] = {}
+        now = time.time()
+        with self._lock:
+            for index, message in enumerate(messages):
+                to = message['to']
+                agent = self._queue(to, create=True)
+                if agent is None:
+                    rejected.append(Rejection(index, to, 'too_many_agents'))
+                    continue
+                if len(agent.messages) >= self.queue_size:
+                    rejected.append(Rejection(index, to, 'queue_full'))
+                    continue
+                self._last_id += 1
+                queued = {"id": self._last_id, "from": message.get('from'), "to": to,
+                          "type": message.get('type', 'message'), "payload": message.get('payload'), "sent_at": now}
+                agent.messages.append(queued)
+                accepted.append(self._last_id)
+                woken[to] = agent
+                if self.log is not None:
+                    logged.append({"op": "send", "msg": queued})
+            if logged:
+                self.log.append(logged)
+            self.sent += len(accepted)
+            self.rejected += len(rejected)
+            for agent in woken.values():
+                agent.ready.notify_all()
+                for loop, event in agent.loop_waiters:
+                    try:
+                        loop.call_soon_threadsafe(event.set)
+                    except RuntimeError:
+                        pass  # The loop has been closed
+        return SendResult(accepted, rejected)
+
+    def _take(self, agent_id: str, agent: _AgentQueue, max_messages: int) -> List[Dict[str, Any]]:
+        # Called with the lock held
+        count = min(max_messages, len(agent.messages))
+        batch = [agent.messages.popleft() for _ in range(count)]
+        if batch:
+            self.delivered += len(batch)
+            if self.log is not None:
+                self.log.append([{"op": "ack", "agent": agent_id, "through": batch[-1]['id']}])
+                if self.log.size() > self.compact_bytes:
+                    self.log.rewrite(self._pending())
+        return batch
+
+    def receive(self, agent_id: str, max_messages: int = A2A_MAX_BATCH, timeout: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        Returns up to `max_messages` queued messages for an agent, waiting up to `timeout`
+        seconds for the first one to arrive. Delivered messages are removed from the queue.
+        """
+        deadline = time.monotonic() + min(timeout, A2A_MAX_WAIT)
+        with self._lock:
+            # Only a receive that will wait needs a queue to wait on
+            agent = self._queue(agent_id, create=timeout > 0)
+            if agent is None:
+                return []
+            agent.thread_waiters += 1
+            try:
+                while not agent.messages:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return []
+                    agent.ready.wait(remaining)
+                return self._take(agent_id, agent, max_messages)
+            finally:
+                agent.thread_waiters -= 1
+                self._discard_if_idle(agent_id, agent)
+
+    async def receive_async(self, agent_id: str, max_messages: int = A2A_MAX_BATCH,
+                            timeout: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        receive() for event loops: waiting costs a suspended coroutine rather than a thread.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + min(timeout, A2A_MAX_WAIT)
+        event = asyncio.Event()
+        with self._lock:
+            agent = self._queue(agent_id, create=timeout > 0)
+            if agent is None:
+                return []
+            waiter = (loop, event)
+            agent.loop_waiters.append(waiter)
+        try:
+            while True:
+                with self._lock:
+                    if agent.messages:
+                        return self._take(agent_id, agent, max_messages)
+                    event.clear()
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return []
+                try:
+                    await asyncio.wait_for(event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._lock:
+                agent.loop_waiters.remove(waiter)
+                self._discard_if_idle(agent_id, agent)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            agents = dict(self._agents)
+            return {
+                "agents": len(agents),
+                "pending": sum(len(agent.messages) for agent in agents.values()),
+                "sent": self.sent,
+                "delivered": self.delivered,
+                "rejected": self.rejected,
+                "waiting_receivers": sum(agent.thread_waiters + len(agent.loop_waiters) for agent in agents.values()),
+                "queue_size": self.queue_size,
+                "log_bytes": self.log.size() if self.log is not None else None,
+            }
+
+    def close(self) -> None:
+        if self.log is not None:
+            self.log.close()
+
+
+_broker: Optional[MessageBroker] = None
+_broker_lock = threading.Lock()
+
+def get_broker() -> MessageBroker:
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = MessageBroker()
+        return _broker
+
+def _reset_after_fork() -> None:
+    # Queues are per process; a forked worker must not share the parent's log handle or
+    # keep the parent's log locked after the parent exits
+    global _broker, _broker_lock
+    if _broker is not None and _broker.log is not None:
+        os.close(_broker.log._lock_fd)
+    _broker = None
+    _broker_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+Gauge(
+    'citypulse_a2a_broker', 'A2A agents, queued messages and messages sent, delivered and rejected.', ('stat',),
+    callback=lambda: {
+        (name,): value for name, value in (_broker.stats().items() if _broker is not None else ())
+        if name in ('agents', 'pending', 'sent', 'delivered', 'rejected', 'waiting_receivers')
+    }
+)
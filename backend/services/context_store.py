@@ -0,0 +1,359 @@
+import contextlib
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from services.metrics import Gauge
+
+# Per-session model context for the MCP blueprint and the flows that use it. Each session
+# holds its entries newest-last and is trimmed as entries are appended, dropping the oldest
+# until it fits CONTEXT_TOKEN_BUDGET, so the context a prompt carries stays the same size
+# however long the session runs. Sessions are evicted least-recently-used once the store
+# passes CONTEXT_STORE_MAX_BYTES or CONTEXT_MAX_SESSIONS, and dropped after CONTEXT_SESSION_TTL
+# idle seconds. With CONTEXT_SPILL_PATH set, evicted sessions are written to SQLite and
+# reloaded on their next use instead of being lost.
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 2000))
+CONTEXT_STORE_MAX_BYTES = int(os.environ.get('CONTEXT_STORE_MAX_BYTES', 64 * 1024 * 1024))
+CONTEXT_MAX_SESSIONS = int(os.environ.get('CONTEXT_MAX_SESSIONS', 10000))
+CONTEXT_SESSION_TTL = float(os.environ.get('CONTEXT_SESSION_TTL', 3600))
+CONTEXT_SPILL_PATH = os.environ.get('CONTEXT_SPILL_PATH', '')  # Empty = evicted sessions are dropped
+# Share of the token budget pinned entries may use; the rest is left for the trimmed history
+CONTEXT_PINNED_SHARE = float(os.environ.get('CONTEXT_PINNED_SHARE', 0.5))
+
+ROLES = ('system', 'user', 'assistant', 'tool')
+_ENTRY_OVERHEAD_BYTES = 64  # Rough per-entry cost on top of its text
+
+
+def estimate_tokens(text: str) -> int:
+    # Same heuristic as the summarize flows' prompt packing
+    return len(text) // 4 + 1
+
+
+class PinnedBudgetError(ValueError):
+    """Raised when a pinned entry would take pinned entries past their share of the budget."""
+
+
+class ContextEntry(BaseModel):
+    role: str
+    content: str
+    tokens: int
+    created_at: float
+    pinned: bool = False  # Pinned entries (e.g. instructions) are never trimmed, only capped
+
+
+class SessionContext:
+    """
+    One session's entries. Trimming is incremental: the token total is kept up to date on
+    every append, and only the entries that no longer fit are popped.
+    """
+
+    def __init__(self, session_id: str, token_budget: int = CONTEXT_TOKEN_BUDGET):
+        self.session_id = session_id
+        self.token_budget = token_budget
+        self.pinned_budget = int(token_budget * CONTEXT_PINNED_SHARE)
+        self.pinned_tokens = 0
+        self.pinned: List[ContextEntry] = []
+        self.entries: Deque[ContextEntry] = deque()
+        self.tokens = 0
+        self.bytes = 0
+        self.trimmed = 0
+        self.last_used = time.time()
+        self._rendered: Optional[str] = None
+
+    def append(self, role: str, content: str, pinned: bool = False) -> None:
+        """
+        Adds an entry and trims the oldest unpinned ones to fit the budget. Raises
+        PinnedBudgetError, without changing the session, if a pinned entry does not fit in
+        what is left of the pinned share.
+        """
+        if pinned:
+            tokens = estimate_tokens(content)
+            if self.pinned_tokens + tokens > self.pinned_budget:
+                raise PinnedBudgetError(
+                    f"Pinned entries may use {self.pinned_budget} of the session's {self.token_budget} tokens; "
+                    f"{self.pinned_tokens} are in use and this entry needs {tokens}."
+                )
+        budget_chars = self.token_budget * 4
+        if len(content) > budget_chars:
+            # An entry larger than the whole budget keeps only its tail
+            content = content[-budget_chars:]
+        entry = ContextEntry(role=role, content=content, tokens=estimate_tokens(content),
+                             created_at=time.time(), pinned=pinned)
+        (self.pinned if pinned else self.entries).append(entry)
+        self._add(entry, 1)
+        while self.tokens > self.token_budget and self.entries:
+            self._add(self.entries.popleft(), -1)
+            self.trimmed += 1
+        self._rendered = None
+
+    def _add(self, entry: ContextEntry, sign: int) -> None:
+        self.tokens += sign * entry.tokens
+        if entry.pinned:
+            self.pinned_tokens += sign * entry.tokens
+        self.bytes += sign * (len(entry.content) + _ENTRY_OVERHEAD_BYTES)
+
+    def render(self) -> str:
+        """
+        The context as prompt text, one "role: content" line per entry, pinned entries first.
+        """
+        if self._rendered is None:
+            self._rendered = "\n".join(f"{entry.role}: {entry.content}" for entry in (*self.pinned, *self.entries))
+        return self._rendered
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "token_budget": self.token_budget,
+            "tokens": self.tokens,
+            "pinned_tokens": self.pinned_tokens,
+            "trimmed": self.trimmed,
+            "last_used": self.last_used,
+            "entries": [entry.model_dump() for entry in (*self.pinned, *self.entries)],
+        }
+
+    @classmethod
+    def from_dict(cls, payload: Dict[str, Any]) -> 'SessionContext':
+        session = cls(payload['session_id'], payload.get('token_budget', CONTEXT_TOKEN_BUDGET))
+        for item in payload.get('entries', []):
+            entry = ContextEntry(**item)
+            (session.pinned if entry.pinned else session.entries).append(entry)
+            session._add(entry, 1)
+        session.trimmed = payload.get('trimmed', 0)
+        session.last_used = payload.get('last_used', session.last_used)
+        return session
+
+
+class ContextSpill:
+    """
+    SQLite table of evicted sessions, keyed by session ID.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS context_sessions ("
+            " session_id TEXT PRIMARY KEY, payload TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS context_sessions_last_used ON context_sessions (last_used)")
+
+    def put(self, session: SessionContext) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO context_sessions (session_id, payload, last_used) VALUES (?, ?, ?)",
+            (session.session_id, json.dumps(session.to_dict(), separators=(',', ':')), session.last_used),
+        )
+
+    def take(self, session_id: str) -> Optional[Dict[str, Any]]:
+        # A reloaded session lives in memory again, so its row is removed
+        row = self._conn.execute("SELECT payload FROM context_sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("DELETE FROM context_sessions WHERE session_id = ?", (session_id,))
+        return json.loads(row[0])
+
+    def delete(self, session_id: str) -> bool:
+        return self._conn.execute("DELETE FROM context_sessions WHERE session_id = ?", (session_id,)).rowcount > 0
+
+    def purge(self, older_than: float) -> int:
+        return self._conn.execute("DELETE FROM context_sessions WHERE last_used < ?", (older_than,)).rowcount
+
+    def count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM context_sessions").fetchone()[0]
+
+
+class ContextStore:
+    """
+    LRU map of sessions with idle TTLs, a memory cap and an optional SQLite spill.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = CONTEXT_TOKEN_BUDGET,
+        max_bytes: int = CONTEXT_STORE_MAX_BYTES,
+        max_sessions: int = CONTEXT_MAX_SESSIONS,
+        ttl: float = CONTEXT_SESSION_TTL,
+        spill_path: str = CONTEXT_SPILL_PATH,
+    ):
+        self.token_budget = token_budget
+        self.max_bytes = max_bytes
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.spill = ContextSpill(spill_path) if spill_path else None
+        self._sessions: "OrderedDict[str, SessionContext]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.spilled = 0
+        self.restored = 0
+
+    def _session(self, session_id: str, create: bool) -> Optional[SessionContext]:
+        # Called with the lock held; returns the live session, reloading it from the spill if needed
+        now = time.time()
+        session = self._sessions.get(session_id)
+        if session is not None and session.last_used + self.ttl <= now:
+            self._drop(session_id)
+            self.expirations += 1
+            session = None
+        if session is None and self.spill is not None:
+            payload = self.spill.take(session_id)
+            if payload is not None and payload.get('last_used', 0) + self.ttl > now:
+                session = SessionContext.from_dict(payload)
+                self._sessions[session_id] = session
+                self._bytes += session.bytes
+                self.restored += 1
+                self._sessions.move_to_end(session_id)
+                self._enforce_limits(keep=session_id)
+        if session is None:
+            if not create:
+                return None
+            session = self._sessions[session_id] = SessionContext(session_id, self.token_budget)
+        self._sessions.move_to_end(session_id)
+        session.last_used = now
+        return session
+
+    def _drop(self, session_id: str) -> Optional[SessionContext]:
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._bytes -= session.bytes
+        return session
+
+    def _enforce_limits(self, keep: str) -> None:
+        # The front of the LRU order is also the longest idle, so expired sessions are swept from there
+        now = time.time()
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_used + self.ttl > now:
+                break
+            self._drop(oldest.session_id)
+            self.expirations += 1
+        while self._sessions and (self._bytes > self.max_bytes or len(self._sessions) > self.max_sessions):
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                break
+            session = self._drop(session_id)
+            self.evictions += 1
+            if self.spill is not None:
+                self.spill.put(session)
+                self.spilled += 1
+                if self.spilled % 1000 == 0:
+                    # Spilled sessions idle past the TTL would never be restored
+                    self.spill.purge(now - self.ttl)
+
+    def append(self, session_id: str, role: str, content: str, pinned: bool = False) -> SessionContext:
+        with self._lock:
+            session = self._session(session_id, create=True)
+            before = session.bytes
+            session.append(role, content, pinned)
+            self._bytes += session.bytes - before
+            self._enforce_limits(keep=session_id)
+            return session
+
+    def render(self, session_id: str) -> str:
+        with self._lock:
+            session = self._session(session_id, create=False)
+            return session.render() if session is not None else ''
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            session = self._session(session_id, create=False)
+            return session.to_dict() if session is not None else None
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            found = self._drop(session_id) is not None
+            if self.spill is not None:
+                found = self.spill.delete(session_id) or found
+            return found
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_sessions": self.max_sessions,
+                "token_budget": self.token_budget,
+                "ttl_seconds": self.ttl,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "spilled": self.spilled,
+                "restored": self.restored,
+                "spill_sessions": self.spill.count() if self.spill is not None else None,
+            }
+
+
+_store: Optional[ContextStore] = None
+_store_lock = threading.Lock()
+
+def get_context_store() -> ContextStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ContextStore()
+        return _store
+
+def _reset_after_fork() -> None:
+    # Sessions are per process, and the spill connection must not cross a fork
+    global _store, _store_lock
+    _store = None
+    _store_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+# Set by routes for the duration of a flow call, like llm_cache.cache_bypass
+_current_session = contextvars.ContextVar('mcp_session', default=None)
+
+
+@contextlib.contextmanager
+def mcp_session(session_id: Optional[str]):
+    """
+    Makes `session_id` the context session for flows run inside the block (None = no session).
+    """
+    token = _current_session.set(session_id or None)
+    try:
+        yield
+    finally:
+        _current_session.reset(token)
+
+
+def session_context() -> str:
+    """
+    The current session's context as prompt text, or '' outside a session.
+    """
+    session_id = _current_session.get()
+    return get_context_store().render(session_id) if session_id else ''
+
+
+def remember(role: str, content: str) -> None:
+    """
+    Appends an entry to the current session, if there is one.
+    """
+    session_id = _current_session.get()
+    if session_id:
+        get_context_store().append(session_id, role, content)
+
+
+Gauge(
+    'citypulse_context_store', 'MCP context sessions, bytes held and sessions evicted, expired, spilled and restored.',
+    ('stat',),
+    callback=lambda: {
+        (name,): value for name, value in (_store.stats().items() if _store is not None else ())
+        if name in ('sessions', 'bytes', 'evictions', 'expirations', 'spilled', 'restored')
+    }
+)
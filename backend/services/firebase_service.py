@@ -1,24 +1,84 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
 import os
 from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
 import uuid
+from services.cache import TTLCache, MISSING
+from services.storage import get_storage
+from services.idempotency import recent_ids
+from services.metrics import Gauge, STORAGE_COMMIT_SECONDS, STORAGE_CONFIG_READ_SECONDS
 
-# Initialize Firebase Admin SDK
-try:
-    if not firebase_admin._apps:
-        cred = credentials.ApplicationDefault()
-        project_id = os.environ.get('GCP_PROJECT_ID', 'citypulse-671aa')
-        
-        firebase_admin.initialize_app(cred, {
-            'projectId': project_id,
-        })
-except Exception as e:
-    print(f"Warning: Failed to initialize Firebase Admin SDK: {e}. Firestore operations will fail.")
-    pass
+# Service layer for endpoint configs and ingested data. Reads and writes go through the
+# storage backend selected by STORAGE_BACKEND (Firestore by default, or local SQLite).
+
+# In-process cache of endpoint configs for the /ingest hot path.
+# Unknown endpoints are negatively cached for a shorter TTL so that floods
+# against a misconfigured URL do not turn into a storage read per request.
+ENDPOINT_CONFIG_CACHE_SIZE = int(os.environ.get('ENDPOINT_CONFIG_CACHE_SIZE', 1024))
+ENDPOINT_CONFIG_CACHE_TTL = float(os.environ.get('ENDPOINT_CONFIG_CACHE_TTL', 300))
+ENDPOINT_CONFIG_NEGATIVE_TTL = float(os.environ.get('ENDPOINT_CONFIG_NEGATIVE_TTL', 30))
+
+_endpoint_config_cache = TTLCache(maxsize=ENDPOINT_CONFIG_CACHE_SIZE, ttl=ENDPOINT_CONFIG_CACHE_TTL)
+_NOT_FOUND = object()
+# Bumped on every invalidation so a read that started before it does not cache a stale config.
+_config_generations: Dict[str, int] = {}
+_config_generations_lock = threading.Lock()
+
+# Large inserts are split into chunks no bigger than the backend's batch limit (500 writes
+# for Firestore) and, where the backend allows it, committed concurrently on a bounded pool.
+INSERT_CHUNK_SIZE = int(os.environ.get('INSERT_CHUNK_SIZE', 0))  # 0 means the backend's batch limit
+INSERT_MAX_WORKERS = int(os.environ.get('INSERT_MAX_WORKERS', 8))
+
+_commit_executor: Optional[ThreadPoolExecutor] = None
+_commit_executor_lock = threading.Lock()
+
+def _get_commit_executor() -> ThreadPoolExecutor:
+    global _commit_executor
+    with _commit_executor_lock:
+        if _commit_executor is None:
+            _commit_executor = ThreadPoolExecutor(max_workers=INSERT_MAX_WORKERS, thread_name_prefix='storage-commit')
+        return _commit_executor
+
+def _reset_after_fork() -> None:
+    # The parent's pool threads do not exist in a forked child
+    global _commit_executor, _commit_executor_lock
+    _commit_executor = None
+    _commit_executor_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+# Callbacks run after every successful commit with (domain, table_name, written rows),
+# e.g. to maintain the ingest rollups in services/rollups.py.
+CommitListener = Callable[[str, str, List[Dict[str, Any]]], None]
+_commit_listeners: List[CommitListener] = []
+
+def add_commit_listener(listener: CommitListener) -> None:
+    if listener not in _commit_listeners:
+        _commit_listeners.append(listener)
+
+# Callbacks run with (seconds, ok) after every commit attempt, e.g. to adapt ingest concurrency
+CommitLatencyObserver = Callable[[float, bool], None]
+_commit_latency_observers: List[CommitLatencyObserver] = []
 
-db = firestore.client()
+def add_commit_latency_observer(observer: CommitLatencyObserver) -> None:
+    if observer not in _commit_latency_observers:
+        _commit_latency_observers.append(observer)
+
+def _observe_commit(seconds: float, ok: bool) -> None:
+    for observer in _commit_latency_observers:
+        try:
+            observer(seconds, ok)
+        except Exception as e:
+            print(f"Commit latency observer failed: {e}")
+
+def _notify_committed(domain: str, table_name: str, rows: List[Dict[str, Any]]) -> None:
+    for listener in _commit_listeners:
+        try:
+            listener(domain, table_name, rows)
+        except Exception as e:
+            print(f"Commit listener failed for '{table_name}': {e}")
 
 # Pydantic models for service responses
 class EndpointConfigResponse(BaseModel):
@@ -26,11 +86,27 @@ class EndpointConfigResponse(BaseModel):
     message: str
     config: Optional[Dict[str, Any]] = None
 
+class ChunkResult(BaseModel):
+    index: int
+    start: int  # Offset of the chunk's first row in the submitted data list
+    end: int  # Offset one past the chunk's last row
+    success: bool
+    rows_added: int = 0
+    duplicates_skipped: int = 0
+    document_ids: List[str] = []
+    error: Optional[str] = None
+
 class DataInsertionResponse(BaseModel):
     success: bool
     message: str
     rows_added: int = 0
+    duplicates_skipped: int = 0  # Rows with a recently written document ID (idempotent inserts only)
     document_ids: List[str] = []
+    chunks: List[ChunkResult] = []
+
+    @property
+    def failed_chunks(self) -> List[ChunkResult]:
+        return [chunk for chunk in self.chunks if not chunk.success]
 
 def store_endpoint_config(config_data: Dict[str, Any]) -> EndpointConfigResponse:
     """
@@ -44,10 +120,8 @@ def store_endpoint_config(config_data: Dict[str, Any]) -> EndpointConfigResponse
             raise ValueError("Config data must include 'domain' and 'endpointId'.")
         
         doc_id = f"{domain}:{endpoint_id}"
-        endpoint_ref = db.collection('__endpoint_configs__').document(doc_id)
-        
-        config_data_with_timestamp = {**config_data, "created_at": firestore.SERVER_TIMESTAMP}
-        endpoint_ref.set(config_data_with_timestamp)
+        get_storage().put_config(doc_id, config_data)
+        invalidate_endpoint_config(domain, endpoint_id)
 
         return EndpointConfigResponse(
             success=True,
@@ -57,23 +131,37 @@ def store_endpoint_config(config_data: Dict[str, Any]) -> EndpointConfigResponse
     except Exception as e:
         return EndpointConfigResponse(success=False, message=str(e))
 
-def get_endpoint_config(domain: str, endpoint_id: str) -> EndpointConfigResponse:
+def get_endpoint_config(domain: str, endpoint_id: str, use_cache: bool = True) -> EndpointConfigResponse:
     """
     Retrieves the configuration for a dynamic endpoint from the '__endpoint_configs__' collection.
+    Lookups are served from the in-process cache when possible; pass use_cache=False to force a read.
     """
     try:
         if not domain or not endpoint_id:
             raise ValueError("Domain and endpointId are required.")
             
         doc_id = f"{domain}:{endpoint_id}"
-        endpoint_ref = db.collection('__endpoint_configs__').document(doc_id)
-        
-        doc = endpoint_ref.get()
-        if doc.exists:
+        cached = _endpoint_config_cache.get(doc_id) if use_cache else MISSING
+        if cached is MISSING:
+            with _config_generations_lock:
+                generation = _config_generations.get(doc_id, 0)
+            storage = get_storage()
+            started = time.perf_counter()
+            cached = storage.get_config(doc_id)
+            STORAGE_CONFIG_READ_SECONDS.observe(time.perf_counter() - started, backend=storage.name)
+            if cached is None:
+                cached = _NOT_FOUND
+            with _config_generations_lock:
+                # Skip the cache when the config was stored or invalidated during the read
+                if _config_generations.get(doc_id, 0) == generation:
+                    ttl = ENDPOINT_CONFIG_NEGATIVE_TTL if cached is _NOT_FOUND else None
+                    _endpoint_config_cache.set(doc_id, cached, ttl=ttl)
+
+        if cached is not _NOT_FOUND:
             return EndpointConfigResponse(
                 success=True,
                 message="Configuration retrieved successfully.",
-                config=doc.to_dict()
+                config=dict(cached)
             )
         else:
             return EndpointConfigResponse(
@@ -83,10 +171,92 @@ def get_endpoint_config(domain: str, endpoint_id: str) -> EndpointConfigResponse
     except Exception as e:
         return EndpointConfigResponse(success=False, message=str(e))
 
-def insert_data(table_name: str, data_list: List[Dict[str, Any]]) -> DataInsertionResponse:
+def invalidate_endpoint_config(domain: str, endpoint_id: str) -> None:
+    """
+    Drops a cached endpoint configuration so the next lookup reads it from storage.
+    """
+    doc_id = f"{domain}:{endpoint_id}"
+    with _config_generations_lock:
+        _config_generations[doc_id] = _config_generations.get(doc_id, 0) + 1
+        _endpoint_config_cache.invalidate(doc_id)
+
+def get_endpoint_config_cache_stats() -> Dict[str, Any]:
+    """
+    Returns hit/miss/eviction counters for the endpoint config cache.
+    """
+    return _endpoint_config_cache.stats()
+
+Gauge(
+    'citypulse_endpoint_config_cache', 'Endpoint config cache size and lookup counters.', ('stat',),
+    callback=lambda: {(name,): value for name, value in _endpoint_config_cache.stats().items()
+                      if name in ('size', 'hits', 'misses', 'evictions', 'expirations')}
+)
+
+def _commit_chunk(storage, table_name: str, index: int, start: int, rows: List[Dict[str, Any]],
+                  doc_ids: Optional[List[Optional[str]]] = None, skipped: Optional[List[bool]] = None,
+                  domain: str = '') -> ChunkResult:
+    """
+    Writes one chunk of rows in a single atomic commit. Rows flagged in `skipped` are
+    duplicates and are not written; rows without a document ID in `doc_ids` get a random one.
+    """
+    started = time.perf_counter()
+    try:
+        documents = []
+        stable_ids = []
+        duplicates = 0
+        for position, data_item in enumerate(rows):
+            if skipped and skipped[position]:
+                duplicates += 1
+                continue
+            doc_id = doc_ids[position] if doc_ids else None
+            if doc_id:
+                stable_ids.append(doc_id)
+            else:
+                doc_id = str(uuid.uuid4())
+            documents.append((doc_id, {**data_item, "uuid": doc_id}))
+
+        if documents:
+            storage.insert_rows(table_name, documents)
+            elapsed = time.perf_counter() - started
+            STORAGE_COMMIT_SECONDS.observe(elapsed, backend=storage.name, table=table_name, outcome='ok')
+            _observe_commit(elapsed, True)
+        if stable_ids:
+            recent_ids.remember(table_name, stable_ids)
+        if documents and _commit_listeners:
+            _notify_committed(domain, table_name, [data for _, data in documents])
+        return ChunkResult(index=index, start=start, end=start + len(rows), success=True,
+                           rows_added=len(documents), duplicates_skipped=duplicates,
+                           document_ids=[doc_id for doc_id, _ in documents])
+    except Exception as e:
+        elapsed = time.perf_counter() - started
+        STORAGE_COMMIT_SECONDS.observe(elapsed, backend=storage.name, table=table_name, outcome='error')
+        _observe_commit(elapsed, False)
+        return ChunkResult(index=index, start=start, end=start + len(rows), success=False, error=str(e))
+
+def _find_duplicates(table_name: str, doc_ids: List[Optional[str]]) -> List[bool]:
+    """
+    Flags rows whose document ID was written recently or appears earlier in the same batch.
+    """
+    skipped = [False] * len(doc_ids)
+    in_batch = set()
+    for position, doc_id in enumerate(doc_ids):
+        if doc_id is None:
+            continue
+        if doc_id in in_batch or recent_ids.seen(table_name, doc_id):
+            skipped[position] = True
+        in_batch.add(doc_id)
+    return skipped
+
+def insert_data(table_name: str, data_list: List[Dict[str, Any]],
+                doc_ids: Optional[List[Optional[str]]] = None, domain: str = '') -> DataInsertionResponse:
     """
-    Inserts a list of data dictionaries as documents into a specified Firestore collection.
+    Inserts a list of data dictionaries as documents into a specified table (Firestore collection).
     Each document gets a unique UUID and an insert timestamp.
+    With `doc_ids` (see services/idempotency.py) rows are written under those IDs instead, and
+    rows whose ID was written recently are skipped and counted in duplicates_skipped.
+    The rows are committed in chunks of at most INSERT_CHUNK_SIZE (capped by the backend's batch
+    limit); the response reports the outcome of every chunk so callers can retry only the row
+    ranges that failed. `domain` is passed to commit listeners along with the written rows.
     """
     try:
         if not table_name:
@@ -94,29 +264,47 @@ def insert_data(table_name: str, data_list: List[Dict[str, Any]]) -> DataInserti
         if not data_list:
             return DataInsertionResponse(success=True, message="No data to insert.", rows_added=0)
 
-        collection_ref = db.collection(table_name)
-        batch = db.batch()
-        added_ids = []
+        if doc_ids is not None and len(doc_ids) != len(data_list):
+            raise ValueError(f"Got {len(doc_ids)} document IDs for {len(data_list)} rows.")
 
-        for data_item in data_list:
-            doc_id = str(uuid.uuid4())
-            doc_ref = collection_ref.document(doc_id)
-            
-            data_with_metadata = {
-                **data_item,
-                "uuid": doc_id,
-                "insert_timestamp": firestore.SERVER_TIMESTAMP
-            }
-            batch.set(doc_ref, data_with_metadata)
-            added_ids.append(doc_ref.id)
+        storage = get_storage()
+        chunk_size = min(INSERT_CHUNK_SIZE or storage.max_batch_size, storage.max_batch_size)
+        offsets = range(0, len(data_list), chunk_size)
+        skipped = _find_duplicates(table_name, doc_ids) if doc_ids is not None else None
 
-        batch.commit()
+        def chunk_args(index, start):
+            end = start + chunk_size
+            return (storage, table_name, index, start, data_list[start:end],
+                    doc_ids[start:end] if doc_ids is not None else None,
+                    skipped[start:end] if skipped is not None else None, domain)
+
+        if len(offsets) == 1 or not storage.parallel_commits:
+            chunks = [_commit_chunk(*chunk_args(index, start)) for index, start in enumerate(offsets)]
+        else:
+            executor = _get_commit_executor()
+            futures = [executor.submit(_commit_chunk, *chunk_args(index, start)) for index, start in enumerate(offsets)]
+            chunks = [future.result() for future in futures]
+
+        rows_added = sum(chunk.rows_added for chunk in chunks)
+        duplicates_skipped = sum(chunk.duplicates_skipped for chunk in chunks)
+        added_ids = [doc_id for chunk in chunks for doc_id in chunk.document_ids]
+        failed = [chunk for chunk in chunks if not chunk.success]
+
+        if failed:
+            message = (f"Added {rows_added} of {len(data_list)} rows to '{table_name}'; "
+                       f"{len(failed)} of {len(chunks)} chunks failed: {failed[0].error}")
+        else:
+            message = f"Successfully added {rows_added} rows to '{table_name}'."
+        if duplicates_skipped:
+            message += f" Skipped {duplicates_skipped} duplicate rows."
 
         return DataInsertionResponse(
-            success=True,
-            message=f"Successfully added {len(data_list)} rows to '{table_name}'.",
-            rows_added=len(data_list),
-            document_ids=added_ids
+            success=not failed,
+            message=message,
+            rows_added=rows_added,
+            duplicates_skipped=duplicates_skipped,
+            document_ids=added_ids,
+            chunks=chunks
         )
     except Exception as e:
         return DataInsertionResponse(success=False, message=str(e))
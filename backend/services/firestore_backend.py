@@ -0,0 +1,108 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+
+from services.storage import (
+    StorageBackend, RollupMergeError, QueryFilter, ENDPOINT_CONFIG_COLLECTION, ROLLUP_COLLECTION, rollup_doc_id, merge_rollup
+)
+
+
+class FirestoreBackend(StorageBackend):
+    """
+    Stores endpoint configs and ingested rows in Cloud Firestore.
+    """
+
+    name = 'firestore'
+    # Firestore rejects batches with more than 500 writes
+    max_batch_size = 500
+    parallel_commits = True
+
+    def __init__(self):
+        # Initialize Firebase Admin SDK
+        try:
+            if not firebase_admin._apps:
+                cred = credentials.ApplicationDefault()
+                project_id = os.environ.get('GCP_PROJECT_ID', 'citypulse-671aa')
+
+                firebase_admin.initialize_app(cred, {
+                    'projectId': project_id,
+                })
+        except Exception as e:
+            print(f"Warning: Failed to initialize Firebase Admin SDK: {e}. Firestore operations will fail.")
+
+        self.db = firestore.client()
+
+    def get_config(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        doc = self.db.collection(ENDPOINT_CONFIG_COLLECTION).document(doc_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    def put_config(self, doc_id: str, config: Dict[str, Any]) -> None:
+        endpoint_ref = self.db.collection(ENDPOINT_CONFIG_COLLECTION).document(doc_id)
+        endpoint_ref.set({**config, "created_at": firestore.SERVER_TIMESTAMP})
+
+    def list_configs(self) -> List[Dict[str, Any]]:
+        return [doc.to_dict() for doc in self.db.collection(ENDPOINT_CONFIG_COLLECTION).stream()]
+
+    def insert_rows(self, table_name: str, rows: List[Tuple[str, Dict[str, Any]]]) -> None:
+        collection_ref = self.db.collection(table_name)
+        batch = self.db.batch()
+        for doc_id, data in rows:
+            batch.set(collection_ref.document(doc_id), {**data, "insert_timestamp": firestore.SERVER_TIMESTAMP})
+        batch.commit()
+
+    def query(
+        self,
+        table_name: str,
+        filters: Optional[List[QueryFilter]] = None,
+        order_by: str = 'insert_timestamp',
+        descending: bool = True,
+        limit: int = 100,
+        start_after: Optional[Dict[str, Any]] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+        query = self.db.collection(table_name)
+        for field, op, value in filters or []:
+            query = query.where(field, op, value)
+        query = query.order_by(order_by, direction=direction).order_by('uuid', direction=direction)
+        if fields:
+            # Keep the cursor fields so the caller can build the next page's cursor
+            query = query.select(sorted(set(fields) | {order_by, 'uuid'}))
+        if start_after:
+            query = query.start_after({order_by: start_after[order_by], 'uuid': start_after['uuid']})
+        return [doc.to_dict() for doc in query.limit(limit).stream()]
+
+    def merge_rollups(self, deltas: List[Dict[str, Any]]) -> None:
+        # Other instances merge into the same documents, and Firestore has no atomic min/max,
+        # so each document is read and written back in a transaction
+        collection_ref = self.db.collection(ROLLUP_COLLECTION)
+
+        @firestore.transactional
+        def merge_one(transaction, doc_ref, delta):
+            snapshot = doc_ref.get(transaction=transaction)
+            merged = merge_rollup(snapshot.to_dict() if snapshot.exists else None, delta)
+            transaction.set(doc_ref, {**merged, "updated_at": firestore.SERVER_TIMESTAMP})
+
+        for committed, delta in enumerate(deltas):
+            try:
+                merge_one(self.db.transaction(), collection_ref.document(rollup_doc_id(delta)), delta)
+            except Exception as e:
+                raise RollupMergeError(str(e), committed) from e
+
+    def get_rollups(
+        self,
+        granularity: str,
+        domain: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        query = self.db.collection(ROLLUP_COLLECTION).where('granularity', '==', granularity)
+        if domain:
+            query = query.where('domain', '==', domain)
+        if since:
+            query = query.where('bucket', '>=', since)
+        if until:
+            query = query.where('bucket', '<=', until)
+        return [doc.to_dict() for doc in query.order_by('bucket').stream()]
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from services.cache import TTLCache, MISSING
+
+# Opt-in idempotent ingestion. An endpoint config with "idempotent": true gets document IDs
+# derived from each record's content, or from "idempotencyKeyFields" when set, so a retried
+# request rewrites the same documents instead of adding copies. Recently written IDs are
+# also remembered per table, and repeats are skipped before they cost a storage write.
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 100000))
+IDEMPOTENCY_WINDOW = float(os.environ.get('IDEMPOTENCY_WINDOW', 3600))
+
+
+def idempotency_fields(config: Dict[str, Any]) -> Optional[List[str]]:
+    """
+    Returns None when the endpoint is not idempotent, [] to key on the whole record,
+    or the list of fields that identify a record.
+    """
+    key_fields = config.get('idempotencyKeyFields')
+    if isinstance(key_fields, str):
+        key_fields = [field.strip() for field in key_fields.split(',') if field.strip()]
+    if key_fields:
+        return list(key_fields)
+    if config.get('idempotent') is True:
+        return []
+    return None
+
+
+def record_id(record: Dict[str, Any], key_fields: Optional[List[str]] = None) -> str:
+    """
+    Stable document ID for a record: a hash of its canonical JSON, or of just `key_fields`
+    (missing fields hash as null). Key order and whitespace do not affect the ID.
+    """
+    if key_fields:
+        payload = [record.get(field) for field in key_fields]
+    else:
+        payload = record
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+
+def record_ids(records: List[Dict[str, Any]], key_fields: Optional[List[str]]) -> Optional[List[str]]:
+    """
+    Document IDs for a batch, or None when idempotency is off (key_fields is None).
+    """
+    if key_fields is None:
+        return None
+    return [record_id(record, key_fields) for record in records]
+
+
+class RecentIds:
+    """
+    Per-table LRU of document IDs written within the last `window` seconds.
+    An exact set rather than a bloom filter, so a new record is never mistaken for a repeat.
+    """
+
+    def __init__(self, maxsize: int = IDEMPOTENCY_CACHE_SIZE, window: float = IDEMPOTENCY_WINDOW):
+        self.maxsize = maxsize
+        self.window = window
+        self._tables: Dict[str, TTLCache] = {}
+        self._lock = threading.Lock()
+
+    def _table(self, table_name: str) -> TTLCache:
+        with self._lock:
+            cache = self._tables.get(table_name)
+            if cache is None:
+                cache = self._tables[table_name] = TTLCache(maxsize=self.maxsize, ttl=self.window)
+            return cache
+
+    def seen(self, table_name: str, doc_id: str) -> bool:
+        return self._table(table_name).get(doc_id) is not MISSING
+
+    def remember(self, table_name: str, doc_ids: List[str]) -> None:
+        cache = self._table(table_name)
+        for doc_id in doc_ids:
+            cache.set(doc_id, True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tables = dict(self._tables)
+        return {table_name: cache.stats() for table_name, cache in tables.items()}
+
+
+recent_ids = RecentIds()
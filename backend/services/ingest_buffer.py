@@ -0,0 +1,477 @@
+import atexit
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Collection, Deque, Dict, List, Optional, Tuple
+
+from services.firebase_service import insert_data, DataInsertionResponse
+from services.metrics import Gauge
+
+# Write-behind buffer for /ingest. Accepted records are appended to an on-disk
+# spool before the request returns, then coalesced per table and handed to
+# insert_data by a background flusher. Each flush appends the positions of the records it
+# committed to the segment's .acks file, and replay skips them, so a crash replays only what
+# was not flushed (a crash between a commit and its ack line may still replay that batch).
+# Segments are deleted once every record in them has been committed.
+# Each process spools into its own subdirectory of INGEST_SPOOL_DIR and holds an exclusive
+# flock on it while running; a starting process adopts only the subdirectories whose lock
+# it can take, i.e. those left behind by processes that have exited.
+INGEST_SPOOL_DIR = os.environ.get('INGEST_SPOOL_DIR', os.path.join(os.getcwd(), '.ingest_spool'))
+INGEST_BUFFER_MAX_BATCH = int(os.environ.get('INGEST_BUFFER_MAX_BATCH', 500))
+INGEST_BUFFER_MAX_LATENCY = float(os.environ.get('INGEST_BUFFER_MAX_LATENCY', 1.0))
+INGEST_BUFFER_MAX_PENDING = int(os.environ.get('INGEST_BUFFER_MAX_PENDING', 100000))
+INGEST_SPOOL_SEGMENT_BYTES = int(os.environ.get('INGEST_SPOOL_SEGMENT_BYTES', 16 * 1024 * 1024))
+INGEST_SPOOL_FSYNC = os.environ.get('INGEST_SPOOL_FSYNC', 'false').lower() == 'true'
+
+
+# A queued record: (spool segment id, position in the segment, record, document id or None)
+Entry = Tuple[int, int, Dict[str, Any], Optional[str]]
+# Records are queued per (domain, table) so each flush can tell insert_data where they came from
+QueueKey = Tuple[str, str]
+
+
+class BufferFullError(Exception):
+    """Raised when accepting more records would exceed the buffer's pending limit."""
+
+
+class IngestBuffer:
+    """
+    Coalesces small ingest requests into larger insert_data calls, backed by an
+    append-only spool of JSON lines split into numbered segment files.
+    """
+
+    def __init__(
+        self,
+        spool_dir: str = INGEST_SPOOL_DIR,
+        max_batch: int = INGEST_BUFFER_MAX_BATCH,
+        max_latency: float = INGEST_BUFFER_MAX_LATENCY,
+        max_pending: int = INGEST_BUFFER_MAX_PENDING,
+        segment_bytes: int = INGEST_SPOOL_SEGMENT_BYTES,
+        fsync: bool = INGEST_SPOOL_FSYNC,
+        insert_fn: Callable[..., DataInsertionResponse] = insert_data,
+    ):
+        self.spool_dir = spool_dir
+        self.segment_dir: Optional[str] = None
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.max_pending = max_pending
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.insert_fn = insert_fn
+
+        self._cond = threading.Condition()
+        # Per (domain, table): queue of entries plus the arrival time of the oldest entry
+        self._queues: Dict[QueueKey, Deque[Entry]] = {}
+        self._oldest: Dict[QueueKey, float] = {}
+        self._segment_pending: Dict[int, int] = {}
+        # Records written to each segment so far; the next record's position
+        self._segment_size: Dict[int, int] = {}
+        self._pending = 0
+        self._active_segment: Optional[int] = None
+        self._active_file = None
+        self._lock_fd: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        self.records_accepted = 0
+        self.records_flushed = 0
+        self.records_replayed = 0
+        self.records_deduplicated = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.rejected_requests = 0
+
+    # Lifecycle
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None:
+                return
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self._claim_segment_dir()
+            self._adopt_orphans()
+            self._replay()
+            self._open_segment()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='ingest-buffer-flusher', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """
+        Flushes everything still pending and stops the background flusher.
+        """
+        with self._cond:
+            if self._thread is None:
+                return
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        thread.join(timeout)
+        with self._cond:
+            self._thread = None
+            if self._active_file is not None:
+                self._active_file.close()
+                self._active_file = None
+                self._maybe_delete_segment(self._active_segment, closing=True)
+                self._active_segment = None
+            self._release_segment_dir()
+
+    # Producer side
+
+    def submit(self, table_name: str, records: List[Dict[str, Any]], doc_ids: Optional[List[str]] = None,
+               domain: str = '') -> int:
+        """
+        Durably appends records to the spool and queues them for flushing.
+        `doc_ids` (idempotent endpoints) and `domain` are kept with the records and passed on to insert_data.
+        Returns the number of records accepted.
+        """
+        if not records:
+            return 0
+        entry = {"table": table_name, "records": records}
+        if doc_ids is not None:
+            entry["ids"] = doc_ids
+        if domain:
+            entry["domain"] = domain
+        line = json.dumps(entry, separators=(',', ':'), default=str) + "\n"
+        with self._cond:
+            if self._thread is None:
+                raise RuntimeError("Ingest buffer is not running.")
+            if self._pending + len(records) > self.max_pending:
+                self.rejected_requests += 1
+                raise BufferFullError(
+                    f"Ingest buffer is full ({self._pending} records pending, limit {self.max_pending})."
+                )
+            if self._active_file.tell() >= self.segment_bytes:
+                self._rotate_segment()
+            self._active_file.write(line)
+            self._active_file.flush()
+            if self.fsync:
+                os.fsync(self._active_file.fileno())
+            idle = not self._queues
+            self._enqueue(self._active_segment, table_name, records, doc_ids, domain)
+            self.records_accepted += len(records)
+            if idle or len(self._queues[(domain, table_name)]) >= self.max_batch:
+                self._cond.notify_all()
+        return len(records)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "running": self._thread is not None,
+                "pending_records": self._pending,
+                "pending_tables": len(self._queues),
+                "spool_dir": self.segment_dir,
+                "spool_segments": len(self._segment_pending),
+                "records_accepted": self.records_accepted,
+                "records_replayed": self.records_replayed,
+                "records_deduplicated": self.records_deduplicated,
+                "records_flushed": self.records_flushed,
+                "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes,
+                "rejected_requests": self.rejected_requests,
+                "max_batch": self.max_batch,
+                "max_latency_seconds": self.max_latency,
+                "max_pending": self.max_pending,
+            }
+
+    # Spool management (callers hold self._cond)
+
+    def _segment_path(self, segment_id: int, directory: Optional[str] = None) -> str:
+        return os.path.join(directory or self.segment_dir, f"{segment_id:012d}.log")
+
+    def _acks_path(self, segment_id: int, directory: Optional[str] = None) -> str:
+        return os.path.join(directory or self.segment_dir, f"{segment_id:012d}.acks")
+
+    def _existing_segments(self, directory: Optional[str] = None) -> List[int]:
+        segments = []
+        for name in os.listdir(directory or self.segment_dir):
+            stem, ext = os.path.splitext(name)
+            if ext == '.log' and stem.isdigit():
+                segments.append(int(stem))
+        return sorted(segments)
+
+    @staticmethod
+    def _try_lock(directory: str) -> Optional[int]:
+        # The lock is held for as long as the owning process keeps the descriptor open
+        try:
+            fd = os.open(os.path.join(directory, '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        except FileNotFoundError:
+            return None  # Another process adopted and removed the directory
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    @staticmethod
+    def _remove_dir(directory: str, lock_fd: int) -> None:
+        # The lock file goes first, while still locked, so nobody locks a directory being removed
+        try:
+            os.remove(os.path.join(directory, '.lock'))
+            os.rmdir(directory)
+        except OSError:
+            pass  # Not empty, or already gone; a later start cleans it up
+        os.close(lock_fd)
+
+    def _claim_segment_dir(self) -> None:
+        self.segment_dir = tempfile.mkdtemp(prefix=f"{os.getpid()}-", dir=self.spool_dir)
+        self._lock_fd = self._try_lock(self.segment_dir)
+
+    def _release_segment_dir(self) -> None:
+        if self._lock_fd is None:
+            return
+        if self._segment_pending:
+            # Unflushed segments stay behind for the next process to adopt
+            os.close(self._lock_fd)
+        else:
+            self._remove_dir(self.segment_dir, self._lock_fd)
+        self._lock_fd = None
+
+    def _adopt_orphans(self) -> None:
+        # Segments of exited processes are moved into this process's directory before replay
+        next_id = 1
+        for name in sorted(os.listdir(self.spool_dir)):
+            directory = os.path.join(self.spool_dir, name)
+            if directory == self.segment_dir or not os.path.isdir(directory):
+                continue
+            lock_fd = self._try_lock(directory)
+            if lock_fd is None:
+                continue  # Owned by a live process
+            try:
+                for segment_id in self._existing_segments(directory):
+                    if os.path.exists(self._acks_path(segment_id, directory)):
+                        os.replace(self._acks_path(segment_id, directory), self._acks_path(next_id))
+                    os.replace(self._segment_path(segment_id, directory), self._segment_path(next_id))
+                    next_id += 1
+            except FileNotFoundError:
+                pass
+            self._remove_dir(directory, lock_fd)
+
+    def _open_segment(self) -> None:
+        existing = self._existing_segments()
+        self._active_segment = (existing[-1] + 1) if existing else 1
+        self._segment_pending[self._active_segment] = 0
+        self._segment_size[self._active_segment] = 0
+        self._active_file = open(self._segment_path(self._active_segment), 'a', encoding='utf-8')
+
+    def _rotate_segment(self) -> None:
+        previous = self._active_segment
+        self._active_file.close()
+        self._open_segment()
+        self._maybe_delete_segment(previous, closing=True)
+
+    def _maybe_delete_segment(self, segment_id: Optional[int], closing: bool = False) -> None:
+        if segment_id is None or self._segment_pending.get(segment_id):
+            return
+        if segment_id == self._active_segment and not closing:
+            return
+        self._segment_pending.pop(segment_id, None)
+        self._segment_size.pop(segment_id, None)
+        for path in (self._segment_path(segment_id), self._acks_path(segment_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _read_acks(self, segment_id: int) -> set:
+        acked = set()
+        try:
+            with open(self._acks_path(segment_id), 'r', encoding='utf-8') as acks:
+                for line in acks:
+                    try:
+                        acked.update(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue  # A torn final line; those records are replayed again
+        except FileNotFoundError:
+            pass
+        return acked
+
+    def _replay(self) -> None:
+        for segment_id in self._existing_segments():
+            self._segment_pending[segment_id] = 0
+            self._segment_size[segment_id] = 0
+            acked = self._read_acks(segment_id)
+            with open(self._segment_path(segment_id), 'r', encoding='utf-8') as segment:
+                for line in segment:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final line from a crash mid-append; the request never got its 202
+                        continue
+                    self.records_replayed += self._enqueue(segment_id, entry["table"], entry["records"],
+                                                           entry.get("ids"), entry.get("domain", ''), skip=acked)
+            self._maybe_delete_segment(segment_id)
+        if self.records_replayed:
+            print(f"Ingest buffer replayed {self.records_replayed} unflushed records from '{self.spool_dir}'.")
+
+    def _enqueue(self, segment_id: int, table_name: str, records: List[Dict[str, Any]],
+                 doc_ids: Optional[List[str]] = None, domain: str = '', skip: Collection[int] = ()) -> int:
+        # Returns the number of records queued; positions in `skip` were already committed
+        first = self._segment_size.get(segment_id, 0)
+        self._segment_size[segment_id] = first + len(records)
+        ids = doc_ids if doc_ids is not None else [None] * len(records)
+        entries = [
+            (segment_id, position, record, doc_id)
+            for position, record, doc_id in zip(range(first, first + len(records)), records, ids)
+            if position not in skip
+        ]
+        if not entries:
+            return 0
+        key = (domain, table_name)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._oldest[key] = time.monotonic()
+        queue.extend(entries)
+        self._segment_pending[segment_id] = self._segment_pending.get(segment_id, 0) + len(entries)
+        self._pending += len(entries)
+        return len(entries)
+
+    def _ack(self, entries: List[Entry]) -> None:
+        acked: Dict[int, List[int]] = {}
+        for segment_id, position, _, _ in entries:
+            self._segment_pending[segment_id] -= 1
+            acked.setdefault(segment_id, []).append(position)
+        self._pending -= len(entries)
+        for segment_id, positions in acked.items():
+            if self._segment_pending[segment_id] or segment_id == self._active_segment:
+                # Recorded so a replay after a crash skips these records
+                with open(self._acks_path(segment_id), 'a', encoding='utf-8') as acks:
+                    acks.write(json.dumps(positions, separators=(',', ':')) + "\n")
+                    acks.flush()
+                    if self.fsync:
+                        os.fsync(acks.fileno())
+            self._maybe_delete_segment(segment_id)
+
+    # Flusher side
+
+    def _due_tables(self, now: float, drain: bool) -> List[QueueKey]:
+        return [
+            key for key, queue in self._queues.items()
+            if drain or len(queue) >= self.max_batch or now - self._oldest[key] >= self.max_latency
+        ]
+
+    def _take_batch(self, key: QueueKey) -> List[Entry]:
+        queue = self._queues[key]
+        batch = [queue.popleft() for _ in range(min(self.max_batch, len(queue)))]
+        if queue:
+            self._oldest[key] = time.monotonic()
+        else:
+            del self._queues[key]
+            del self._oldest[key]
+        return batch
+
+    def _requeue(self, key: QueueKey, entries: List[Entry]) -> None:
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+        queue.extendleft(reversed(entries))
+        self._oldest[key] = time.monotonic()
+
+    def _flush_table(self, key: QueueKey, batch: List[Entry]) -> bool:
+        domain, table_name = key
+        records = [record for _, _, record, _ in batch]
+        doc_ids = [doc_id for _, _, _, doc_id in batch]
+        options = {}
+        if any(doc_ids):
+            options["doc_ids"] = doc_ids
+        if domain:
+            options["domain"] = domain
+        response = self.insert_fn(table_name, records, **options)
+        if response.success:
+            landed, failed = batch, []
+        else:
+            landed = [entry for chunk in response.chunks if chunk.success for entry in batch[chunk.start:chunk.end]]
+            failed = [entry for chunk in response.chunks if not chunk.success for entry in batch[chunk.start:chunk.end]]
+            if not response.chunks:
+                failed = batch
+            print(f"Ingest buffer flush to '{table_name}' failed: {response.message}")
+
+        with self._cond:
+            self.flushes += 1
+            self.records_flushed += len(landed)
+            self.records_deduplicated += response.duplicates_skipped
+            if landed:
+                self._ack(landed)
+            if failed:
+                self.failed_flushes += 1
+                self._requeue(key, failed)
+        return not failed
+
+    def _run(self) -> None:
+        backoff = 0.0
+        while True:
+            with self._cond:
+                drain = self._stopping
+                due = self._due_tables(time.monotonic(), drain)
+                if not due:
+                    if drain:
+                        return
+                    self._cond.wait(timeout=min(self.max_latency, 0.25) if self._queues else None)
+                    continue
+                batches = [(key, self._take_batch(key)) for key in due]
+
+            ok = True
+            for key, batch in batches:
+                ok = self._flush_table(key, batch) and ok
+
+            if ok:
+                backoff = 0.0
+            else:
+                backoff = min(max(backoff * 2, 0.5), 30.0)
+                if drain:
+                    # Leave the rest in the spool for replay on the next start
+                    return
+                time.sleep(backoff)
+
+
+_ingest_buffer: Optional[IngestBuffer] = None
+_ingest_buffer_lock = threading.Lock()
+
+Gauge(
+    'citypulse_ingest_buffer', 'Write-behind ingest buffer depth and counters.', ('stat',),
+    callback=lambda: {} if _ingest_buffer is None else {
+        (name,): value for name, value in _ingest_buffer.stats().items()
+        if name in ('pending_records', 'spool_segments', 'records_accepted', 'records_flushed', 'failed_flushes', 'rejected_requests')
+    }
+)
+
+def _reset_after_fork() -> None:
+    # The flusher thread does not survive fork; a child starts its own buffer on first use.
+    # The child's copy of the parent's lock descriptor is closed, or the parent's spool
+    # directory would stay locked after the parent exits.
+    global _ingest_buffer, _ingest_buffer_lock
+    if _ingest_buffer is not None and _ingest_buffer._lock_fd is not None:
+        os.close(_ingest_buffer._lock_fd)
+    _ingest_buffer = None
+    _ingest_buffer_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def submit_to_buffer(table_name: str, records: List[Dict[str, Any]], doc_ids: Optional[List[str]] = None,
+                     domain: str = '') -> DataInsertionResponse:
+    """
+    insert_data-compatible sink that spools records into the write-behind buffer instead.
+    """
+    try:
+        accepted = get_ingest_buffer().submit(table_name, records, doc_ids, domain=domain)
+        return DataInsertionResponse(success=True, message="Accepted.", rows_added=accepted)
+    except BufferFullError as e:
+        return DataInsertionResponse(success=False, message=str(e))
+
+def get_ingest_buffer() -> IngestBuffer:
+    """
+    Returns the process-wide ingest buffer, starting it (and replaying the spool) on first use.
+    """
+    global _ingest_buffer
+    with _ingest_buffer_lock:
+        if _ingest_buffer is None:
+            _ingest_buffer = IngestBuffer()
+            _ingest_buffer.start()
+            atexit.register(_ingest_buffer.stop)
+        return _ingest_buffer
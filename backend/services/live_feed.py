@@ -0,0 +1,264 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from itertools import islice
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from services.firebase_service import add_commit_listener
+from services.metrics import Gauge
+
+# Server-Sent Events feed of newly committed records, per domain. Each domain keeps a bounded
+# ring buffer of pre-rendered SSE frames. Subscribers hold only a cursor into it, so
+# publishing is an append plus a wake-up and never waits on a subscriber. A consumer that
+# falls further behind than the buffer skips ahead and gets a "gap" event saying how many
+# records it missed. Clients that reconnect with Last-Event-ID resume where they left off,
+# as long as those events are still buffered in this process.
+LIVE_FEED_BUFFER_SIZE = int(os.environ.get('LIVE_FEED_BUFFER_SIZE', 1000))
+LIVE_FEED_HEARTBEAT = float(os.environ.get('LIVE_FEED_HEARTBEAT', 15.0))
+LIVE_FEED_MAX_SUBSCRIBERS = int(os.environ.get('LIVE_FEED_MAX_SUBSCRIBERS', 10000))
+LIVE_FEED_BATCH = 256  # Frames written per wake-up
+LIVE_FEED_RETRY_MS = 3000
+
+HEARTBEAT_FRAME = b": keep-alive\n\n"
+
+
+class FeedFullError(Exception):
+    """Raised when a new subscription would exceed LIVE_FEED_MAX_SUBSCRIBERS."""
+
+
+class FeedEvent(NamedTuple):
+    seq: int
+    frame: bytes
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _new_epoch() -> str:
+    # Event IDs are "<epoch>-<seq>"; the epoch tells a resuming client whether its ID is from this process
+    return f"{os.getpid():x}{time.time_ns() & 0xffffffff:08x}"
+
+
+class DomainFeed:
+    """
+    Ring buffer of one domain's events. Threads wait on a condition; event loops are woken
+    through one shared asyncio.Event per loop, so idle async subscribers cost no thread.
+    """
+
+    def __init__(self, domain: str, epoch: str, size: int = LIVE_FEED_BUFFER_SIZE):
+        self.domain = domain
+        self.epoch = epoch
+        self._events: Deque[FeedEvent] = deque(maxlen=size)
+        self._last_seq = 0
+        self._cond = threading.Condition()
+        self._loop_events: Dict[asyncio.AbstractEventLoop, asyncio.Event] = {}
+        self.subscribers = 0
+        self.published = 0
+        self.skipped = 0
+
+    @property
+    def last_seq(self) -> int:
+        with self._cond:
+            return self._last_seq
+
+    def publish(self, table_name: str, rows: List[Dict[str, Any]]) -> None:
+        payloads = [json.dumps({"table": table_name, "record": row}, separators=(',', ':'), default=_json_default)
+                    for row in rows]
+        with self._cond:
+            for payload in payloads:
+                self._last_seq += 1
+                frame = f"id: {self.epoch}-{self._last_seq}\nevent: record\ndata: {payload}\n\n".encode('utf-8')
+                self._events.append(FeedEvent(self._last_seq, frame))
+            self.published += len(payloads)
+            self._cond.notify_all()
+            loops = list(self._loop_events)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(self._wake_loop, loop)
+            except RuntimeError:
+                # The loop has been closed
+                with self._cond:
+                    self._loop_events.pop(loop, None)
+
+    def _wake_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        # Runs on `loop`: swap in a fresh event before setting the old one, so waiters that
+        # re-check the buffer afterwards wait for the next publish
+        with self._cond:
+            event = self._loop_events.get(loop)
+            if event is None:
+                return
+            self._loop_events[loop] = asyncio.Event()
+        event.set()
+
+    def loop_event(self) -> asyncio.Event:
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            event = self._loop_events.get(loop)
+            if event is None:
+                event = self._loop_events[loop] = asyncio.Event()
+            return event
+
+    def read_after(self, seq: int) -> Tuple[List[bytes], int, int]:
+        """
+        Returns up to LIVE_FEED_BATCH frames after `seq`, the new cursor and how many events
+        were skipped because they had already left the buffer.
+        """
+        with self._cond:
+            if not self._events or seq >= self._last_seq:
+                return [], seq, 0
+            oldest = self._events[0].seq
+            missed = max(0, oldest - seq - 1)
+            start = max(0, seq + 1 - oldest)
+            events = list(islice(self._events, start, start + LIVE_FEED_BATCH))
+            if missed:
+                self.skipped += missed
+        return [event.frame for event in events], events[-1].seq, missed
+
+    def wait_after(self, seq: int, timeout: float) -> None:
+        with self._cond:
+            if self._last_seq <= seq:
+                self._cond.wait(timeout)
+
+
+class Subscription:
+    """
+    One client's position in a domain feed. Iterate it (threads) or async-iterate it (event
+    loops) for SSE bytes: buffered frames, gap notices and heartbeats. Call close() when the
+    client goes away.
+    """
+
+    def __init__(self, feed: DomainFeed, cursor: int, reset: bool, heartbeat: float = LIVE_FEED_HEARTBEAT):
+        self.feed = feed
+        self.cursor = cursor
+        self.heartbeat = heartbeat
+        self._preamble = f"retry: {LIVE_FEED_RETRY_MS}\n\n".encode('utf-8')
+        if reset:
+            # The client's Last-Event-ID is from another process or has left the buffer's ID space
+            self._preamble += f"event: reset\ndata: {json.dumps({'domain': feed.domain})}\n\n".encode('utf-8')
+        self._closed = False
+
+    def _next_chunk(self) -> Optional[bytes]:
+        frames, self.cursor, missed = self.feed.read_after(self.cursor)
+        if missed:
+            frames.insert(0, f"event: gap\ndata: {json.dumps({'missed': missed})}\n\n".encode('utf-8'))
+        return b"".join(frames) if frames else None
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            yield self._preamble
+            while not self._closed:
+                chunk = self._next_chunk()
+                if chunk is None:
+                    self.feed.wait_after(self.cursor, self.heartbeat)
+                    chunk = self._next_chunk() or HEARTBEAT_FRAME
+                yield chunk
+        finally:
+            self.close()
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        try:
+            yield self._preamble
+            while not self._closed:
+                # Take the loop's event before reading, so a publish in between is not missed
+                event = self.feed.loop_event()
+                chunk = self._next_chunk()
+                if chunk is None:
+                    try:
+                        await asyncio.wait_for(event.wait(), self.heartbeat)
+                    except asyncio.TimeoutError:
+                        pass
+                    chunk = self._next_chunk() or HEARTBEAT_FRAME
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        global _subscriber_count
+        with _feeds_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self.feed.subscribers -= 1
+            _subscriber_count -= 1
+
+
+_feeds: Dict[str, DomainFeed] = {}
+_feeds_lock = threading.Lock()
+_subscriber_count = 0
+_epoch = _new_epoch()
+
+def _reset_after_fork() -> None:
+    # Each worker has its own feeds and its own event ID epoch
+    global _feeds, _feeds_lock, _subscriber_count, _epoch
+    _feeds = {}
+    _feeds_lock = threading.Lock()
+    _subscriber_count = 0
+    _epoch = _new_epoch()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def subscribe(domain: str, last_event_id: Optional[str] = None) -> Subscription:
+    """
+    Opens a subscription to a domain's feed. With a Last-Event-ID from this process it
+    resumes after that event; otherwise it starts with the next event.
+    Raises FeedFullError when LIVE_FEED_MAX_SUBSCRIBERS are already connected.
+    """
+    global _subscriber_count
+    with _feeds_lock:
+        if _subscriber_count >= LIVE_FEED_MAX_SUBSCRIBERS:
+            raise FeedFullError(f"Too many live feed subscribers ({_subscriber_count}); try again shortly.")
+        feed = _feeds.get(domain)
+        if feed is None:
+            # Feeds exist only for domains someone has subscribed to; others cost ingest nothing
+            feed = _feeds[domain] = DomainFeed(domain, _epoch)
+        feed.subscribers += 1
+        _subscriber_count += 1
+
+    cursor, reset = feed.last_seq, False
+    if last_event_id:
+        epoch, _, seq = last_event_id.strip().rpartition('-')
+        if epoch == feed.epoch and seq.isdigit() and int(seq) <= cursor:
+            cursor = int(seq)
+        else:
+            reset = True
+    return Subscription(feed, cursor, reset)
+
+
+def _on_commit(domain: str, table_name: str, rows: List[Dict[str, Any]]) -> None:
+    feed = _feeds.get(domain)
+    if feed is not None:
+        feed.publish(table_name, rows)
+
+add_commit_listener(_on_commit)
+
+
+def get_live_feed_stats() -> Dict[str, Any]:
+    with _feeds_lock:
+        feeds = dict(_feeds)
+        subscribers = _subscriber_count
+    return {
+        "subscribers": subscribers,
+        "max_subscribers": LIVE_FEED_MAX_SUBSCRIBERS,
+        "domains": {
+            domain: {"subscribers": feed.subscribers, "published": feed.published,
+                     "skipped": feed.skipped, "last_event_id": f"{feed.epoch}-{feed.last_seq}"}
+            for domain, feed in feeds.items()
+        },
+    }
+
+Gauge(
+    'citypulse_live_feed', 'Live feed subscribers, published records and records skipped by slow consumers.',
+    ('domain', 'stat'),
+    callback=lambda: {
+        (domain, name): value for domain, stats in get_live_feed_stats()["domains"].items()
+        for name, value in stats.items() if name != 'last_event_id'
+    }
+)
@@ -0,0 +1,258 @@
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Type
+
+from pydantic import BaseModel
+
+from services.metrics import Gauge, instrumented_generate
+from services.runtime import get_genkit
+
+# Content-addressed cache for genkit.generate calls with structured output.
+# Identical (model, prompt, temperature, output schema) requests are answered from a
+# local SQLite file, and concurrent identical requests are coalesced into one model call.
+LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+LLM_CACHE_PATH = os.environ.get('LLM_CACHE_PATH', os.path.join(os.getcwd(), '.llm_cache.sqlite3'))
+LLM_CACHE_TTL = float(os.environ.get('LLM_CACHE_TTL', 7 * 24 * 3600))
+LLM_CACHE_MAX_BYTES = int(os.environ.get('LLM_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+# How long a coalesced caller waits for the leader's model call before making its own
+# (the default matches the ASGI server's LLM_REQUEST_TIMEOUT)
+LLM_CACHE_WAIT_TIMEOUT = float(os.environ.get('LLM_CACHE_WAIT_TIMEOUT', 120))
+
+# Set by routes to skip the cache lookup for a single request (the fresh result is still stored).
+_bypass = contextvars.ContextVar('llm_cache_bypass', default=False)
+
+
+@contextlib.contextmanager
+def cache_bypass(enabled: bool = True):
+    """
+    Forces generate calls made inside the block to go to the model.
+    """
+    token = _bypass.set(bool(enabled))
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def _model_name(model: Any) -> str:
+    return getattr(model, 'name', None) or str(model)
+
+
+def cache_key(model: Any, prompt: str, output_schema: Type[BaseModel], config: Optional[Dict[str, Any]]) -> str:
+    payload = {
+        "model": _model_name(model),
+        "prompt": prompt,
+        "temperature": (config or {}).get("temperature"),
+        "config": config or {},
+        "output_schema": output_schema.model_json_schema(),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    SQLite-backed store of serialized model outputs with TTLs and size-based LRU eviction.
+    Every worker process shares the file, so the byte total is always read from the
+    database, inside the write transaction that may evict.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, expires_at = row
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        size = len(value.encode('utf-8'))
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so no other process changes the total mid-check
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, size, now + (self.ttl if ttl is None else ttl), now),
+                )
+                if self._total_bytes() > self.max_bytes:
+                    self._evict(now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _total_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+    def _evict(self, now: float) -> None:
+        expired = self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,)).rowcount
+        self.evictions += expired
+        # Drop least recently used entries until the store is back under 90% of its budget
+        excess = self._total_bytes() - int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access").fetchall()
+        victims = []
+        for key, size in rows:
+            if excess <= 0:
+                break
+            victims.append((key,))
+            excess -= size
+        if victims:
+            self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+            self.evictions += len(victims)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            return {
+                "entries": entries,
+                "bytes": total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "coalesced": _coalesced,
+                "coalesce_timeouts": _coalesce_timeouts,
+            }
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+
+_in_flight: Dict[str, _InFlight] = {}
+_in_flight_lock = threading.Lock()
+_coalesced = 0
+_coalesce_timeouts = 0
+
+_cache: Optional[LLMResponseCache] = None
+_cache_lock = threading.Lock()
+
+def get_llm_cache() -> LLMResponseCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResponseCache()
+        return _cache
+
+def _reset_after_fork() -> None:
+    # A SQLite connection must not be carried across fork; the child opens its own
+    global _cache, _cache_lock, _in_flight, _in_flight_lock
+    _cache = None
+    _cache_lock = threading.Lock()
+    _in_flight = {}
+    _in_flight_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _call_model(flow: str, model: Any, prompt: str, output_schema: Type[BaseModel], config: Optional[Dict[str, Any]]) -> str:
+    response = instrumented_generate(get_genkit().generate, flow, model=model, prompt=prompt, output_schema=output_schema, config=config)
+    if not response.output:
+        # Empty outputs are returned to the flow to raise on, never cached
+        return ''
+    output = response.output
+    if isinstance(output, BaseModel):
+        return output.model_dump_json(by_alias=True)
+    return json.dumps(output)
+
+
+def cached_generate(model: Any, prompt: str, output_schema: Type[BaseModel],
+                    config: Optional[Dict[str, Any]] = None, flow: str = 'unknown') -> Optional[BaseModel]:
+    """
+    Drop-in replacement for genkit.generate(...).output for flows with a structured output schema.
+    Returns None when the model produced no valid output. `flow` labels the call's metrics.
+    """
+    global _coalesced, _coalesce_timeouts
+    key = cache_key(model, prompt, output_schema, config)
+    cache = get_llm_cache() if LLM_CACHE_ENABLED else None
+
+    if cache is not None and not _bypass.get():
+        cached = cache.get(key)
+        if cached is not None:
+            return output_schema.model_validate_json(cached)
+
+    # Single flight: the first caller for a key runs the model, identical concurrent callers wait for it
+    with _in_flight_lock:
+        flight = _in_flight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _in_flight[key] = _InFlight()
+        else:
+            _coalesced += 1
+
+    if leader:
+        try:
+            flight.result = _call_model(flow, model, prompt, output_schema, config)
+            if cache is not None and flight.result:
+                cache.set(key, flight.result)
+        except BaseException as e:
+            flight.error = e
+        finally:
+            with _in_flight_lock:
+                _in_flight.pop(key, None)
+            flight.done.set()
+    elif not flight.done.wait(LLM_CACHE_WAIT_TIMEOUT):
+        # The leader's call is stuck; make this caller's own call rather than wait forever
+        with _in_flight_lock:
+            _coalesce_timeouts += 1
+        result = _call_model(flow, model, prompt, output_schema, config)
+        if cache is not None and result:
+            cache.set(key, result)
+        return output_schema.model_validate_json(result) if result else None
+
+    if flight.error is not None:
+        raise flight.error
+    if not flight.result:
+        return None
+    return output_schema.model_validate_json(flight.result)
+
+
+def _cache_gauge_values() -> Dict[tuple, float]:
+    if _cache is None:
+        return {}
+    stats = _cache.stats()
+    return {(name,): stats[name] for name in ('entries', 'bytes', 'hits', 'misses', 'evictions', 'coalesced', 'coalesce_timeouts')}
+
+Gauge('citypulse_llm_cache', 'LLM response cache size and lookup counters.', ('stat',), callback=_cache_gauge_values)
+
+def get_llm_cache_stats() -> Dict[str, Any]:
+    if not LLM_CACHE_ENABLED:
+        return {"enabled": False, "coalesced": _coalesced, "coalesce_timeouts": _coalesce_timeouts}
+    return {"enabled": True, **get_llm_cache().stats()}
@@ -0,0 +1,279 @@
+import bisect
+import contextlib
+import contextvars
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Lightweight in-process metrics: labeled counters, gauges and latency histograms,
+# rendered in the Prometheus text exposition format by the /metrics route. A sampled
+# per-request trace of stage timings can also be logged as one JSON line per request.
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0.0))
+# Label used for a domain or endpoint before its config has resolved, so requests for
+# unknown endpoints all share one series instead of creating one each
+UNKNOWN_LABEL = 'unknown'
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: List["_Metric"] = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """
+    A gauge whose value is either set directly or read from a callback at render time.
+    A callback returns {label values tuple: value}.
+    """
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        if self.callback is not None:
+            try:
+                items = list(self.callback().items())
+            except Exception:
+                items = []
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return sum(entry[0]) if entry else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if math.isinf(bound) else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def render_metrics() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+# Metrics shared across the app
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'citypulse_http_request_seconds', 'End-to-end latency of HTTP requests.', ('route', 'method', 'status')
+)
+STAGE_SECONDS = Histogram(
+    'citypulse_stage_seconds', 'Latency of individual request processing stages.', ('stage', 'domain', 'endpoint')
+)
+RECORDS_INGESTED = Counter(
+    'citypulse_records_ingested_total', 'Records written (or accepted for write-behind) by /ingest.', ('domain', 'endpoint')
+)
+RECORDS_REJECTED = Counter(
+    'citypulse_records_rejected_total', 'Records split off by schema validation.', ('domain', 'endpoint')
+)
+INGEST_BYTES = Counter(
+    'citypulse_ingest_bytes_total', 'Request body bytes received by /ingest.', ('domain', 'endpoint')
+)
+ERRORS = Counter(
+    'citypulse_errors_total', 'Requests that ended in an error response.', ('route', 'domain', 'endpoint', 'status')
+)
+STORAGE_COMMIT_SECONDS = Histogram(
+    'citypulse_storage_commit_seconds', 'Latency of one atomic storage batch commit.', ('backend', 'table', 'outcome')
+)
+STORAGE_CONFIG_READ_SECONDS = Histogram(
+    'citypulse_storage_config_read_seconds', 'Latency of endpoint config reads that missed the cache.', ('backend',)
+)
+LLM_SECONDS = Histogram(
+    'citypulse_llm_seconds', 'Latency of model calls per flow.', ('flow', 'outcome')
+)
+LLM_TOKENS = Counter(
+    'citypulse_llm_tokens_total', 'Model tokens per flow (estimated when the SDK does not report usage).', ('flow', 'kind')
+)
+
+
+# Sampled per-request traces
+
+_trace: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar('metrics_trace', default=None)
+
+# Traces go to the 'citypulse.trace' logger. It writes to stderr unless the deployment
+# configures logging itself, and is silent while TRACE_SAMPLE_RATE is 0.
+trace_logger = logging.getLogger('citypulse.trace')
+if TRACE_SAMPLE_RATE > 0 and not trace_logger.handlers:
+    _trace_handler = logging.StreamHandler()
+    _trace_handler.setFormatter(logging.Formatter('TRACE %(message)s'))
+    trace_logger.addHandler(_trace_handler)
+    trace_logger.setLevel(logging.INFO)
+    trace_logger.propagate = False
+
+def start_trace(sample_rate: Optional[float] = None) -> bool:
+    rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate > 0 and random.random() < rate:
+        _trace.set([])
+        return True
+    _trace.set(None)
+    return False
+
+def finish_trace(**fields) -> None:
+    stages = _trace.get()
+    if stages is None:
+        return
+    _trace.set(None)
+    trace_logger.info(json.dumps({**fields, "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in stages}}))
+
+
+def observe_stage(stage: str, seconds: float, domain: str = '', endpoint: str = '') -> None:
+    """
+    Records an already measured request stage in STAGE_SECONDS and in the current trace.
+    """
+    STAGE_SECONDS.observe(seconds, stage=stage, domain=domain, endpoint=endpoint)
+    stages = _trace.get()
+    if stages is not None:
+        stages.append((stage, seconds))
+
+
+@contextlib.contextmanager
+def timed_stage(stage: str, domain: str = '', endpoint: str = ''):
+    """
+    Times a block as one request stage, recording it in STAGE_SECONDS and in the current trace.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started, domain, endpoint)
+
+
+def record_llm_call(flow: str, prompt: str, response: Any, seconds: float, outcome: str = 'ok') -> None:
+    """
+    Records latency and token usage for one genkit.generate call.
+    """
+    LLM_SECONDS.observe(seconds, flow=flow, outcome=outcome)
+    stages = _trace.get()
+    if stages is not None:
+        stages.append((f"llm:{flow}", seconds))
+    usage = getattr(response, 'usage', None)
+    input_tokens = getattr(usage, 'input_tokens', None) if usage is not None else None
+    output_tokens = getattr(usage, 'output_tokens', None) if usage is not None else None
+    if input_tokens is None:
+        input_tokens = len(prompt) // 4 + 1
+    if output_tokens is None and response is not None:
+        output = getattr(response, 'output', None)
+        text = output.model_dump_json() if hasattr(output, 'model_dump_json') else json.dumps(output, default=str)
+        output_tokens = len(text) // 4 + 1
+    LLM_TOKENS.inc(input_tokens, flow=flow, kind='input')
+    if output_tokens:
+        LLM_TOKENS.inc(output_tokens, flow=flow, kind='output')
+
+
+def instrumented_generate(generate: Callable[..., Any], flow: str, **kwargs) -> Any:
+    """
+    Calls genkit.generate (passed in as `generate`) and records its latency and token usage under `flow`.
+    """
+    started = time.perf_counter()
+    try:
+        response = generate(**kwargs)
+    except Exception:
+        record_llm_call(flow, kwargs.get('prompt', ''), None, time.perf_counter() - started, outcome='error')
+        raise
+    record_llm_call(flow, kwargs.get('prompt', ''), response, time.perf_counter() - started)
+    return response
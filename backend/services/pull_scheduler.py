@@ -0,0 +1,629 @@
+import atexit
+import contextlib
+import csv
+import fcntl
+import gzip
+import http.client
+import io
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from pydantic import BaseModel
+
+from services.firebase_service import insert_data
+from services.idempotency import idempotency_fields, record_id
+from services.ingest_buffer import submit_to_buffer
+from services.metrics import Counter, Gauge, RECORDS_INGESTED, RECORDS_REJECTED, timed_stage
+from services.rollups import configure_rollups
+from services.schema_validator import compile_endpoint_schema
+from services.storage import get_storage
+from services.stream_ingest import ingest_records, stream_format
+
+# Pull extraction for endpoints with "ingestionType": "RestAPI". Each config's "pull" block
+# names a URL and an interval. The scheduler polls every source on its own jittered
+# interval, over pooled keep-alive connections, with conditional requests (ETag /
+# If-Modified-Since) and a per-source high-water mark, and pushes new records through the
+# same transform/validate/insert pipeline as /ingest. At most PULL_MAX_CONCURRENCY polls
+# run at once. Run the scheduler in one process only (PULL_SCHEDULER_ENABLED=true there).
+# Manual pulls may run in any worker, so every poll re-reads its source's state from
+# PULL_STATE_PATH and writes it back under an flock on a .lock side file.
+PULL_SCHEDULER_ENABLED = os.environ.get('PULL_SCHEDULER_ENABLED', 'false').lower() == 'true'
+PULL_DEFAULT_INTERVAL = float(os.environ.get('PULL_DEFAULT_INTERVAL', 300))
+PULL_MIN_INTERVAL = float(os.environ.get('PULL_MIN_INTERVAL', 5))
+PULL_JITTER = float(os.environ.get('PULL_JITTER', 0.1))  # Fraction of the interval
+PULL_MAX_CONCURRENCY = int(os.environ.get('PULL_MAX_CONCURRENCY', 4))
+PULL_CONFIG_REFRESH = float(os.environ.get('PULL_CONFIG_REFRESH', 60))
+PULL_HTTP_TIMEOUT = float(os.environ.get('PULL_HTTP_TIMEOUT', 30))
+PULL_MAX_CONNECTIONS_PER_HOST = int(os.environ.get('PULL_MAX_CONNECTIONS_PER_HOST', 4))
+PULL_MAX_PAGES = int(os.environ.get('PULL_MAX_PAGES', 50))
+PULL_STATE_PATH = os.environ.get('PULL_STATE_PATH', os.path.join(os.getcwd(), '.pull_state.json'))
+PULL_USER_AGENT = 'city-pulse-pull/1.0'
+
+PULL_POLLS = Counter('citypulse_pull_polls_total', 'Source polls by outcome.', ('domain', 'endpoint', 'outcome'))
+
+
+class PullError(Exception):
+    """Raised when a source cannot be fetched or its response cannot be parsed."""
+
+
+class HTTPResult(NamedTuple):
+    status: int
+    headers: Dict[str, str]  # Lower-cased names
+    body: bytes
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP(S) connections per (scheme, host), reused across polls. A connection
+    the server closed while idle is replaced and the request retried once.
+    """
+
+    def __init__(self, max_per_host: int = PULL_MAX_CONNECTIONS_PER_HOST, timeout: float = PULL_HTTP_TIMEOUT):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self._idle: Dict[Tuple[str, str], List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+        self.requests = 0
+
+    def _connect(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        with self._lock:
+            self.connections_opened += 1
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def _acquire(self, key: Tuple[str, str]) -> Optional[http.client.HTTPConnection]:
+        with self._lock:
+            idle = self._idle.get(key)
+            return idle.pop() if idle else None
+
+    def _release(self, key: Tuple[str, str], conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, method: str, url: str, headers: Dict[str, str]) -> HTTPResult:
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise PullError(f"Unsupported URL scheme in '{url}'.")
+        key = (parts.scheme, parts.netloc)
+        target = urlunsplit(('', '', parts.path or '/', parts.query, ''))
+        conn = self._acquire(key)
+        reused = conn is not None
+        while True:
+            if conn is None:
+                conn = self._connect(*key)
+            try:
+                conn.request(method, target, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+                break
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                conn = None
+                if not reused:
+                    raise PullError(f"{method} {url} failed: {e}")
+                reused = False
+        with self._lock:
+            self.requests += 1
+        result_headers = {name.lower(): value for name, value in response.getheaders()}
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+        if result_headers.get('content-encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return HTTPResult(response.status, result_headers, body)
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+
+class PullSource(BaseModel):
+    domain: str
+    endpoint_id: str
+    table_name: str
+    url: str
+    interval: float = PULL_DEFAULT_INTERVAL
+    headers: Dict[str, str] = {}
+    params: Dict[str, str] = {}
+    records_path: Optional[str] = None  # Dotted path to the record list in a JSON response
+    cursor_field: Optional[str] = None  # Record field whose maximum is the high-water mark
+    cursor_param: Optional[str] = None  # Query parameter that sends the high-water mark
+    next_page_path: Optional[str] = None  # Dotted path to the next-page token in a JSON response
+    next_page_param: Optional[str] = None  # Query parameter that sends the next-page token
+    config: Dict[str, Any] = {}
+
+    @property
+    def key(self) -> str:
+        return f"{self.domain}:{self.endpoint_id}"
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional['PullSource']:
+        """
+        Builds a source from an endpoint config with a "pull" block, or returns None when the
+        endpoint is not a pollable REST source.
+        """
+        pull = config.get('pull')
+        if not isinstance(pull, dict) or not pull.get('url'):
+            return None
+        if config.get('ingestionType', 'RestAPI') != 'RestAPI' or not config.get('tableName'):
+            return None
+        return cls(
+            domain=config.get('domain', ''),
+            endpoint_id=config.get('endpointId', ''),
+            table_name=config['tableName'],
+            url=pull['url'],
+            interval=max(float(pull.get('intervalSeconds', PULL_DEFAULT_INTERVAL)), PULL_MIN_INTERVAL),
+            headers={str(k): str(v) for k, v in (pull.get('headers') or {}).items()},
+            params={str(k): str(v) for k, v in (pull.get('params') or {}).items()},
+            records_path=pull.get('recordsPath'),
+            cursor_field=pull.get('cursorField'),
+            cursor_param=pull.get('cursorParam'),
+            next_page_path=pull.get('nextPagePath'),
+            next_page_param=pull.get('nextPageParam'),
+            config=config,
+        )
+
+
+class FetchResult(BaseModel):
+    not_modified: bool = False
+    records: List[Dict[str, Any]] = []
+    pages: int = 0
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    high_water: Any = None
+    # IDs of the fetched records whose cursor value equals high_water
+    high_water_ids: List[str] = []
+
+
+class PollResult(BaseModel):
+    source: str
+    outcome: str  # 'ingested', 'not_modified', 'no_new_records' or 'error'
+    records_fetched: int = 0
+    rows_added: int = 0
+    rows_rejected: int = 0
+    pages: int = 0
+    high_water: Any = None
+    message: str = ""
+    duration_seconds: float = 0.0
+
+
+def _dig(payload: Any, path: Optional[str]) -> Any:
+    for part in (path or '').split('.'):
+        if not part:
+            continue
+        if isinstance(payload, dict):
+            payload = payload.get(part)
+        elif isinstance(payload, list) and part.isdigit() and int(part) < len(payload):
+            payload = payload[int(part)]
+        else:
+            return None
+    return payload
+
+
+def _with_params(url: str, params: Dict[str, str]) -> str:
+    if not params:
+        return url
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query, keep_blank_values=True))
+    query.update(params)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+
+def parse_records(result: HTTPResult, records_path: Optional[str]) -> Tuple[List[Dict[str, Any]], Any]:
+    """
+    Returns the records in a response and the parsed payload. NDJSON and CSV bodies are
+    recognised by Content-Type; anything else is parsed as JSON and `records_path` applied.
+    """
+    mimetype = result.headers.get('content-type', '').split(';')[0].strip().lower()
+    text = result.body.decode('utf-8', errors='replace')
+    fmt = stream_format(mimetype)
+    try:
+        if fmt == 'csv':
+            records = list(csv.DictReader(io.StringIO(text, newline='')))
+            return records, records
+        if fmt == 'ndjson':
+            payload = [json.loads(line) for line in text.splitlines() if line.strip()]
+        else:
+            payload = json.loads(text) if text.strip() else []
+    except ValueError as e:
+        raise PullError(f"Could not parse the response: {e}")
+    found = _dig(payload, records_path) if records_path else payload
+    if isinstance(found, dict):
+        found = [found]
+    if not isinstance(found, list):
+        raise PullError(f"No record list at '{records_path or '(root)'}' in the response.")
+    return [record for record in found if isinstance(record, dict)], payload
+
+
+def _newer(value: Any, high_water: Any) -> bool:
+    try:
+        return high_water is None or value > high_water
+    except TypeError:
+        return True
+
+
+class PullScheduler:
+    """
+    Polls REST sources on their intervals and ingests what is new. Per-source state (ETag,
+    Last-Modified, high-water mark, last outcome) is kept in a JSON file so a restart
+    resumes where it stopped.
+    """
+
+    def __init__(
+        self,
+        load_configs: Optional[Callable[[], List[Dict[str, Any]]]] = None,
+        max_concurrency: int = PULL_MAX_CONCURRENCY,
+        jitter: float = PULL_JITTER,
+        refresh_interval: float = PULL_CONFIG_REFRESH,
+        state_path: Optional[str] = PULL_STATE_PATH,
+        pool: Optional[ConnectionPool] = None,
+    ):
+        self.load_configs = load_configs or (lambda: get_storage().list_configs())
+        self.max_concurrency = max_concurrency
+        self.jitter = jitter
+        self.refresh_interval = refresh_interval
+        self.state_path = state_path
+        self.pool = pool or ConnectionPool()
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._sources: Dict[str, PullSource] = {}
+        self._due: Dict[str, float] = {}
+        self._running: set = set()
+        self._source_locks: Dict[str, threading.Lock] = {}
+        self._states: Dict[str, Dict[str, Any]] = self._load_state()
+        self._state_file_lock = threading.Lock()
+        self._state_lock_fd: Optional[int] = None
+        self._next_refresh = 0.0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # Lifecycle
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='pull-poll')
+            self._thread = threading.Thread(target=self._run, name='pull-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+            executor, self._executor = self._executor, None
+        if thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            thread.join(timeout=10)
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        self.pool.close()
+        with self._state_file_lock:
+            if self._state_lock_fd is not None:
+                os.close(self._state_lock_fd)
+                self._state_lock_fd = None
+
+    def refresh_soon(self) -> None:
+        """
+        Re-reads the endpoint configs on the next scheduler tick, e.g. after a config changed.
+        """
+        self._next_refresh = 0.0
+        self._wake.set()
+
+    # Scheduling
+
+    def refresh(self) -> None:
+        try:
+            sources = {}
+            for config in self.load_configs():
+                source = PullSource.from_config(config)
+                if source is not None:
+                    sources[source.key] = source
+        except Exception as e:
+            print(f"Pull scheduler could not load endpoint configs: {e}")
+            return
+        now = time.monotonic()
+        with self._lock:
+            for key in set(self._sources) - set(sources):
+                self._due.pop(key, None)
+            for key, source in sources.items():
+                if key not in self._due:
+                    # Spread the first polls out instead of firing every source at once
+                    self._due[key] = now + random.uniform(0, source.interval * self.jitter)
+            self._sources = sources
+
+    def _next_delay(self, interval: float) -> float:
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            now = time.monotonic()
+            if now >= self._next_refresh:
+                self.refresh()
+                self._next_refresh = now + self.refresh_interval
+            with self._lock:
+                due = [key for key, at in self._due.items() if at <= now and key not in self._running]
+                self._running.update(due)
+                sources = [self._sources[key] for key in due]
+                upcoming = [at for key, at in self._due.items() if key not in self._running]
+            for source in sources:
+                self._executor.submit(self._scheduled_poll, source)
+            wait = min(upcoming + [self._next_refresh]) - time.monotonic()
+            self._wake.wait(timeout=min(max(wait, 0.05), self.refresh_interval))
+            self._wake.clear()
+
+    def _scheduled_poll(self, source: PullSource) -> None:
+        try:
+            self.poll(source)
+        except Exception as e:
+            print(f"Pull of '{source.key}' failed: {e}")
+        finally:
+            with self._lock:
+                self._running.discard(source.key)
+                if source.key in self._sources:
+                    self._due[source.key] = time.monotonic() + self._next_delay(source.interval)
+            self._wake.set()
+
+    # Polling
+
+    def fetch(self, source: PullSource, state: Optional[Dict[str, Any]] = None) -> FetchResult:
+        """
+        Fetches the records newer than the source's high-water mark, following next-page
+        tokens up to PULL_MAX_PAGES. Conditional headers go on the first request only.
+        Records at the mark itself are kept unless their ID was already seen there, since
+        several records can share one cursor value.
+        """
+        state = state or {}
+        high_water = state.get('high_water')
+        seen_at_mark = set(state.get('high_water_ids') or [])
+        params = dict(source.params)
+        if source.cursor_param and high_water is not None:
+            params[source.cursor_param] = str(high_water)
+        headers = {'User-Agent': PULL_USER_AGENT, 'Accept': 'application/json', 'Accept-Encoding': 'gzip',
+                   **source.headers}
+        conditional = {}
+        if state.get('etag'):
+            conditional['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            conditional['If-Modified-Since'] = state['last_modified']
+
+        result = FetchResult(high_water=high_water)
+        page_token = None
+        while True:
+            page_params = dict(params)
+            if page_token is not None:
+                page_params[source.next_page_param] = str(page_token)
+            response = self.pool.request('GET', _with_params(source.url, page_params),
+                                         {**headers, **(conditional if result.pages == 0 else {})})
+            result.pages += 1
+            if response.status == 304 and result.pages == 1:
+                result.not_modified = True
+                return result
+            if response.status >= 400:
+                raise PullError(f"GET {source.url} returned HTTP {response.status}.")
+            if result.pages == 1:
+                result.etag = response.headers.get('etag')
+                result.last_modified = response.headers.get('last-modified')
+            records, payload = parse_records(response, source.records_path)
+            result.records.extend(records)
+            page_token = _dig(payload, source.next_page_path) if source.next_page_path else None
+            if page_token in (None, '') or not source.next_page_param or result.pages >= PULL_MAX_PAGES:
+                break
+
+        if source.cursor_field:
+            # The API may ignore the cursor parameter, so records below the mark, and those
+            # at the mark that an earlier poll already ingested, are dropped here too
+            key_fields = idempotency_fields(source.config)
+            kept = []
+            for record in result.records:
+                value = record.get(source.cursor_field)
+                if high_water is not None and value == high_water:
+                    if record_id(record, key_fields) in seen_at_mark:
+                        continue
+                elif not _newer(value, high_water):
+                    continue
+                kept.append(record)
+            result.records = kept
+            for record in kept:
+                value = record.get(source.cursor_field)
+                if value is not None and _newer(value, result.high_water):
+                    result.high_water = value
+            at_mark = {record_id(record, key_fields) for record in kept
+                       if result.high_water is not None and record.get(source.cursor_field) == result.high_water}
+            if result.high_water == high_water:
+                at_mark |= seen_at_mark
+            result.high_water_ids = sorted(at_mark)
+        return result
+
+    def poll(self, source: PullSource) -> PollResult:
+        """
+        Fetches and ingests one source now. The ETag and high-water mark only advance when
+        every record was ingested, so a failed insert is fetched again on the next poll.
+        """
+        with self._lock:
+            source_lock = self._source_locks.setdefault(source.key, threading.Lock())
+        with source_lock:
+            started = time.perf_counter()
+            # Another worker may have polled this source since this one last looked
+            state = dict(self._sync_state().get(source.key, {}))
+            poll = PollResult(source=source.key, outcome='error')
+            try:
+                with timed_stage('pull', source.domain, source.endpoint_id):
+                    fetched = self.fetch(source, state)
+                poll.pages = fetched.pages
+                poll.records_fetched = len(fetched.records)
+                poll.high_water = state.get('high_water')
+                if fetched.not_modified:
+                    poll.outcome, poll.message = 'not_modified', "Source reported no changes."
+                elif not fetched.records:
+                    poll.outcome, poll.message = 'no_new_records', "No new records."
+                else:
+                    ingested = self._ingest(source, fetched.records)
+                    poll.rows_added = ingested.rows_added
+                    poll.rows_rejected = ingested.rows_rejected
+                    poll.message = ingested.message
+                    poll.outcome = 'ingested' if ingested.success else 'error'
+                if poll.outcome != 'error':
+                    state.update(etag=fetched.etag or state.get('etag'),
+                                 last_modified=fetched.last_modified or state.get('last_modified'))
+                    if not fetched.not_modified:
+                        state.update(high_water=fetched.high_water, high_water_ids=fetched.high_water_ids)
+                    if not fetched.not_modified:
+                        state['last_changed'] = time.time()
+                    poll.high_water = fetched.high_water
+            except PullError as e:
+                poll.message = str(e)
+            poll.duration_seconds = round(time.perf_counter() - started, 4)
+
+            state.update(last_poll=time.time(), last_outcome=poll.outcome, last_message=poll.message,
+                         rows_added=state.get('rows_added', 0) + poll.rows_added,
+                         polls=state.get('polls', 0) + 1)
+            self._sync_state(source.key, state)
+            PULL_POLLS.inc(domain=source.domain, endpoint=source.endpoint_id, outcome=poll.outcome)
+            return poll
+
+    def poll_endpoint(self, config: Dict[str, Any]) -> PollResult:
+        source = PullSource.from_config(config)
+        if source is None:
+            raise PullError("Endpoint has no pollable 'pull' source (a RestAPI endpoint with pull.url).")
+        return self.poll(source)
+
+    def _ingest(self, source: PullSource, records: List[Dict[str, Any]]):
+        config = source.config
+        configure_rollups(source.domain, source.table_name, config)
+        result = ingest_records(
+            records,
+            source.table_name,
+            script=config.get('pythonScript'),
+            schema=compile_endpoint_schema(config),
+            sink=submit_to_buffer if config.get('ingestMode') == 'async' else insert_data,
+            label=f"pull {source.key}",
+            key_fields=idempotency_fields(config),
+            domain=source.domain,
+        )
+        RECORDS_INGESTED.inc(result.rows_added, domain=source.domain, endpoint=source.endpoint_id)
+        RECORDS_REJECTED.inc(result.rows_rejected, domain=source.domain, endpoint=source.endpoint_id)
+        return result
+
+    # State
+
+    def _load_state(self) -> Dict[str, Dict[str, Any]]:
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as state_file:
+                return json.load(state_file)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable pull state '{self.state_path}': {e}")
+            return {}
+
+    @contextlib.contextmanager
+    def _locked_state_file(self):
+        # flock serializes processes; the thread lock serializes this process's threads,
+        # which share one descriptor and so would not block each other on the flock
+        with self._state_file_lock:
+            if self._state_lock_fd is None:
+                self._state_lock_fd = os.open(f"{self.state_path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._state_lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._state_lock_fd, fcntl.LOCK_UN)
+
+    def _sync_state(self, key: Optional[str] = None, state: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Merges the state file into memory and returns the merged states. With `key`, that
+        source's `state` is written back too; other sources' entries are left as stored.
+        """
+        if not self.state_path:
+            with self._lock:
+                if key is not None:
+                    self._states[key] = state
+                return dict(self._states)
+        with self._locked_state_file():
+            states = self._load_state()
+            if key is not None:
+                states[key] = state
+                payload = json.dumps(states, default=str)
+                # Write-then-rename so a crash never leaves a torn state file
+                temporary = f"{self.state_path}.tmp"
+                with open(temporary, 'w', encoding='utf-8') as state_file:
+                    state_file.write(payload)
+                os.replace(temporary, self.state_path)
+            with self._lock:
+                self._states.update(states)
+                return dict(self._states)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "running": self._thread is not None,
+                "max_concurrency": self.max_concurrency,
+                "connections_opened": self.pool.connections_opened,
+                "requests": self.pool.requests,
+                "sources": {
+                    key: {
+                        "url": source.url,
+                        "interval_seconds": source.interval,
+                        "polling": key in self._running,
+                        "next_poll_in_seconds": round(max(self._due.get(key, now) - now, 0), 1),
+                        **self._states.get(key, {}),
+                    }
+                    for key, source in self._sources.items()
+                },
+            }
+
+
+_scheduler: Optional[PullScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_pull_scheduler() -> PullScheduler:
+    """
+    Returns the process-wide scheduler. Its polling loop only runs when PULL_SCHEDULER_ENABLED
+    is set; otherwise it still serves on-demand polls.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = PullScheduler()
+            if PULL_SCHEDULER_ENABLED:
+                _scheduler.start()
+                atexit.register(_scheduler.stop)
+        return _scheduler
+
+def _reset_after_fork() -> None:
+    # Sockets and poll threads belong to the parent
+    global _scheduler, _scheduler_lock
+    if _scheduler is not None and _scheduler._state_lock_fd is not None:
+        os.close(_scheduler._state_lock_fd)
+    _scheduler = None
+    _scheduler_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+Gauge(
+    'citypulse_pull_sources', 'Configured pull sources and polls in progress.', ('stat',),
+    callback=lambda: {} if _scheduler is None else {
+        ('sources',): len(_scheduler._sources), ('polling',): len(_scheduler._running)
+    }
+)
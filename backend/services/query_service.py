@@ -0,0 +1,165 @@
+import base64
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from pydantic import BaseModel
+
+from services.cache import TTLCache, MISSING
+from services.firebase_service import add_commit_listener
+from services.storage import get_storage, QueryFilter
+
+# Read path for ingested rows, used by /query/<domain>/<endpoint_id>. Pages are ordered by
+# insert_timestamp and paginated with an opaque keyset cursor, so deep pages cost the same as
+# the first. First pages ("latest N") are cached briefly and dropped as soon as new rows are
+# committed to their table.
+QUERY_DEFAULT_PAGE_SIZE = int(os.environ.get('QUERY_DEFAULT_PAGE_SIZE', 100))
+QUERY_MAX_PAGE_SIZE = int(os.environ.get('QUERY_MAX_PAGE_SIZE', 1000))
+QUERY_CACHE_SIZE = int(os.environ.get('QUERY_CACHE_SIZE', 256))
+QUERY_CACHE_TTL = float(os.environ.get('QUERY_CACHE_TTL', 5.0))
+
+ORDER_FIELD = 'insert_timestamp'
+RESERVED_PARAMS = ('limit', 'cursor', 'fields', 'order')
+# Query-string suffixes, e.g. ?speed__gte=40 or ?status__in=open,closed; a bare ?status=open means ==
+FILTER_SUFFIXES = {'eq': '==', 'ne': '!=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<=', 'in': 'in'}
+
+_cache = TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+# Bumped on every commit to a table; cached pages are keyed on it, so new rows make them unreachable
+_generations: Dict[str, int] = {}
+_generations_lock = threading.Lock()
+
+
+class QueryPage(BaseModel):
+    rows: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+    cached: bool = False
+
+
+def query_fields(config: Dict[str, Any]) -> List[str]:
+    """
+    Fields an endpoint may be filtered on ("queryFields" in its config). They should be
+    indexed in the backend (a composite index with insert_timestamp on Firestore).
+    """
+    fields = config.get('queryFields') or []
+    if isinstance(fields, str):
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+    return list(fields)
+
+
+def _parse_value(text: str) -> Any:
+    # Numbers, booleans and null are typed; anything else (or a quoted string) is a string
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return text
+    return value if isinstance(value, (str, int, float, bool)) or value is None else text
+
+
+def parse_filters(args: Dict[str, str], allowed: List[str]) -> List[QueryFilter]:
+    """
+    Builds storage filters from query-string arguments. Raises ValueError for a field that is
+    not in `allowed` or an unknown operator suffix.
+    """
+    filters = []
+    for name, text in sorted(args.items()):
+        if name in RESERVED_PARAMS:
+            continue
+        field, _, suffix = name.partition('__')
+        op = FILTER_SUFFIXES.get(suffix or 'eq')
+        if op is None:
+            raise ValueError(f"Unknown filter operator '{suffix}' in '{name}'.")
+        if field not in allowed:
+            raise ValueError(f"Field '{field}' cannot be filtered on; queryable fields: {', '.join(allowed) or 'none'}.")
+        value = [_parse_value(item) for item in text.split(',')] if op == 'in' else _parse_value(text)
+        filters.append((field, op, value))
+    return filters
+
+
+def parse_limit(text: Optional[str]) -> int:
+    if not text:
+        return QUERY_DEFAULT_PAGE_SIZE
+    limit = int(text)
+    if limit < 1:
+        raise ValueError("limit must be a positive integer.")
+    return min(limit, QUERY_MAX_PAGE_SIZE)
+
+
+def _json_default(value: Any) -> Any:
+    # Firestore returns insert_timestamp as a datetime
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    position = row.get(ORDER_FIELD)
+    if isinstance(position, datetime):
+        position = {"$ts": position.isoformat()}
+    payload = json.dumps([position, row.get('uuid')], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        position, doc_id = json.loads(payload)
+        if isinstance(position, dict):
+            position = datetime.fromisoformat(position["$ts"])
+    except Exception:
+        raise ValueError("Invalid cursor.")
+    return {ORDER_FIELD: position, 'uuid': doc_id}
+
+
+def _generation(table_name: str) -> int:
+    with _generations_lock:
+        return _generations.get(table_name, 0)
+
+def _on_commit(domain: str, table_name: str, rows: List[Dict[str, Any]]) -> None:
+    with _generations_lock:
+        _generations[table_name] = _generations.get(table_name, 0) + 1
+
+add_commit_listener(_on_commit)
+
+
+def query_rows(
+    table_name: str,
+    filters: Optional[List[QueryFilter]] = None,
+    limit: int = QUERY_DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    descending: bool = True,
+) -> QueryPage:
+    """
+    Returns one page of rows ordered by insert_timestamp (newest first by default) and the
+    cursor of the next page, or None on the last page. First pages are served from a short-TTL
+    cache that is invalidated by commits to the table.
+    """
+    filters = filters or []
+    start_after = decode_cursor(cursor) if cursor else None
+    cache_key = None
+    if start_after is None:
+        cache_key = (table_name, _generation(table_name), tuple((f, op, json.dumps(v)) for f, op, v in filters),
+                     limit, tuple(fields or ()), descending)
+        cached = _cache.get(cache_key)
+        if cached is not MISSING:
+            return cached.model_copy(update={"cached": True})
+
+    # One extra row tells whether there is a next page without a trailing empty request
+    rows = get_storage().query(table_name, filters=filters, order_by=ORDER_FIELD, descending=descending,
+                               limit=limit + 1, start_after=start_after, fields=fields)
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    page = QueryPage(rows=rows[:limit], next_cursor=next_cursor)
+    if cache_key is not None:
+        _cache.set(cache_key, page)
+    return page
+
+
+def iter_ndjson(rows: List[Dict[str, Any]]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row, separators=(',', ':'), default=_json_default) + "\n"
+
+
+def get_query_cache_stats() -> Dict[str, Any]:
+    return _cache.stats()
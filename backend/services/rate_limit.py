@@ -0,0 +1,254 @@
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from services.firebase_service import add_commit_latency_observer
+from services.metrics import Counter, Gauge
+
+# Admission control for /ingest. Each endpoint, and each domain, can have a token bucket set
+# in the endpoint config, so one flooding publisher runs out of tokens instead of taking
+# every worker and the storage write budget. On top of that, an AIMD limiter caps how many
+# ingest requests run at once. It backs off when commit latency rises above target and grows
+# again while commits are fast. Throttled requests are answered immediately with 429.
+INGEST_RATE_LIMIT = float(os.environ.get('INGEST_RATE_LIMIT', 0))  # Default requests/s per endpoint; 0 = unlimited
+INGEST_RATE_BURST = float(os.environ.get('INGEST_RATE_BURST', 0))  # 0 = one second's worth
+INGEST_DOMAIN_RATE_LIMIT = float(os.environ.get('INGEST_DOMAIN_RATE_LIMIT', 0))
+INGEST_DOMAIN_RATE_BURST = float(os.environ.get('INGEST_DOMAIN_RATE_BURST', 0))
+INGEST_ADAPTIVE_CONCURRENCY = os.environ.get('INGEST_ADAPTIVE_CONCURRENCY', 'true').lower() == 'true'
+INGEST_CONCURRENCY_MIN = int(os.environ.get('INGEST_CONCURRENCY_MIN', 4))
+INGEST_CONCURRENCY_MAX = int(os.environ.get('INGEST_CONCURRENCY_MAX', 64))
+INGEST_COMMIT_LATENCY_TARGET = float(os.environ.get('INGEST_COMMIT_LATENCY_TARGET', 0.5))
+
+INGEST_THROTTLED = Counter(
+    'citypulse_ingest_throttled_total', 'Ingest requests answered with 429, by limit hit.', ('domain', 'endpoint', 'reason')
+)
+
+RateLimit = Tuple[float, float]  # (tokens per second, burst)
+
+
+class Throttle(NamedTuple):
+    reason: str  # 'endpoint_rate', 'domain_rate' or 'concurrency'
+    retry_after: float
+    message: str
+
+
+class TokenBucket:
+    """
+    Classic token bucket: refills at `rate` tokens per second up to `burst`.
+    """
+
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = clock()
+        self.granted = 0
+        self.throttled = 0
+
+    def configure(self, rate: float, burst: float) -> None:
+        with self._lock:
+            self._refill()
+            self.rate, self.burst = rate, burst
+            self._tokens = min(self._tokens, burst)
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, cost: float = 1.0) -> float:
+        """
+        Takes `cost` tokens and returns 0, or takes nothing and returns the seconds until
+        enough tokens will be available.
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= cost:
+                self._tokens -= cost
+                self.granted += 1
+                return 0.0
+            self.throttled += 1
+            return (cost - self._tokens) / self.rate if self.rate > 0 else math.inf
+
+    def refund(self, cost: float = 1.0) -> None:
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + cost)
+            self.granted -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill()
+            return {"rate": self.rate, "burst": self.burst, "tokens": round(self._tokens, 3),
+                    "granted": self.granted, "throttled": self.throttled}
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limit driven by storage commit latency. Every commit updates an
+    exponentially weighted average. While it is under `target_latency` the limit grows by
+    about one slot per limit's worth of commits. Above the target, or on a failed commit, it
+    shrinks by `backoff` at most once per `cooldown` seconds.
+    """
+
+    def __init__(
+        self,
+        min_limit: int = INGEST_CONCURRENCY_MIN,
+        max_limit: int = INGEST_CONCURRENCY_MAX,
+        target_latency: float = INGEST_COMMIT_LATENCY_TARGET,
+        backoff: float = 0.75,
+        smoothing: float = 0.2,
+        cooldown: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.smoothing = smoothing
+        self.cooldown = cooldown if cooldown is not None else max(target_latency, 0.1)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self.rejected = 0
+        self.decreases = 0
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight >= int(self.limit):
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def observe(self, seconds: float, ok: bool = True) -> None:
+        with self._lock:
+            self.latency = seconds if self.latency is None else (
+                self.smoothing * seconds + (1 - self.smoothing) * self.latency
+            )
+            if not ok or self.latency > self.target_latency:
+                now = self._clock()
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                    self._last_decrease = now
+                    self.decreases += 1
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "commit_latency_ewma_seconds": round(self.latency, 4) if self.latency is not None else None,
+                "target_latency_seconds": self.target_latency,
+                "rejected": self.rejected,
+                "decreases": self.decreases,
+            }
+
+
+def _parse_limit(rate: Any, burst: Any, default_rate: float, default_burst: float) -> Optional[RateLimit]:
+    rate = float(rate) if rate is not None else default_rate
+    if rate <= 0:
+        return None
+    burst = float(burst) if burst is not None else (default_burst or rate)
+    return rate, max(burst, 1.0)
+
+
+def rate_limits(config: Dict[str, Any]) -> Tuple[Optional[RateLimit], Optional[RateLimit]]:
+    """
+    Endpoint and domain (rate, burst) from the config's "rateLimit" block, e.g.
+    {"requestsPerSecond": 20, "burst": 40, "domainRequestsPerSecond": 100, "domainBurst": 200},
+    falling back to the INGEST_*RATE* defaults. None means unlimited.
+    """
+    block = config.get('rateLimit') or {}
+    endpoint = _parse_limit(block.get('requestsPerSecond'), block.get('burst'), INGEST_RATE_LIMIT, INGEST_RATE_BURST)
+    domain = _parse_limit(block.get('domainRequestsPerSecond'), block.get('domainBurst'),
+                          INGEST_DOMAIN_RATE_LIMIT, INGEST_DOMAIN_RATE_BURST)
+    return endpoint, domain
+
+
+class IngestAdmission:
+    """
+    Per-endpoint and per-domain token buckets plus the adaptive concurrency limiter.
+    """
+
+    def __init__(self, limiter: Optional[AdaptiveConcurrencyLimiter] = None):
+        self.limiter = limiter
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, key: Tuple[str, str], limit: RateLimit) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(*limit)
+                return bucket
+        if (bucket.rate, bucket.burst) != limit:
+            # The config changed (or another endpoint of the domain carries a different domain limit)
+            bucket.configure(*limit)
+        return bucket
+
+    def check_rate(self, domain: str, endpoint_id: str, config: Dict[str, Any]) -> Optional[Throttle]:
+        endpoint_limit, domain_limit = rate_limits(config)
+        endpoint_bucket = self._bucket(('endpoint', f"{domain}/{endpoint_id}"), endpoint_limit) if endpoint_limit else None
+        if endpoint_bucket is not None:
+            wait = endpoint_bucket.take()
+            if wait:
+                return Throttle('endpoint_rate', wait,
+                                f"Rate limit of {endpoint_limit[0]:g} requests/s exceeded for '{domain}/{endpoint_id}'.")
+        if domain_limit:
+            wait = self._bucket(('domain', domain), domain_limit).take()
+            if wait:
+                if endpoint_bucket is not None:
+                    endpoint_bucket.refund()
+                return Throttle('domain_rate', wait,
+                                f"Rate limit of {domain_limit[0]:g} requests/s exceeded for domain '{domain}'.")
+        return None
+
+    def admit(self, domain: str, endpoint_id: str, config: Dict[str, Any]) -> Optional[Throttle]:
+        """
+        Returns None and takes a concurrency slot (give it back with release()), or returns
+        the Throttle to answer with.
+        """
+        throttle = self.check_rate(domain, endpoint_id, config)
+        if throttle is None and self.limiter is not None and not self.limiter.try_acquire():
+            throttle = Throttle('concurrency', 1.0, "Ingest is backing off while storage commits are slow; retry shortly.")
+        if throttle is not None:
+            INGEST_THROTTLED.inc(domain=domain, endpoint=endpoint_id, reason=throttle.reason)
+        return throttle
+
+    def release(self) -> None:
+        if self.limiter is not None:
+            self.limiter.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {
+            "concurrency": self.limiter.stats() if self.limiter is not None else None,
+            "endpoints": {name: bucket.stats() for (kind, name), bucket in buckets.items() if kind == 'endpoint'},
+            "domains": {name: bucket.stats() for (kind, name), bucket in buckets.items() if kind == 'domain'},
+        }
+
+
+ingest_admission = IngestAdmission(AdaptiveConcurrencyLimiter() if INGEST_ADAPTIVE_CONCURRENCY else None)
+
+if ingest_admission.limiter is not None:
+    add_commit_latency_observer(ingest_admission.limiter.observe)
+
+    Gauge(
+        'citypulse_ingest_concurrency', 'Adaptive ingest concurrency limit and requests in flight.', ('stat',),
+        callback=lambda: {(name,): value for name, value in ingest_admission.limiter.stats().items()
+                          if name in ('limit', 'in_flight') or name == 'commit_latency_ewma_seconds' and value is not None}
+    )
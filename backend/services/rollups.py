@@ -0,0 +1,230 @@
+import atexit
+import math
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.cache import TTLCache, MISSING
+from services.firebase_service import add_commit_listener
+from services.metrics import Gauge
+from services.storage import RollupMergeError, get_storage, merge_rollup
+
+# Dashboard aggregates maintained at ingest time. Every committed batch bumps in-memory
+# counters per domain, table and hour/day bucket, plus sum/min/max for the numeric fields
+# listed in the endpoint's "rollupFields". A background thread folds these deltas into a
+# few aggregate documents per bucket, so /stats reads O(buckets) documents instead of
+# scanning the ingested tables.
+ROLLUPS_ENABLED = os.environ.get('ROLLUPS_ENABLED', 'true').lower() == 'true'
+ROLLUP_FLUSH_INTERVAL = float(os.environ.get('ROLLUP_FLUSH_INTERVAL', 10.0))
+STATS_CACHE_TTL = float(os.environ.get('STATS_CACHE_TTL', 5.0))
+
+GRANULARITIES = ('hour', 'day')
+
+RollupKey = Tuple[str, str, str, str]  # (granularity, domain, table, bucket)
+
+
+def bucket_labels(moment: datetime) -> Dict[str, str]:
+    moment = moment.astimezone(timezone.utc)
+    return {
+        'hour': moment.strftime('%Y-%m-%dT%H:00:00Z'),
+        'day': moment.strftime('%Y-%m-%d'),
+    }
+
+
+def field_stats(rows: List[Dict[str, Any]], fields: List[str]) -> Dict[str, Dict[str, float]]:
+    """
+    count/sum/min/max of each numeric field across rows. Non-numeric, boolean and
+    non-finite values are ignored.
+    """
+    stats = {}
+    for name in fields:
+        values = [
+            value for value in (row.get(name) for row in rows)
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+        ]
+        if values:
+            stats[name] = {"count": len(values), "sum": sum(values), "min": min(values), "max": max(values)}
+    return stats
+
+
+class RollupAccumulator:
+    """
+    Collects rollup deltas in memory and periodically merges them into storage.
+    Deltas from a failed flush are kept and retried on the next one, except those the
+    backend reports as already merged.
+    """
+
+    def __init__(self, flush_interval: float = ROLLUP_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[RollupKey, Dict[str, Any]] = {}
+        self._fields: Dict[Tuple[str, str], List[str]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.rows_recorded = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.documents_written = 0
+
+    def configure(self, domain: str, table_name: str, fields: Optional[List[str]]) -> None:
+        """
+        Sets the numeric fields aggregated for a domain's table (from the endpoint config).
+        """
+        fields = list(fields or [])
+        key = (domain, table_name)
+        if self._fields.get(key) != fields:
+            with self._lock:
+                self._fields[key] = fields
+
+    def record(self, domain: str, table_name: str, rows: List[Dict[str, Any]],
+               moment: Optional[datetime] = None) -> None:
+        if not rows:
+            return
+        stats = field_stats(rows, self._fields.get((domain, table_name), []))
+        labels = bucket_labels(moment or datetime.now(timezone.utc))
+        with self._lock:
+            for granularity, bucket in labels.items():
+                key = (granularity, domain, table_name, bucket)
+                delta = {"granularity": granularity, "domain": domain, "table": table_name, "bucket": bucket,
+                         "count": len(rows), "fields": stats}
+                self._pending[key] = merge_rollup(self._pending.get(key), delta)
+            self.rows_recorded += len(rows)
+
+    def pending(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._pending.values())
+
+    def flush(self) -> bool:
+        with self._flush_lock:
+            with self._lock:
+                deltas, self._pending = self._pending, {}
+            if not deltas:
+                return True
+            keys = list(deltas)
+            try:
+                get_storage().merge_rollups([deltas[key] for key in keys])
+            except Exception as e:
+                # Re-queueing a delta that was already merged would count it twice
+                committed = e.committed if isinstance(e, RollupMergeError) else 0
+                print(f"Rollup flush failed after {committed} of {len(keys)} documents, will retry: {e}")
+                with self._lock:
+                    for key in keys[committed:]:
+                        self._pending[key] = merge_rollup(self._pending.get(key), deltas[key])
+                    self.failed_flushes += 1
+                    self.documents_written += committed
+                return False
+            with self._lock:
+                self.flushes += 1
+                self.documents_written += len(deltas)
+            return True
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='rollup-flusher', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=30)
+            self._thread = None
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending_documents": len(self._pending),
+                "rows_recorded": self.rows_recorded,
+                "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes,
+                "documents_written": self.documents_written,
+                "flush_interval_seconds": self.flush_interval,
+            }
+
+
+_accumulator: Optional[RollupAccumulator] = None
+_accumulator_lock = threading.Lock()
+_stats_cache = TTLCache(maxsize=256, ttl=STATS_CACHE_TTL)
+
+def get_rollup_accumulator() -> RollupAccumulator:
+    """
+    Returns the process-wide accumulator, starting its flusher on first use.
+    """
+    global _accumulator
+    with _accumulator_lock:
+        if _accumulator is None:
+            _accumulator = RollupAccumulator()
+            _accumulator.start()
+            atexit.register(_accumulator.stop)
+        return _accumulator
+
+def _reset_after_fork() -> None:
+    # The flusher thread does not survive fork, and the parent's deltas are the parent's to flush
+    global _accumulator, _accumulator_lock
+    _accumulator = None
+    _accumulator_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+Gauge(
+    'citypulse_rollups', 'Ingest rollup accumulator backlog and flush counters.', ('stat',),
+    callback=lambda: {} if _accumulator is None else {
+        (name,): value for name, value in _accumulator.stats().items() if name != 'flush_interval_seconds'
+    }
+)
+
+
+def configure_rollups(domain: str, table_name: str, config: Dict[str, Any]) -> None:
+    if ROLLUPS_ENABLED and table_name:
+        get_rollup_accumulator().configure(domain, table_name, config.get('rollupFields'))
+
+def _on_commit(domain: str, table_name: str, rows: List[Dict[str, Any]]) -> None:
+    if ROLLUPS_ENABLED:
+        get_rollup_accumulator().record(domain, table_name, rows)
+
+add_commit_listener(_on_commit)
+
+
+def get_stats(granularity: str = 'day', domain: Optional[str] = None,
+              since: Optional[str] = None, until: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Rollups for the dashboard: stored aggregates plus this process's unflushed deltas,
+    with per-domain and per-table totals. Results are cached for STATS_CACHE_TTL seconds.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}.")
+    cache_key = (granularity, domain, since, until)
+    cached = _stats_cache.get(cache_key)
+    if cached is not MISSING:
+        return cached
+
+    merged: Dict[RollupKey, Dict[str, Any]] = {}
+    documents = get_storage().get_rollups(granularity, domain=domain, since=since, until=until)
+    local = get_rollup_accumulator().pending() if ROLLUPS_ENABLED else []
+    for rollup in documents + local:
+        if rollup["granularity"] != granularity or (domain and rollup["domain"] != domain):
+            continue
+        if (since and rollup["bucket"] < since) or (until and rollup["bucket"] > until):
+            continue
+        key = (granularity, rollup["domain"], rollup["table"], rollup["bucket"])
+        merged[key] = merge_rollup(merged.get(key), rollup)
+
+    buckets = []
+    totals: Dict[str, Dict[str, Any]] = {}
+    for key in sorted(merged, key=lambda k: (k[3], k[1], k[2])):
+        rollup = merged[key]
+        buckets.append({name: rollup[name] for name in ("domain", "table", "bucket", "count", "fields")})
+        domain_totals = totals.setdefault(rollup["domain"], {"count": 0, "tables": {}})
+        domain_totals["count"] += rollup["count"]
+        domain_totals["tables"][rollup["table"]] = domain_totals["tables"].get(rollup["table"], 0) + rollup["count"]
+
+    result = {"granularity": granularity, "buckets": buckets, "totals": totals}
+    _stats_cache.set(cache_key, result)
+    return result
@@ -0,0 +1,39 @@
+import os
+import threading
+from typing import Any
+
+# Genkit and the Google AI plugin take a noticeable share of startup, so they are imported
+# and initialized on first use instead of when main.py is imported. After a fork (gunicorn
+# workers) the child initializes its own copy rather than reusing the parent's clients.
+_genkit: Any = None
+_genkit_lock = threading.Lock()
+
+
+def get_genkit():
+    """
+    Returns the genkit module, initialized with the Google AI plugin.
+    GOOGLE_API_KEY is read on the first call.
+    """
+    global _genkit
+    if _genkit is not None:
+        return _genkit
+    with _genkit_lock:
+        if _genkit is None:
+            import genkit
+            import genkit.google_ai
+            genkit.init(
+                log_level="INFO",
+                plugins=[
+                    genkit.google_ai.google_ai(api_key=os.environ.get("GOOGLE_API_KEY")),
+                ],
+            )
+            _genkit = genkit
+        return _genkit
+
+
+def _reset_after_fork() -> None:
+    global _genkit, _genkit_lock
+    _genkit = None
+    _genkit_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
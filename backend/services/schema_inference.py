@@ -0,0 +1,225 @@
+import io
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from services import schema_validator
+from services.schema_validator import coerce_column, load_pandas
+
+# Local schema inference for uploaded files and sample payloads. A bounded sample is loaded
+# into a DataFrame and each column is typed with the same vectorized coercers that enforce
+# schemas at ingest: a column gets the most specific type that accepts every sampled value,
+# so the inferred schema never rejects the sample it came from. Runs in milliseconds, so
+# the LLM is only needed for the descriptive metadata.
+SCHEMA_INFERENCE_SAMPLE_ROWS = int(os.environ.get('SCHEMA_INFERENCE_SAMPLE_ROWS', 1000))
+SCHEMA_INFERENCE_MAX_BYTES = int(os.environ.get('SCHEMA_INFERENCE_MAX_BYTES', 5 * 1024 * 1024))
+MAX_EXAMPLE_VALUES = 3
+
+# Tried in order; numbers come before BOOLEAN so 0/1 columns stay INTEGER, and before
+# TIMESTAMP, which would also accept them as epoch seconds
+INFERENCE_ORDER = ('INTEGER', 'FLOAT', 'BOOLEAN', 'TIMESTAMP', 'GEOGRAPHY')
+
+_LATITUDE_NAMES = {'lat', 'latitude'}
+_LONGITUDE_NAMES = {'lon', 'lng', 'long', 'longitude'}
+_DECIMAL_TEXT = re.compile(r'[.eE]')
+
+
+class SampleError(Exception):
+    """Raised when an uploaded sample cannot be read."""
+
+
+class ColumnProfile(BaseModel):
+    name: str
+    type: Optional[str] = None  # None for nested objects/arrays, which are left out of the schema
+    nullable: bool = True
+    null_count: int = 0
+    distinct_count: int = 0
+    examples: List[Any] = []
+
+
+class InferredSchema(BaseModel):
+    rows_sampled: int
+    columns: List[ColumnProfile]
+    geo_pairs: List[List[str]] = []  # Separate [latitude, longitude] FLOAT columns
+
+    def schema_definition(self) -> Dict[str, Dict[str, str]]:
+        """
+        The schema in the {"field": {"type", "mode"}} form compile_schema() enforces.
+        """
+        return {
+            column.name: {"type": column.type, "mode": "NULLABLE" if column.nullable else "REQUIRED"}
+            for column in self.columns if column.type
+        }
+
+    def schema_str(self) -> str:
+        return json.dumps(self.schema_definition())
+
+    def summary(self) -> str:
+        """
+        One line per column for LLM prompts, e.g. "speed: FLOAT, required, 40 distinct, e.g. 41.5, 38.0".
+        """
+        lines = []
+        for column in self.columns:
+            examples = ', '.join(json.dumps(value, default=str) for value in column.examples)
+            lines.append(f"{column.name}: {column.type or 'nested'}, {'nullable' if column.nullable else 'required'}, "
+                         f"{column.distinct_count} distinct, e.g. {examples}")
+        for latitude, longitude in self.geo_pairs:
+            lines.append(f"{latitude}/{longitude}: latitude/longitude pair")
+        return "\n".join(lines)
+
+
+def _infer_type(values, kinds) -> Optional[str]:
+    # `values` holds the non-null sampled values of one column and `kinds` their Python types
+    if kinds.isin((dict, list)).any():
+        # Only an all-structured column can be a point ({"lat", "lng"} or [lat, lng])
+        return 'GEOGRAPHY' if not coerce_column('GEOGRAPHY', values)[1].any() else None
+    is_bool = kinds == bool
+    if is_bool.all():
+        return 'BOOLEAN'
+    is_text = kinds == str
+    has_decimal = (kinds == float).any() or (is_text.any() and values[is_text].str.contains(_DECIMAL_TEXT).any())
+    for column_type in INFERENCE_ORDER:
+        if column_type == 'INTEGER' and has_decimal:
+            continue
+        if column_type in ('TIMESTAMP', 'GEOGRAPHY') and is_bool.any():
+            continue
+        if column_type == 'GEOGRAPHY' and not is_text.all():
+            continue
+        if not coerce_column(column_type, values)[1].any():
+            return column_type
+    return 'STRING'
+
+
+def _geo_pairs(columns: List[ColumnProfile], frame) -> List[List[str]]:
+    numeric = {column.name.lower(): column.name for column in columns if column.type in ('FLOAT', 'INTEGER')}
+    latitude = next((numeric[name] for name in _LATITUDE_NAMES if name in numeric), None)
+    longitude = next((numeric[name] for name in _LONGITUDE_NAMES if name in numeric), None)
+    if not latitude or not longitude:
+        return []
+    pd = schema_validator.pd
+    lat = pd.to_numeric(frame[latitude], errors='coerce').abs()
+    lng = pd.to_numeric(frame[longitude], errors='coerce').abs()
+    return [[latitude, longitude]] if (lat.dropna() <= 90).all() and (lng.dropna() <= 180).all() else []
+
+
+def infer_frame(frame) -> InferredSchema:
+    """
+    Profiles every column of a sampled DataFrame: inferred type, nullability, distinct
+    values and a few examples.
+    """
+    load_pandas()
+    columns = []
+    for name in frame.columns:
+        values = frame[name].astype(object)
+        kinds = values.map(type)
+        # Blank CSV cells and whitespace-only strings count as missing
+        is_text = kinds == str
+        if is_text.any():
+            blank = values[is_text].str.strip() == ''
+            values = values.drop(blank.index[blank.to_numpy()])
+            kinds = kinds[values.index]
+        present_mask = values.notna()
+        present, kinds = values[present_mask], kinds[present_mask]
+        null_count = len(frame) - len(present)
+        if present.empty:
+            columns.append(ColumnProfile(name=str(name), type='STRING', null_count=null_count))
+            continue
+        nested = kinds.isin((dict, list))
+        distinct = present.map(lambda v: json.dumps(v, sort_keys=True, default=str)) if nested.any() else present
+        examples = present[~nested.to_numpy()].drop_duplicates() if not nested.all() else present
+        columns.append(ColumnProfile(
+            name=str(name),
+            type=_infer_type(present, kinds),
+            nullable=null_count > 0,
+            null_count=null_count,
+            distinct_count=int(distinct.nunique()),
+            examples=[value.item() if hasattr(value, 'item') else value
+                      for value in examples.iloc[:MAX_EXAMPLE_VALUES].tolist()],
+        ))
+    return InferredSchema(rows_sampled=len(frame), columns=columns, geo_pairs=_geo_pairs(columns, frame))
+
+
+def infer_schema(records: List[Dict[str, Any]]) -> InferredSchema:
+    """
+    Infers a schema from sample records (e.g. webhook payloads), using at most
+    SCHEMA_INFERENCE_SAMPLE_ROWS of them. Fields missing from some records are nullable.
+    """
+    load_pandas()
+    sample = [record for record in records[:SCHEMA_INFERENCE_SAMPLE_ROWS] if isinstance(record, dict)]
+    if not sample:
+        raise SampleError("The sample contains no JSON objects.")
+    # Columns in first-seen order; object dtype keeps ints as ints when some records lack the field
+    columns = list(dict.fromkeys(key for record in sample for key in record))
+    return infer_frame(schema_validator.pd.DataFrame(sample, columns=columns, dtype=object))
+
+
+def sample_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    """
+    'csv', 'ndjson' or 'json' from an upload's file extension, falling back to its content type.
+    """
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension in ('.csv', '.tsv'):
+        return 'csv'
+    if extension in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    if extension == '.json':
+        return 'json'
+    if content_type and 'csv' in content_type:
+        return 'csv'
+    if content_type and ('ndjson' in content_type or 'jsonl' in content_type):
+        return 'ndjson'
+    return 'json'
+
+
+def _read_bounded(stream) -> Tuple[bytes, bool]:
+    data = stream.read(SCHEMA_INFERENCE_MAX_BYTES + 1)
+    truncated = len(data) > SCHEMA_INFERENCE_MAX_BYTES
+    if truncated:
+        # Drop the partial last line; only line-oriented formats can be sampled from a prefix
+        data = data[:data.rfind(b'\n', 0, SCHEMA_INFERENCE_MAX_BYTES) + 1]
+    return data, truncated
+
+
+def infer_upload(stream, fmt: str, filename: Optional[str] = None) -> InferredSchema:
+    """
+    Infers a schema from the first SCHEMA_INFERENCE_SAMPLE_ROWS records of an uploaded file,
+    reading at most SCHEMA_INFERENCE_MAX_BYTES of it. Raises SampleError if it cannot be parsed.
+    """
+    load_pandas()
+    pd = schema_validator.pd
+    data, truncated = _read_bounded(stream)
+    if fmt == 'csv':
+        separator = '\t' if (filename or '').lower().endswith('.tsv') else ','
+        try:
+            # Everything is read as text so the coercers, not the CSV parser, decide the types
+            frame = pd.read_csv(io.BytesIO(data), dtype=str, nrows=SCHEMA_INFERENCE_SAMPLE_ROWS, sep=separator,
+                                encoding_errors='replace')
+        except (ValueError, pd.errors.ParserError) as e:
+            raise SampleError(f"Could not parse the CSV sample: {e}")
+        if frame.empty and not len(frame.columns):
+            raise SampleError("The CSV sample is empty.")
+        return infer_frame(frame)
+
+    text = data.decode('utf-8', errors='replace')
+    if fmt == 'ndjson':
+        records = []
+        for line in text.splitlines():
+            if len(records) >= SCHEMA_INFERENCE_SAMPLE_ROWS:
+                break
+            if line.strip():
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return infer_schema(records)
+
+    if truncated:
+        raise SampleError(f"JSON samples are limited to {SCHEMA_INFERENCE_MAX_BYTES} bytes; upload NDJSON or CSV instead.")
+    try:
+        payload = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise SampleError(f"Could not parse the JSON sample: {e.msg}")
+    return infer_schema(payload if isinstance(payload, list) else [payload])
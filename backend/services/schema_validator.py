@@ -0,0 +1,326 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from services.cache import TTLCache, MISSING
+
+# Enforces an endpoint's declared schema at ingest time. Each schema is compiled once
+# into a list of typed columns and cached by content hash; batches are then validated
+# and coerced column by column with pandas instead of record by record.
+SCHEMA_CACHE_SIZE = int(os.environ.get('SCHEMA_CACHE_SIZE', 512))
+MAX_REPORTED_REJECTIONS = int(os.environ.get('MAX_REPORTED_REJECTIONS', 100))
+
+# numpy and pandas are imported by the first validation (see load_pandas), not at startup
+np: Any = None
+pd: Any = None
+
+SUPPORTED_TYPES = ('STRING', 'INTEGER', 'FLOAT', 'BOOLEAN', 'TIMESTAMP', 'GEOGRAPHY')
+
+_TYPE_ALIASES = {
+    'STRING': 'STRING', 'STR': 'STRING', 'TEXT': 'STRING',
+    'INTEGER': 'INTEGER', 'INT': 'INTEGER', 'INT64': 'INTEGER',
+    'FLOAT': 'FLOAT', 'FLOAT64': 'FLOAT', 'DOUBLE': 'FLOAT', 'NUMERIC': 'FLOAT', 'NUMBER': 'FLOAT',
+    'BOOLEAN': 'BOOLEAN', 'BOOL': 'BOOLEAN',
+    'TIMESTAMP': 'TIMESTAMP', 'DATETIME': 'TIMESTAMP', 'DATE': 'TIMESTAMP',
+    'GEOGRAPHY': 'GEOGRAPHY', 'GEOPOINT': 'GEOGRAPHY',
+}
+
+_TRUE_VALUES = {'true', 't', 'yes', 'y', '1'}
+_FALSE_VALUES = {'false', 'f', 'no', 'n', '0'}
+
+# "lat,lon" / "lat lon" and WKT "POINT(lon lat)"
+_LAT_LON_PATTERN = r'^\s*(-?\d+(?:\.\d+)?)\s*[, ]\s*(-?\d+(?:\.\d+)?)\s*$'
+_WKT_POINT_PATTERN = r'^\s*POINT\s*\(\s*(-?\d+(?:\.\d+)?)\s+(-?\d+(?:\.\d+)?)\s*\)\s*$'
+
+
+class ColumnSpec(BaseModel):
+    name: str
+    type: str
+    required: bool = False
+
+
+class CompiledSchema(BaseModel):
+    digest: str
+    columns: List[ColumnSpec]
+
+
+class RowRejection(BaseModel):
+    index: int  # Position of the row in the validated batch
+    reasons: List[str]
+
+
+class ValidationResult(BaseModel):
+    valid_rows: List[Dict[str, Any]]
+    valid_indexes: List[int] = []  # Position in the validated batch of each valid row
+    rejected_count: int = 0
+    rejections: List[RowRejection] = []  # Capped at MAX_REPORTED_REJECTIONS
+
+
+def _normalize_type(value: Any) -> Tuple[Optional[str], bool]:
+    """
+    Returns (type, required) for one schema entry. Accepts a bare type name, a
+    {"type": ..., "mode"/"required": ...} object, or a JSON Schema property.
+    """
+    required = False
+    if isinstance(value, dict):
+        required = value.get('mode', '').upper() == 'REQUIRED' or value.get('required') is True
+        json_type = value.get('type')
+        if isinstance(json_type, list):
+            # JSON Schema nullable form, e.g. ["string", "null"]
+            json_type = next((t for t in json_type if t != 'null'), None)
+        if json_type == 'string' and value.get('format') in ('date-time', 'date'):
+            json_type = 'TIMESTAMP'
+        elif json_type == 'object' and {'lat', 'lon'} <= set(value.get('properties', {})):
+            json_type = 'GEOGRAPHY'
+        value = json_type
+    if not isinstance(value, str):
+        return None, required
+    return _TYPE_ALIASES.get(value.strip().upper()), required
+
+
+def parse_schema(schema: Any) -> Optional[Dict[str, Any]]:
+    """
+    Turns a stored schema (dict or JSON string) into {field: type-spec}, or None if unusable.
+    """
+    if isinstance(schema, str):
+        try:
+            schema = json.loads(schema)
+        except json.JSONDecodeError:
+            return None
+    if not isinstance(schema, dict) or not schema:
+        return None
+    if isinstance(schema.get('properties'), dict):
+        required = set(schema.get('required') or [])
+        return {
+            name: {**spec, 'required': True} if name in required and isinstance(spec, dict) else spec
+            for name, spec in schema['properties'].items()
+        }
+    return schema
+
+
+_compiled_cache = TTLCache(maxsize=SCHEMA_CACHE_SIZE, ttl=float('inf'))
+
+def compile_schema(schema: Any) -> Optional[CompiledSchema]:
+    """
+    Compiles a schema into typed column specs, cached by content hash.
+    Fields with unknown types are left unchecked; returns None when nothing is enforceable.
+    """
+    fields = parse_schema(schema)
+    if fields is None:
+        return None
+    digest = hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    compiled = _compiled_cache.get(digest)
+    if compiled is MISSING:
+        columns = []
+        for name, spec in fields.items():
+            column_type, required = _normalize_type(spec)
+            if column_type:
+                columns.append(ColumnSpec(name=name, type=column_type, required=required))
+        compiled = CompiledSchema(digest=digest, columns=columns) if columns else None
+        _compiled_cache.set(digest, compiled)
+    return compiled
+
+def compile_endpoint_schema(config: Dict[str, Any]) -> Optional[CompiledSchema]:
+    """
+    Resolves the schema to enforce for an endpoint config. `schema_definition` (from the
+    data domain flow) wins over the `schema` string (from the metadata flow), and
+    "enforceSchema": false turns enforcement off.
+    """
+    if config.get('enforceSchema') is False:
+        return None
+    for key in ('schema_definition', 'schema'):
+        if config.get(key):
+            compiled = compile_schema(config[key])
+            if compiled is not None:
+                return compiled
+    return None
+
+
+# Column coercers: each takes the non-null values of a column and returns
+# (coerced values, boolean mask of values that failed), aligned to the input index.
+
+def _coerce_string(values: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    bad = values.map(lambda v: isinstance(v, (dict, list))).astype(bool)
+    return values.where(bad, values.astype(str)), bad
+
+def _exact_integer(value: Any) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            return None
+    return None
+
+def _coerce_integer(values: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    is_bool = values.map(lambda v: isinstance(v, bool)).astype(bool)
+    # Ints and integer strings are taken as-is; going through float64 would round them past 2**53.
+    # Series.map would infer a float dtype for ints mixed with None, so build the object Series directly.
+    exact = pd.Series([_exact_integer(v) for v in values], index=values.index, dtype=object)
+    is_exact = exact.notna()
+    numeric = pd.to_numeric(values.where(~is_bool & ~is_exact), errors='coerce')
+    whole = np.isfinite(numeric.fillna(np.inf)) & (numeric == np.floor(numeric))
+    from_numeric = pd.Series([int(v) if ok else None for v, ok in zip(numeric, whole)], index=values.index, dtype=object)
+    coerced = exact.where(is_exact, from_numeric)
+    # Values past the int64 range do not fit the storage backends' integer columns
+    out_of_range = np.fromiter((v is not None and not -2 ** 63 <= v < 2 ** 63 for v in coerced),
+                               dtype=bool, count=len(coerced))
+    bad = coerced.isna().to_numpy() | out_of_range
+    return coerced, pd.Series(bad, index=values.index)
+
+def _coerce_float(values: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    is_bool = values.map(lambda v: isinstance(v, bool)).astype(bool)
+    numeric = pd.to_numeric(values.where(~is_bool), errors='coerce')
+    bad = numeric.isna() | is_bool | np.isinf(numeric.fillna(0))
+    return numeric.astype(float), bad
+
+def _coerce_boolean(values: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    text = values.astype(str).str.strip().str.lower()
+    coerced = pd.Series(np.where(text.isin(_TRUE_VALUES), True, np.where(text.isin(_FALSE_VALUES), False, None)),
+                        index=values.index, dtype=object)
+    return coerced, coerced.isna()
+
+def _coerce_timestamp(values: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    is_number = values.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool)).astype(bool)
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns, UTC]')
+    if is_number.any():
+        parsed[is_number] = pd.to_datetime(values[is_number].astype(float), unit='s', utc=True, errors='coerce')
+    if (~is_number).any():
+        parsed[~is_number] = pd.to_datetime(values[~is_number].astype(str), utc=True, errors='coerce', format='ISO8601')
+    bad = parsed.isna()
+    iso = np.datetime_as_string(parsed.dt.tz_convert(None).to_numpy(), unit='ms')
+    return pd.Series(np.char.add(iso, 'Z'), index=values.index, dtype=object), bad
+
+def _coerce_geography(values: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    lat = pd.Series(np.nan, index=values.index)
+    lng = pd.Series(np.nan, index=values.index)
+
+    is_text = values.map(lambda v: isinstance(v, str)).astype(bool)
+    if is_text.any():
+        text = values[is_text]
+        pairs = text.str.extract(_LAT_LON_PATTERN).astype(float)
+        lat[is_text] = pairs[0]
+        lng[is_text] = pairs[1]
+        unmatched = text[pairs[0].isna()]
+        if not unmatched.empty:
+            wkt = unmatched.str.extract(_WKT_POINT_PATTERN, flags=re.IGNORECASE).astype(float)
+            lat[wkt.index] = wkt[1]
+            lng[wkt.index] = wkt[0]
+
+    structured = values[~is_text]
+    if not structured.empty:
+        def point(value):
+            if isinstance(value, dict):
+                return (value.get('lat', value.get('latitude')),
+                        value.get('lng', value.get('lon', value.get('longitude'))))
+            if isinstance(value, (list, tuple)) and len(value) == 2:
+                return value[0], value[1]
+            return None, None
+        points = structured.map(point)
+        lat[~is_text] = pd.to_numeric(points.map(lambda p: p[0]), errors='coerce')
+        lng[~is_text] = pd.to_numeric(points.map(lambda p: p[1]), errors='coerce')
+
+    bad = lat.isna() | lng.isna() | (lat.abs() > 90) | (lng.abs() > 180)
+    coerced = pd.Series(
+        [None if b else {"lat": float(a), "lng": float(o)} for a, o, b in zip(lat, lng, bad)],
+        index=values.index, dtype=object
+    )
+    return coerced, bad
+
+_COERCERS = {
+    'STRING': _coerce_string,
+    'INTEGER': _coerce_integer,
+    'FLOAT': _coerce_float,
+    'BOOLEAN': _coerce_boolean,
+    'TIMESTAMP': _coerce_timestamp,
+    'GEOGRAPHY': _coerce_geography,
+}
+
+
+def coerce_column(column_type: str, values: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """
+    Coerces the non-null values of one column to `column_type`; returns (coerced values, mask of failures).
+    """
+    load_pandas()
+    return _COERCERS[column_type](values)
+
+
+def load_pandas() -> None:
+    global np, pd
+    if pd is None:
+        import numpy
+        import pandas
+        np, pd = numpy, pandas
+
+def validate_records(compiled: CompiledSchema, records: List[Dict[str, Any]]) -> ValidationResult:
+    """
+    Validates and coerces a batch against a compiled schema. Rows that fail any column are
+    split off with their reasons; the rest are returned with coerced values. Fields that
+    are not in the schema pass through untouched. Empty and whitespace-only strings in
+    schema columns count as missing and are stored as null; rows that are not JSON
+    objects are rejected.
+    """
+    if not records:
+        return ValidationResult(valid_rows=[])
+
+    load_pandas()
+    is_object = np.fromiter((isinstance(record, dict) for record in records), dtype=bool, count=len(records))
+    rows = records if is_object.all() else [record if ok else {} for record, ok in zip(records, is_object)]
+    bad_rows = ~is_object
+    reasons: Dict[int, List[str]] = {int(position): ["row is not a JSON object"] for position in np.flatnonzero(bad_rows)}
+    # Per schema column: (mask of rows to overwrite, coerced values aligned to row positions)
+    coerced_columns: Dict[str, Tuple[np.ndarray, list]] = {}
+
+    for column in compiled.columns:
+        # Object dtype keeps the raw values: inferring a dtype would turn ints into floats
+        # (losing precision past 2**53) whenever another row leaves the field null.
+        # The default RangeIndex makes index labels row positions in `records`.
+        values = pd.Series([row.get(column.name) for row in rows], dtype=object)
+        present = values.notna().to_numpy().copy()
+        # Sparse CSV rows arrive as empty strings
+        blank = values.map(lambda v: isinstance(v, str) and not v.strip()).to_numpy(dtype=bool)
+        present &= ~blank
+
+        if column.required:
+            for position in np.flatnonzero(~present & is_object):
+                reasons.setdefault(int(position), []).append(f"'{column.name}' is required")
+            bad_rows |= ~present
+
+        if present.any() or blank.any():
+            # np.empty(dtype=object) is all None, which is what blank values are stored as
+            aligned = np.empty(len(rows), dtype=object)
+            if present.any():
+                coerced, bad = coerce_column(column.type, values[present])
+                bad_positions = coerced.index[bad.to_numpy()]
+                for position in bad_positions:
+                    reasons.setdefault(int(position), []).append(
+                        f"'{column.name}' is not a valid {column.type}: {values[position]!r}"
+                    )
+                bad_rows[bad_positions] = True
+                aligned[present] = coerced.to_numpy(dtype=object)
+            coerced_columns[column.name] = (present | blank, aligned.tolist())
+
+    valid_indexes = np.flatnonzero(~bad_rows).tolist()
+    valid_rows = []
+    for position in valid_indexes:
+        row = dict(records[position])
+        for name, (overwrite, coerced) in coerced_columns.items():
+            if overwrite[position]:
+                row[name] = coerced[position]
+        valid_rows.append(row)
+
+    rejections = [
+        RowRejection(index=position, reasons=reasons.get(position, []))
+        for position in np.flatnonzero(bad_rows)[:MAX_REPORTED_REJECTIONS]
+    ]
+    return ValidationResult(valid_rows=valid_rows, valid_indexes=valid_indexes,
+                            rejected_count=int(bad_rows.sum()), rejections=rejections)
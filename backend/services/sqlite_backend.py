@@ -0,0 +1,209 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.storage import (
+    StorageBackend, QueryFilter, QUERY_OPERATORS, ENDPOINT_CONFIG_COLLECTION, ROLLUP_COLLECTION,
+    rollup_doc_id, merge_rollup
+)
+
+# Local embedded storage for development, on-prem edge nodes and benchmarking.
+SQLITE_PATH = os.environ.get('SQLITE_PATH', os.path.join(os.getcwd(), 'citypulse.sqlite3'))
+SQLITE_BATCH_SIZE = int(os.environ.get('SQLITE_BATCH_SIZE', 5000))
+
+_TABLE_NAME_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_FIELD_NAME_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_.]*$')
+
+
+def utc_timestamp() -> str:
+    # Fixed-width ISO 8601 so lexical order in SQLite matches time order
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Stores each ingested table as (uuid, insert_timestamp, data JSON) rows in a SQLite
+    database in WAL mode, indexed on insert_timestamp. Readers use one connection per
+    thread; writers are serialized so bulk inserts never contend for the write lock.
+    """
+
+    name = 'sqlite'
+    max_batch_size = SQLITE_BATCH_SIZE
+    # SQLite has a single writer, so chunks are committed one after another
+    parallel_commits = False
+
+    def __init__(self, path: str = SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._tables = set()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            f'CREATE TABLE IF NOT EXISTS "{ENDPOINT_CONFIG_COLLECTION}" '
+            '(doc_id TEXT PRIMARY KEY, data TEXT NOT NULL, created_at TEXT NOT NULL)'
+        )
+        conn.execute(
+            f'CREATE TABLE IF NOT EXISTS "{ROLLUP_COLLECTION}" (doc_id TEXT PRIMARY KEY, granularity TEXT NOT NULL, '
+            'domain TEXT NOT NULL, bucket TEXT NOT NULL, data TEXT NOT NULL)'
+        )
+        conn.execute(
+            f'CREATE INDEX IF NOT EXISTS "{ROLLUP_COLLECTION}__bucket" ON "{ROLLUP_COLLECTION}" (granularity, domain, bucket)'
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _ensure_table(self, table_name: str) -> None:
+        if table_name in self._tables:
+            return
+        if not _TABLE_NAME_PATTERN.match(table_name):
+            raise ValueError(f"Invalid table name '{table_name}'.")
+        conn = self._conn()
+        conn.execute(
+            f'CREATE TABLE IF NOT EXISTS "{table_name}" '
+            '(uuid TEXT PRIMARY KEY, insert_timestamp TEXT NOT NULL, data TEXT NOT NULL)'
+        )
+        conn.execute(
+            f'CREATE INDEX IF NOT EXISTS "{table_name}__insert_timestamp" ON "{table_name}" (insert_timestamp, uuid)'
+        )
+        self._tables.add(table_name)
+
+    def get_config(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            f'SELECT data, created_at FROM "{ENDPOINT_CONFIG_COLLECTION}" WHERE doc_id = ?', (doc_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {**json.loads(row[0]), "created_at": row[1]}
+
+    def put_config(self, doc_id: str, config: Dict[str, Any]) -> None:
+        with self._write_lock:
+            self._conn().execute(
+                f'INSERT OR REPLACE INTO "{ENDPOINT_CONFIG_COLLECTION}" (doc_id, data, created_at) VALUES (?, ?, ?)',
+                (doc_id, json.dumps(config, default=str), utc_timestamp()),
+            )
+
+    def list_configs(self) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(f'SELECT data, created_at FROM "{ENDPOINT_CONFIG_COLLECTION}"').fetchall()
+        return [{**json.loads(data), "created_at": created_at} for data, created_at in rows]
+
+    def insert_rows(self, table_name: str, rows: List[Tuple[str, Dict[str, Any]]]) -> None:
+        self._ensure_table(table_name)
+        timestamp = utc_timestamp()
+        params = [(doc_id, timestamp, json.dumps(data, default=str)) for doc_id, data in rows]
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    f'INSERT OR REPLACE INTO "{table_name}" (uuid, insert_timestamp, data) VALUES (?, ?, ?)', params
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _column(self, field: str) -> str:
+        if field in ('uuid', 'insert_timestamp'):
+            return field
+        if not _FIELD_NAME_PATTERN.match(field):
+            raise ValueError(f"Invalid field name '{field}'.")
+        return f"json_extract(data, '$.{field}')"
+
+    def query(
+        self,
+        table_name: str,
+        filters: Optional[List[QueryFilter]] = None,
+        order_by: str = 'insert_timestamp',
+        descending: bool = True,
+        limit: int = 100,
+        start_after: Optional[Dict[str, Any]] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        self._ensure_table(table_name)
+        clauses, params = [], []
+        for field, op, value in filters or []:
+            if op not in QUERY_OPERATORS:
+                raise ValueError(f"Unsupported operator '{op}'.")
+            column = self._column(field)
+            if op == 'in':
+                values = list(value)
+                clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+            else:
+                clauses.append(f"{column} {'=' if op == '==' else op} ?")
+                params.append(value)
+
+        order_column = self._column(order_by)
+        if start_after:
+            # Keyset pagination on (order_by, uuid)
+            comparison = '<' if descending else '>'
+            clauses.append(f"({order_column}, uuid) {comparison} (?, ?)")
+            params.extend([start_after[order_by], start_after['uuid']])
+
+        direction = 'DESC' if descending else 'ASC'
+        sql = f'SELECT uuid, insert_timestamp, data FROM "{table_name}"'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += f' ORDER BY {order_column} {direction}, uuid {direction} LIMIT ?'
+        params.append(limit)
+
+        results = []
+        for doc_id, insert_timestamp, data in self._conn().execute(sql, params):
+            row = {**json.loads(data), "uuid": doc_id, "insert_timestamp": insert_timestamp}
+            if fields:
+                keep = set(fields) | {order_by, 'uuid'}
+                row = {key: value for key, value in row.items() if key in keep}
+            results.append(row)
+        return results
+
+    def merge_rollups(self, deltas: List[Dict[str, Any]]) -> None:
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for delta in deltas:
+                    doc_id = rollup_doc_id(delta)
+                    row = conn.execute(f'SELECT data FROM "{ROLLUP_COLLECTION}" WHERE doc_id = ?', (doc_id,)).fetchone()
+                    merged = merge_rollup(json.loads(row[0]) if row else None, delta)
+                    conn.execute(
+                        f'INSERT OR REPLACE INTO "{ROLLUP_COLLECTION}" (doc_id, granularity, domain, bucket, data) '
+                        'VALUES (?, ?, ?, ?, ?)',
+                        (doc_id, merged["granularity"], merged["domain"], merged["bucket"], json.dumps(merged))
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def get_rollups(
+        self,
+        granularity: str,
+        domain: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        sql = f'SELECT data FROM "{ROLLUP_COLLECTION}" WHERE granularity = ?'
+        params: List[Any] = [granularity]
+        if domain:
+            sql += ' AND domain = ?'
+            params.append(domain)
+        if since:
+            sql += ' AND bucket >= ?'
+            params.append(since)
+        if until:
+            sql += ' AND bucket <= ?'
+            params.append(until)
+        sql += ' ORDER BY bucket'
+        return [json.loads(data) for (data,) in self._conn().execute(sql, params)]
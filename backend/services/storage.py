@@ -0,0 +1,160 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# Storage interface used by the service layer. The backend is chosen with the
+# STORAGE_BACKEND environment variable: 'firestore' (default) or 'sqlite'.
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'firestore').lower()
+
+ENDPOINT_CONFIG_COLLECTION = '__endpoint_configs__'
+ROLLUP_COLLECTION = '__rollups__'
+
+# A filter is (field, operator, value); operators follow Firestore: ==, !=, <, <=, >, >=, in
+QueryFilter = Tuple[str, str, Any]
+QUERY_OPERATORS = ('==', '!=', '<', '<=', '>', '>=', 'in')
+
+
+class RollupMergeError(Exception):
+    """
+    Raised by merge_rollups when it fails after merging some deltas; `committed` is how
+    many of the leading deltas are already stored and must not be merged again.
+    """
+
+    def __init__(self, message: str, committed: int):
+        super().__init__(message)
+        self.committed = committed
+
+
+class StorageBackend:
+    """
+    Minimal contract for where endpoint configs and ingested rows live.
+    """
+
+    name = 'base'
+    # Largest number of rows insert_rows accepts in one call (one atomic commit)
+    max_batch_size = 500
+    # Whether several insert_rows calls may usefully run at once
+    parallel_commits = True
+
+    def get_config(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def put_config(self, doc_id: str, config: Dict[str, Any]) -> None:
+        """
+        Stores a config, stamping it with a 'created_at' timestamp.
+        """
+        raise NotImplementedError
+
+    def list_configs(self) -> List[Dict[str, Any]]:
+        """
+        Returns every stored endpoint config (used to find sources to poll).
+        """
+        raise NotImplementedError
+
+    def insert_rows(self, table_name: str, rows: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """
+        Writes (document id, data) pairs in one atomic commit, stamping each row
+        with an 'insert_timestamp'. Raises on failure.
+        """
+        raise NotImplementedError
+
+    def query(
+        self,
+        table_name: str,
+        filters: Optional[List[QueryFilter]] = None,
+        order_by: str = 'insert_timestamp',
+        descending: bool = True,
+        limit: int = 100,
+        start_after: Optional[Dict[str, Any]] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Returns up to `limit` rows ordered by `order_by` then 'uuid'. `start_after` holds the
+        order_by and 'uuid' values of the last row of the previous page.
+        """
+        raise NotImplementedError
+
+    def merge_rollups(self, deltas: List[Dict[str, Any]]) -> None:
+        """
+        Adds rollup deltas (see services/rollups.py) into the stored aggregate documents,
+        creating any that do not exist yet. Each delta's merge must be atomic. Backends that
+        do not merge the whole list in one commit raise RollupMergeError on a partial failure.
+        """
+        raise NotImplementedError
+
+    def get_rollups(
+        self,
+        granularity: str,
+        domain: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Returns stored rollup documents of one granularity ('hour' or 'day') ordered by
+        bucket, optionally for one domain and within [since, until] bucket labels.
+        """
+        raise NotImplementedError
+
+
+def rollup_doc_id(rollup: Dict[str, Any]) -> str:
+    key = f"{rollup['granularity']}|{rollup['domain']}|{rollup['table']}|{rollup['bucket']}"
+    # Firestore document IDs cannot contain '/'
+    return key.replace('/', '_')
+
+
+def merge_rollup(existing: Optional[Dict[str, Any]], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Combines two rollups of the same bucket: counts and sums add up, min and max widen.
+    """
+    if not existing:
+        return {**delta, "fields": {name: dict(stats) for name, stats in delta.get("fields", {}).items()}}
+    merged = {**existing, "count": existing.get("count", 0) + delta.get("count", 0)}
+    fields = {name: dict(stats) for name, stats in existing.get("fields", {}).items()}
+    for name, stats in delta.get("fields", {}).items():
+        current = fields.get(name)
+        if current is None:
+            fields[name] = dict(stats)
+            continue
+        current["count"] = current.get("count", 0) + stats["count"]
+        current["sum"] = current.get("sum", 0) + stats["sum"]
+        current["min"] = min(current["min"], stats["min"]) if current.get("min") is not None else stats["min"]
+        current["max"] = max(current["max"], stats["max"]) if current.get("max") is not None else stats["max"]
+    merged["fields"] = fields
+    return merged
+
+
+_backend: Optional[StorageBackend] = None
+_backend_lock = threading.Lock()
+
+def get_storage() -> StorageBackend:
+    """
+    Returns the configured storage backend, creating it on first use.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if STORAGE_BACKEND == 'sqlite':
+                from services.sqlite_backend import SQLiteBackend
+                _backend = SQLiteBackend()
+            elif STORAGE_BACKEND == 'firestore':
+                from services.firestore_backend import FirestoreBackend
+                _backend = FirestoreBackend()
+            else:
+                raise ValueError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}'; expected 'firestore' or 'sqlite'.")
+        return _backend
+
+def _reset_after_fork() -> None:
+    # Storage clients (gRPC channels, SQLite connections) are not fork-safe; each worker creates its own
+    global _backend, _backend_lock
+    _backend = None
+    _backend_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def set_storage(backend: Optional[StorageBackend]) -> None:
+    """
+    Replaces the process-wide backend, e.g. with a stand-in for benchmarks.
+    """
+    global _backend
+    with _backend_lock:
+        _backend = backend
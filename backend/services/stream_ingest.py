@@ -0,0 +1,258 @@
+import csv
+import gzip
+import io
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from pydantic import BaseModel
+
+from services.firebase_service import insert_data, DataInsertionResponse
+from services.transform_executor import run_transform, TransformError
+from services.idempotency import record_ids
+from services.schema_validator import CompiledSchema, RowRejection, validate_records, MAX_REPORTED_REJECTIONS
+
+# Streaming ingestion for large NDJSON/CSV bodies. Records are parsed incrementally from
+# the request stream and pushed through transform and insert in fixed-size chunks, so
+# peak memory is bounded by STREAM_INGEST_CHUNK_SIZE rather than by the upload size.
+STREAM_INGEST_CHUNK_SIZE = int(os.environ.get('STREAM_INGEST_CHUNK_SIZE', 500))
+STREAM_INGEST_PROGRESS_EVERY = int(os.environ.get('STREAM_INGEST_PROGRESS_EVERY', 100))
+MAX_REPORTED_PARSE_ERRORS = 20
+
+NDJSON_CONTENT_TYPES = {'application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/json-seq'}
+CSV_CONTENT_TYPES = {'text/csv', 'application/csv'}
+
+
+def stream_format(content_type: Optional[str]) -> Optional[str]:
+    """
+    Maps a request mimetype to 'ndjson' or 'csv', or None for a regular JSON body.
+    """
+    if content_type in NDJSON_CONTENT_TYPES:
+        return 'ndjson'
+    if content_type in CSV_CONTENT_TYPES:
+        return 'csv'
+    return None
+
+
+class _CountingReader(io.RawIOBase):
+    """Wraps the WSGI input stream and counts the (possibly compressed) bytes read."""
+
+    def __init__(self, source):
+        self._source = source
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._source.read(len(buffer))
+        if not data:
+            return 0
+        buffer[:len(data)] = data
+        self.bytes_read += len(data)
+        return len(data)
+
+
+class StreamIngestResult(BaseModel):
+    success: bool = True
+    message: str = ""
+    rows_read: int = 0
+    rows_added: int = 0
+    rows_dropped: int = 0  # Removed by the transformation script
+    rows_rejected: int = 0  # Failed schema validation
+    duplicates_skipped: int = 0  # Idempotent endpoints only
+    # Indexed by position in the stream, or in the script's output once a script ran; capped
+    rejected_rows: List[RowRejection] = []
+    chunks: int = 0
+    bytes_read: int = 0
+    rows_failed: int = 0  # Valid rows whose insert failed
+    failed_rows: List[List[int]] = []  # [start, end) positions in the stream of rows that were not inserted
+    failed_record_ids: List[str] = []  # Instead of failed_rows when a script ran on an idempotent endpoint
+    parse_errors: List[str] = []
+    parse_error_count: int = 0
+
+
+def _iter_ndjson(text: io.TextIOBase, result: StreamIngestResult) -> Iterator[Dict[str, Any]]:
+    for line_number, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            _parse_error(result, f"line {line_number}: {e.msg}")
+            continue
+        if isinstance(record, dict):
+            yield record
+        else:
+            _parse_error(result, f"line {line_number}: expected a JSON object")
+
+
+def _iter_csv(text: io.TextIOBase, result: StreamIngestResult) -> Iterator[Dict[str, Any]]:
+    reader = csv.DictReader(text)
+    for record in reader:
+        if None in record:
+            # More cells than header columns
+            _parse_error(result, f"line {reader.line_num}: too many fields")
+            continue
+        yield record
+
+
+def _parse_error(result: StreamIngestResult, message: str) -> None:
+    result.parse_error_count += 1
+    if len(result.parse_errors) < MAX_REPORTED_PARSE_ERRORS:
+        result.parse_errors.append(message)
+
+
+def failed_offsets(response: DataInsertionResponse, count: int) -> List[int]:
+    """
+    Offsets into an inserted batch of `count` records of those `response` reports as not inserted.
+    """
+    if response.success:
+        return []
+    if not response.chunks:
+        return list(range(count))
+    return [offset for chunk in response.failed_chunks for offset in range(chunk.start, chunk.end)]
+
+
+def row_ranges(positions: Iterable[int]) -> List[List[int]]:
+    """
+    Collapses ascending row positions into [start, end) ranges.
+    """
+    ranges: List[List[int]] = []
+    for position in positions:
+        if ranges and ranges[-1][1] == position:
+            ranges[-1][1] += 1
+        else:
+            ranges.append([position, position + 1])
+    return ranges
+
+
+def iter_chunks(records: Iterable[Dict[str, Any]], chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ingest_stream(
+    stream,
+    fmt: str,
+    table_name: str,
+    script: Optional[str] = None,
+    schema: Optional[CompiledSchema] = None,
+    gzipped: bool = False,
+    chunk_size: int = STREAM_INGEST_CHUNK_SIZE,
+    sink: Callable[..., DataInsertionResponse] = insert_data,
+    label: str = "",
+    key_fields: Optional[List[str]] = None,
+    domain: str = "",
+) -> StreamIngestResult:
+    """
+    Parses records from a binary stream and inserts them chunk by chunk (see ingest_records).
+    A broken stream stops the ingest, leaving earlier chunks committed.
+    """
+    result = StreamIngestResult()
+    counter = _CountingReader(stream)
+    binary = io.BufferedReader(counter, buffer_size=64 * 1024)
+    if gzipped:
+        binary = gzip.GzipFile(fileobj=binary, mode='rb')
+    text = io.TextIOWrapper(binary, encoding='utf-8', errors='replace', newline='' if fmt == 'csv' else None)
+    records = _iter_csv(text, result) if fmt == 'csv' else _iter_ndjson(text, result)
+    try:
+        return ingest_records(records, table_name, script=script, schema=schema, chunk_size=chunk_size,
+                              sink=sink, label=label, key_fields=key_fields, domain=domain, result=result)
+    finally:
+        result.bytes_read = counter.bytes_read
+
+
+def ingest_records(
+    records: Iterable[Dict[str, Any]],
+    table_name: str,
+    script: Optional[str] = None,
+    schema: Optional[CompiledSchema] = None,
+    chunk_size: int = STREAM_INGEST_CHUNK_SIZE,
+    sink: Callable[..., DataInsertionResponse] = insert_data,
+    label: str = "",
+    key_fields: Optional[List[str]] = None,
+    domain: str = "",
+    result: Optional[StreamIngestResult] = None,
+) -> StreamIngestResult:
+    """
+    Pushes records through the endpoint's transformation script, schema validation and
+    `sink` in chunks of `chunk_size`.
+    `key_fields` (see services/idempotency.py) makes the inserts idempotent; `domain` is passed on to the sink.
+    Chunk insert failures do not stop the ingest. They are recorded as ranges of stream
+    positions, or, once a script has reshaped the records, as the failed document IDs
+    when the endpoint is idempotent. A transformation error stops the ingest, leaving
+    earlier chunks committed.
+    """
+    result = result if result is not None else StreamIngestResult()
+    transformed_rows = 0  # Rows the script has output so far
+    try:
+        for chunk in iter_chunks(records, chunk_size):
+            start = result.rows_read
+            result.rows_read += len(chunk)
+            result.chunks += 1
+            # Stream position of each record in the chunk; unknown once a script has run,
+            # since it may drop, reorder or fan out records
+            positions: Optional[List[int]] = list(range(start, start + len(chunk)))
+            # Where rejection indexes into this chunk start: its stream position, or its
+            # position in the script's output, which is all that is known after a script
+            rejection_base = start
+
+            if script:
+                transformed = run_transform(script, chunk)
+                result.rows_dropped += max(0, len(chunk) - len(transformed))
+                chunk = transformed
+                positions = None
+                rejection_base = transformed_rows
+                transformed_rows += len(chunk)
+
+            if schema:
+                validation = validate_records(schema, chunk)
+                chunk = validation.valid_rows
+                if positions is not None:
+                    positions = [positions[index] for index in validation.valid_indexes]
+                result.rows_rejected += validation.rejected_count
+                room = MAX_REPORTED_REJECTIONS - len(result.rejected_rows)
+                result.rejected_rows.extend(
+                    rejection.model_copy(update={"index": rejection_base + rejection.index})
+                    for rejection in validation.rejections[:max(room, 0)]
+                )
+
+            doc_ids = record_ids(chunk, key_fields)
+            response = sink(table_name, chunk, doc_ids=doc_ids, domain=domain)
+            result.rows_added += response.rows_added
+            result.duplicates_skipped += response.duplicates_skipped
+            failed = failed_offsets(response, len(chunk))
+            result.rows_failed += len(failed)
+            if positions is not None:
+                result.failed_rows.extend(row_ranges(positions[offset] for offset in failed))
+            elif doc_ids is not None:
+                result.failed_record_ids.extend(doc_ids[offset] for offset in failed)
+
+            if STREAM_INGEST_PROGRESS_EVERY and result.chunks % STREAM_INGEST_PROGRESS_EVERY == 0:
+                print(f"Streaming ingest {label}: {result.rows_read} rows read, {result.rows_added} added")
+    except TransformError as e:
+        result.success = False
+        result.message = f"Transformation failed after {result.rows_read} rows: {e}"
+    except (OSError, EOFError) as e:
+        # Truncated or corrupt gzip member, or the client went away mid-upload
+        result.success = False
+        result.message = f"Stream ended unexpectedly after {result.rows_read} rows: {e}"
+    except csv.Error as e:
+        # e.g. a field larger than csv.field_size_limit(); the reader cannot resume after it
+        result.success = False
+        result.message = f"CSV parsing failed after {result.rows_read} rows: {e}"
+
+    if result.success and result.rows_failed:
+        result.success = False
+        result.message = f"Added {result.rows_added} of {result.rows_read} rows to '{table_name}'; some chunks failed."
+    elif result.success:
+        result.message = f"Successfully ingested {result.rows_added} records into '{table_name}'."
+    return result
@@ -0,0 +1,262 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from types import CodeType
+from typing import Any, Dict, List, Optional
+
+from services.cache import TTLCache, MISSING
+
+# Executes the `pythonScript` generated by generateTransformationScriptFlow.
+# Scripts are compiled once per content hash and run in a warm pool of worker
+# processes, so a slow or crashing script cannot stall a Flask worker; a timeout or
+# crash replaces only the worker that ran the script. Workers
+# are not a security sandbox; scripts are still trusted admin-reviewed code.
+TRANSFORM_EXECUTOR_MODE = os.environ.get('TRANSFORM_EXECUTOR_MODE', 'process')  # 'process' or 'inline'
+TRANSFORM_POOL_SIZE = int(os.environ.get('TRANSFORM_POOL_SIZE', max(1, min(4, os.cpu_count() or 1))))
+TRANSFORM_TIMEOUT = float(os.environ.get('TRANSFORM_TIMEOUT', 10.0))
+TRANSFORM_START_METHOD = os.environ.get('TRANSFORM_START_METHOD', 'spawn')
+TRANSFORM_CODE_CACHE_SIZE = int(os.environ.get('TRANSFORM_CODE_CACHE_SIZE', 256))
+
+
+class TransformError(Exception):
+    """Raised when a transformation script fails to compile or run."""
+
+
+class TransformTimeoutError(TransformError):
+    """Raised when a transformation script exceeds its per-call timeout."""
+
+
+def script_hash(script: str) -> str:
+    return hashlib.sha256(script.encode('utf-8')).hexdigest()
+
+
+# Code objects and script namespaces, keyed by script hash. Each worker process
+# keeps its own copy, so a script is compiled and exec'd at most once per process.
+_code_cache = TTLCache(maxsize=TRANSFORM_CODE_CACHE_SIZE, ttl=float('inf'))
+_namespace_cache = TTLCache(maxsize=TRANSFORM_CODE_CACHE_SIZE, ttl=float('inf'))
+
+
+def compile_script(script: str, digest: Optional[str] = None) -> CodeType:
+    """
+    Compiles a transformation script, reusing the cached code object for identical scripts.
+    """
+    digest = digest or script_hash(script)
+    code = _code_cache.get(digest)
+    if code is MISSING:
+        try:
+            code = compile(script, f"<transform:{digest[:12]}>", 'exec')
+        except SyntaxError as e:
+            raise TransformError(f"Transformation script does not compile: {e}")
+        _code_cache.set(digest, code)
+    return code
+
+
+def _load_namespace(script: str, digest: str) -> Dict[str, Any]:
+    namespace = _namespace_cache.get(digest)
+    if namespace is MISSING:
+        namespace = {'__name__': f"transform_{digest[:12]}"}
+        exec(compile_script(script, digest), namespace)
+        if not callable(namespace.get('transform')) and not callable(namespace.get('transform_batch')):
+            raise TransformError("Transformation script must define transform(data) or transform_batch(df).")
+        _namespace_cache.set(digest, namespace)
+    return namespace
+
+
+def _apply_transform(script: str, digest: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Runs a script over a batch of records. A vectorized transform_batch(df) is applied to the
+    whole batch as one pandas DataFrame; otherwise transform(data) is called per record.
+    A per-record transform may return None to drop the record or a list to fan out.
+    """
+    namespace = _load_namespace(script, digest)
+    transform_batch = namespace.get('transform_batch')
+    if callable(transform_batch):
+        import pandas as pd
+        result = transform_batch(pd.DataFrame.from_records(records))
+        if isinstance(result, pd.DataFrame):
+            # to_json normalises numpy scalars, NaN and timestamps into Firestore-friendly values
+            return json.loads(result.to_json(orient='records', date_format='iso'))
+        return list(result)
+
+    transform = namespace['transform']
+    transformed = []
+    for record in records:
+        result = transform(record)
+        if result is None:
+            continue
+        if isinstance(result, list):
+            transformed.extend(result)
+        else:
+            transformed.append(result)
+    return transformed
+
+
+def _run_in_worker(script: str, digest: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    try:
+        return _apply_transform(script, digest, records)
+    except TransformError:
+        raise
+    except Exception as e:
+        # Re-raise as a plain, picklable error carrying the script's message
+        raise TransformError(f"{type(e).__name__}: {e}")
+
+
+def _warm_worker() -> None:
+    # Pay the pandas import once per worker instead of on the first request it serves
+    try:
+        import pandas  # noqa: F401
+        import numpy  # noqa: F401
+    except ImportError:
+        pass
+
+
+class TransformExecutor:
+    """
+    A warm set of worker processes for transformation scripts with per-call timeouts.
+    Each worker is its own single-process executor, so a worker that hangs or dies is
+    replaced on its own while calls running on the other workers carry on.
+    """
+
+    def __init__(self, pool_size: int = TRANSFORM_POOL_SIZE, timeout: float = TRANSFORM_TIMEOUT,
+                 start_method: str = TRANSFORM_START_METHOD):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.start_method = start_method
+        self._workers: List[ProcessPoolExecutor] = []
+        self._idle: "queue.Queue[ProcessPoolExecutor]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.worker_restarts = 0
+
+    def _new_worker(self) -> ProcessPoolExecutor:
+        worker = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_warm_worker,
+        )
+        # Start the process now rather than on the first call
+        worker.submit(_warm_worker)
+        return worker
+
+    def _start(self) -> None:
+        with self._lock:
+            while len(self._workers) < self.pool_size:
+                worker = self._new_worker()
+                self._workers.append(worker)
+                self._idle.put(worker)
+
+    def _release(self, worker: ProcessPoolExecutor, healthy: bool) -> None:
+        if not healthy:
+            # ProcessPoolExecutor cannot cancel a running task, so the stuck process is terminated directly
+            for process in list((getattr(worker, '_processes', None) or {}).values()):
+                process.terminate()
+            worker.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            if worker not in self._workers:
+                return  # The executor was shut down while the call ran
+            if not healthy:
+                replacement = self._new_worker()
+                self._workers[self._workers.index(worker)] = replacement
+                self.worker_restarts += 1
+                worker = replacement
+            self._idle.put(worker)
+
+    def warm_up(self) -> None:
+        self._start()
+
+    def run(self, script: str, records: List[Dict[str, Any]], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        digest = script_hash(script)
+        # Surface syntax errors in the caller without a round trip to a worker
+        compile_script(script, digest)
+        with self._lock:
+            self.calls += 1
+        timeout = self.timeout if timeout is None else timeout
+
+        self._start()
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            with self._lock:
+                self.timeouts += 1
+            raise TransformTimeoutError(f"No transformation worker became free within {timeout}s.")
+        healthy = True
+        try:
+            future = worker.submit(_run_in_worker, script, digest, records)
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            healthy = False
+            raise TransformTimeoutError(f"Transformation script exceeded {timeout}s.")
+        except BrokenProcessPool:
+            with self._lock:
+                self.failures += 1
+            healthy = False
+            raise TransformError("Transformation worker crashed while running the script.")
+        except TransformError:
+            with self._lock:
+                self.failures += 1
+            raise
+        finally:
+            self._release(worker, healthy)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            workers, self._workers = self._workers, []
+            self._idle = queue.Queue()
+        for worker in workers:
+            worker.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = {
+                "calls": self.calls,
+                "timeouts": self.timeouts,
+                "failures": self.failures,
+                "worker_restarts": self.worker_restarts,
+            }
+        return {
+            "mode": "process",
+            "pool_size": self.pool_size,
+            "idle_workers": self._idle.qsize(),
+            "timeout_seconds": self.timeout,
+            **counters,
+            "code_cache": _code_cache.stats(),
+        }
+
+
+_executor: Optional[TransformExecutor] = None
+_executor_lock = threading.Lock()
+
+def get_transform_executor() -> TransformExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = TransformExecutor()
+        return _executor
+
+def _reset_after_fork() -> None:
+    # Worker processes belong to the parent; a forked child starts its own pool on first use
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def run_transform(script: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Applies an endpoint's transformation script to a batch of records.
+    Runs in the worker pool unless TRANSFORM_EXECUTOR_MODE is 'inline' (useful for local debugging).
+    """
+    if not records:
+        return records
+    if TRANSFORM_EXECUTOR_MODE == 'inline':
+        return _run_in_worker(script, script_hash(script), records)
+    return get_transform_executor().run(script, records)
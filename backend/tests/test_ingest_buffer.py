@@ -0,0 +1,50 @@
+import os
+import time
+
+from services.firebase_service import DataInsertionResponse
+from services.ingest_buffer import IngestBuffer
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_replay_skips_records_committed_before_a_crash(tmp_path):
+    inserted = []
+
+    def only_traffic(table_name, records, **options):
+        if table_name != 'traffic':
+            return DataInsertionResponse(success=False, message="Storage unavailable.")
+        inserted.extend(records)
+        return DataInsertionResponse(success=True, message="ok", rows_added=len(records))
+
+    crashed = IngestBuffer(spool_dir=str(tmp_path), insert_fn=only_traffic, max_latency=0.01, segment_bytes=64)
+    crashed.start()
+    crashed.submit('traffic', [{"speed": 1}, {"speed": 2}])
+    crashed.submit('air', [{"pm25": 1}])
+    crashed.submit('traffic', [{"speed": 3}])
+    assert wait_for(lambda: len(inserted) == 3)
+    # Simulate a crash: the flusher stops and the spool lock is dropped without a final flush
+    with crashed._cond:
+        crashed._stopping = True
+        crashed.insert_fn = lambda *args, **kwargs: DataInsertionResponse(success=False, message="crashed")
+    os.close(crashed._lock_fd)
+    crashed._lock_fd = None
+
+    def succeed(table_name, records, **options):
+        inserted.extend(records)
+        return DataInsertionResponse(success=True, message="ok", rows_added=len(records))
+
+    restarted = IngestBuffer(spool_dir=str(tmp_path), insert_fn=succeed, max_latency=0.01)
+    restarted.start()
+    try:
+        assert restarted.records_replayed == 1
+        assert wait_for(lambda: len(inserted) == 4)
+    finally:
+        restarted.stop()
+    assert sorted(inserted, key=str) == sorted(
+        [{"speed": 1}, {"speed": 2}, {"speed": 3}, {"pm25": 1}], key=str
+    )
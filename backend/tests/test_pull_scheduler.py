@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from benchmarks.fakes import FakeRestSource
+from services.pull_scheduler import PullScheduler
+from services.stream_ingest import StreamIngestResult
+
+
+class RecordingScheduler(PullScheduler):
+    """
+    Records the IDs it would ingest instead of running the ingest pipeline.
+    """
+
+    def __init__(self, ingested, **kwargs):
+        super().__init__(load_configs=lambda: [], **kwargs)
+        self.ingested = ingested
+
+    def _ingest(self, source, records):
+        self.ingested.extend(record["id"] for record in records)
+        return StreamIngestResult(success=True, message="ok", rows_added=len(records))
+
+
+@pytest.fixture
+def source():
+    source = FakeRestSource().start()
+    yield source
+    source.stop()
+
+
+def pull_config(url):
+    return {
+        "domain": "transit", "endpointId": "arrivals", "tableName": "arrivals", "ingestionType": "RestAPI",
+        "pull": {"url": url, "recordsPath": "items", "cursorField": "updated_at",
+                 "nextPagePath": "next", "nextPageParam": "page"},
+    }
+
+
+def test_workers_share_high_water_marks_and_keep_ties(source, tmp_path):
+    state_path = str(tmp_path / "pull_state.json")
+    ingested = []
+    scheduler = RecordingScheduler(ingested, state_path=state_path)
+    # A second worker created before the first poll, e.g. one serving a manual pull
+    other_worker = RecordingScheduler(ingested, state_path=state_path)
+    config = pull_config(source.url)
+
+    source.add({"id": 1, "updated_at": 1}, {"id": 2, "updated_at": 2}, {"id": 3, "updated_at": 2})
+    assert scheduler.poll_endpoint(config).outcome == 'ingested'
+    # A late record sharing the high-water value is new; the ones already at the mark are not
+    source.add({"id": 4, "updated_at": 2})
+    assert other_worker.poll_endpoint(config).outcome == 'ingested'
+    assert scheduler.poll_endpoint(config).outcome == 'not_modified'
+
+    assert ingested == [1, 2, 3, 4]
+    with open(state_path, encoding='utf-8') as state_file:
+        state = json.load(state_file)["transit:arrivals"]
+    assert state["high_water"] == 2 and len(state["high_water_ids"]) == 3
+    assert state["polls"] == 3
+    other_worker.stop()
+    scheduler.stop()
@@ -0,0 +1,37 @@
+from datetime import datetime, timezone
+
+from benchmarks.fakes import FakeFirestoreBackend
+from services import storage
+from services.rollups import RollupAccumulator
+from services.storage import RollupMergeError
+
+
+class FlakyRollupBackend(FakeFirestoreBackend):
+    """
+    Merges deltas one at a time, like Firestore, and fails once after the first one.
+    """
+
+    def __init__(self):
+        super().__init__(commit_latency=0, read_latency=0)
+        self.fail_next = True
+
+    def merge_rollups(self, deltas):
+        for committed, delta in enumerate(deltas):
+            if committed == 1 and self.fail_next:
+                self.fail_next = False
+                raise RollupMergeError("transaction aborted", committed)
+            super().merge_rollups([delta])
+
+
+def test_partial_flush_does_not_double_count():
+    backend = FlakyRollupBackend()
+    storage.set_storage(backend)
+    try:
+        accumulator = RollupAccumulator()
+        accumulator.record('transit', 'buses', [{}, {}, {}], moment=datetime(2026, 1, 1, tzinfo=timezone.utc))
+        assert accumulator.flush() is False
+        assert len(accumulator.pending()) == 1
+        assert accumulator.flush() is True
+        assert sorted(rollup["count"] for rollup in backend.rollups.values()) == [3, 3]
+    finally:
+        storage.set_storage(None)
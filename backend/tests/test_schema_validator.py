@@ -0,0 +1,34 @@
+from services.schema_validator import compile_schema, validate_records
+
+BIG_ID = 2 ** 53 + 1  # Not representable as float64
+
+SCHEMA = compile_schema({"id": "INTEGER", "flag": "BOOLEAN", "reading": "FLOAT"})
+
+
+def test_large_integer_survives_missing_values_in_batch():
+    result = validate_records(SCHEMA, [{"id": BIG_ID, "flag": True}, {"flag": False}])
+    assert result.rejections == []
+    assert result.valid_rows[0]["id"] == BIG_ID
+    assert type(result.valid_rows[0]["id"]) is int
+    assert "id" not in result.valid_rows[1]
+
+
+def test_integer_flag_is_boolean_next_to_null():
+    with_null = validate_records(SCHEMA, [{"id": BIG_ID, "flag": 1}, {"flag": None}])
+    without_null = validate_records(SCHEMA, [{"id": BIG_ID, "flag": 1}])
+    assert with_null.rejected_count == 0
+    assert with_null.valid_rows[0] == without_null.valid_rows[0] == {"id": BIG_ID, "flag": True}
+
+
+def test_integer_coercion_rejects_bad_values_only():
+    records = [{"id": BIG_ID}, {"id": "abc"}, {"id": " 12 "}, {"id": 3.0}, {"id": 3.5},
+               {"id": True}, {"id": 2 ** 63}, {"id": None}]
+    result = validate_records(SCHEMA, records)
+    assert [rejection.index for rejection in result.rejections] == [1, 4, 5, 6]
+    assert [row.get("id") for row in result.valid_rows] == [BIG_ID, 12, 3, None]
+
+
+def test_blank_strings_are_stored_as_null():
+    result = validate_records(SCHEMA, [{"id": " ", "reading": ""}, {"id": 1, "reading": "2.5"}])
+    assert result.rejected_count == 0
+    assert result.valid_rows == [{"id": None, "reading": None}, {"id": 1, "reading": 2.5}]
@@ -0,0 +1,32 @@
+import io
+
+from services import stream_ingest
+from services.firebase_service import DataInsertionResponse
+from services.schema_validator import compile_schema
+
+
+def accept_all(table_name, rows, **options):
+    return DataInsertionResponse(success=True, message="ok", rows_added=len(rows))
+
+
+def test_oversized_csv_field_ends_the_stream_with_counts():
+    body = "id,note\n1,ok\n2," + "x" * 200_000 + "\n3,ok\n"
+    result = stream_ingest.ingest_stream(io.BytesIO(body.encode()), 'csv', 'notes', sink=accept_all, chunk_size=1)
+    assert not result.success
+    assert result.message.startswith("CSV parsing failed after 1 rows")
+    assert (result.rows_read, result.rows_added) == (1, 1)
+
+
+def test_rejections_after_a_script_count_script_output(monkeypatch):
+    # Stands in for a script that drops records flagged "drop"
+    monkeypatch.setattr(stream_ingest, 'run_transform',
+                        lambda script, chunk: [record for record in chunk if not record.get("drop")])
+    records = [{"n": 1, "drop": True}, {"n": "bad"}, {"n": 2}, {"n": "worse"}]
+    schema = compile_schema({"n": "INTEGER"})
+
+    scripted = stream_ingest.ingest_records(records, 'counts', script="...", schema=schema,
+                                            chunk_size=2, sink=accept_all)
+    plain = stream_ingest.ingest_records(records, 'counts', schema=schema, chunk_size=2, sink=accept_all)
+
+    assert [rejection.index for rejection in scripted.rejected_rows] == [0, 2]
+    assert [rejection.index for rejection in plain.rejected_rows] == [1, 3]